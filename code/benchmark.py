@@ -0,0 +1,339 @@
+# benchmark.py
+#
+# Offline micro-benchmarks for the collectors' hot paths. Run from the repo root:
+#     python code/benchmark.py
+
+import sys
+import os
+import csv
+import time
+import tracemalloc
+import tempfile
+import threading
+import argparse
+import random
+
+# Add the project root directory to sys.path
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+import collect_tv_shows
+import collect_tv_mentions
+import collect_tv_comments
+import reddit_api
+import clean_data
+import storage
+from show_matcher import ShowMatcher
+from fake_apis import FakeApis
+from http_cache import HttpCache
+from omdb_scheduler import OmdbScheduler
+from rate_limiter import TokenBucket, AdaptiveLimiter
+from metrics import registry
+
+def synthetic_tv_show(i):
+    return {
+        'id': i,
+        'name': f'Show {i}',
+        'original_name': f'Show {i}',
+        'overview': 'A synthetic show used for benchmarking. ' * 5,
+        'first_air_date': '2020-01-01',
+        'last_air_date': '2024-06-30',
+        'number_of_episodes': 40,
+        'number_of_seasons': 4,
+        'genres': [{'id': 18, 'name': 'Drama'}, {'id': 80, 'name': 'Crime'}],
+        'origin_country': ['US'],
+        'original_language': 'en',
+        'popularity': 123.4,
+        'vote_average': 7.8,
+        'vote_count': 1024,
+        'status': 'Returning Series',
+        'type': 'Scripted',
+        'homepage': 'https://www.paramountplus.com/',
+        'in_production': True,
+        'languages': ['en'],
+        'episode_run_time': [42, 60],
+        'tagline': None,
+        'created_by': [{'name': 'Jane Doe'}],
+        'networks': [{'name': 'Paramount+'}],
+        'omdb_data': {
+            'imdbRating': '8.1',
+            'imdbVotes': '12,345',
+            'Ratings': [
+                {'Source': 'Internet Movie Database', 'Value': '8.1/10'},
+                {'Source': 'Rotten Tomatoes', 'Value': '87%'},
+            ],
+            'Metascore': '74',
+            'Plot': 'Things happen.',
+            'Awards': '2 wins',
+            'Actors': 'A, B, C',
+            'Writer': 'W',
+            'Language': 'English',
+            'Country': 'United States',
+            'BoxOffice': 'N/A',
+            'Production': 'N/A',
+        },
+    }
+
+def legacy_tv_show_to_row(item):
+    # The per-field if/elif chain save_to_csv used before the extractor table
+    row = {}
+    # Extract TMDb fields
+    for field in collect_tv_shows.CSV_FIELDS:
+        if field in [
+            'id', 'name', 'original_name', 'overview', 'first_air_date',
+            'last_air_date', 'number_of_episodes', 'number_of_seasons',
+            'original_language', 'popularity', 'vote_average', 'vote_count',
+            'status', 'type', 'homepage', 'in_production', 'tagline'
+        ]:
+            value = item.get(field, '')
+            if isinstance(value, bool):
+                value = str(value)
+            elif value is None:
+                value = ''
+            row[field] = value
+        elif field == 'genres':
+            value = ', '.join([genre['name'] for genre in item.get('genres', [])])
+            row[field] = value
+        elif field == 'origin_country':
+            value = ', '.join(item.get('origin_country', []))
+            row[field] = value
+        elif field == 'languages':
+            value = ', '.join(item.get('languages', []))
+            row[field] = value
+        elif field == 'episode_run_time':
+            value = ', '.join(map(str, item.get('episode_run_time', [])))
+            row[field] = value
+        elif field == 'created_by':
+            value = ', '.join([creator['name'] for creator in item.get('created_by', [])])
+            row[field] = value
+        elif field == 'networks':
+            value = ', '.join([network['name'] for network in item.get('networks', [])])
+            row[field] = value
+        # Extract OMDb fields
+        elif field in ['imdb_rating', 'imdb_votes', 'rotten_tomatoes_rating',
+                       'metacritic_rating', 'plot', 'awards', 'actors',
+                       'writer', 'language', 'country', 'box_office', 'production']:
+            omdb_data = item.get('omdb_data', {})
+            if field == 'imdb_rating':
+                row[field] = omdb_data.get('imdbRating', '')
+            elif field == 'imdb_votes':
+                row[field] = omdb_data.get('imdbVotes', '')
+            elif field == 'rotten_tomatoes_rating':
+                ratings = omdb_data.get('Ratings', [])
+                rt_rating = next((r['Value'] for r in ratings if r['Source'] == 'Rotten Tomatoes'), '')
+                row[field] = rt_rating
+            elif field == 'metacritic_rating':
+                row[field] = omdb_data.get('Metascore', '')
+            elif field == 'plot':
+                row[field] = omdb_data.get('Plot', '')
+            elif field == 'awards':
+                row[field] = omdb_data.get('Awards', '')
+            elif field == 'actors':
+                row[field] = omdb_data.get('Actors', '')
+            elif field == 'writer':
+                row[field] = omdb_data.get('Writer', '')
+            elif field == 'language':
+                row[field] = omdb_data.get('Language', '')
+            elif field == 'country':
+                row[field] = omdb_data.get('Country', '')
+            elif field == 'box_office':
+                row[field] = omdb_data.get('BoxOffice', '')
+            elif field == 'production':
+                row[field] = omdb_data.get('Production', '')
+    return row
+
+def legacy_save_to_csv(data, filename):
+    with open(filename, 'w', newline='', encoding='utf-8') as output_file:
+        dict_writer = csv.DictWriter(output_file, fieldnames=collect_tv_shows.CSV_FIELDS)
+        dict_writer.writeheader()
+        for item in data:
+            dict_writer.writerow(legacy_tv_show_to_row(item))
+
+def measure(label, write, rows, filename):
+    tracemalloc.start()
+    start = time.perf_counter()
+    write(filename)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<28} {rows / elapsed:>12,.0f} rows/sec   peak {peak / 1e6:8.2f} MB")
+
+def bench_save_to_csv(rows, output_dir):
+    print(f"save_to_csv: {rows:,} rows")
+    filename = os.path.join(output_dir, 'bench_tv_shows.csv')
+    # Before: the whole catalog in a list, written through the if/elif chain
+    measure('legacy (list + if/elif)',
+            lambda f: legacy_save_to_csv([synthetic_tv_show(i) for i in range(rows)], f),
+            rows, filename)
+    # After: rows streamed from a generator through the extractor table
+    measure('streaming (extractor table)',
+            lambda f: collect_tv_shows.save_to_csv((synthetic_tv_show(i) for i in range(rows)), f),
+            rows, filename)
+    os.remove(filename)
+
+def bench_clean_tv_shows(rows, output_dir):
+    filename = os.path.join(output_dir, 'bench_tv_shows.csv')
+    collect_tv_shows.save_to_csv((synthetic_tv_show(i) for i in range(rows)), filename)
+    raw = storage.read_table(filename)
+    start = time.perf_counter()
+    tables = clean_data.clean_tv_shows(raw)
+    elapsed = time.perf_counter() - start
+    raw_bytes = clean_data.frame_bytes({'raw': raw})
+    clean_bytes = clean_data.frame_bytes(tables)
+    print(f"clean_tv_shows: {elapsed / rows * 1e6:.2f} s per million rows; "
+          f"{raw_bytes / 1e6:.1f} MB -> {clean_bytes / 1e6:.1f} MB ({1 - clean_bytes / raw_bytes:.0%} saved)")
+    os.remove(filename)
+
+def synthetic_comment(rng, vocabulary, tv_show_names, words=40):
+    tokens = [rng.choice(vocabulary) for _ in range(words)]
+    if rng.random() < 0.2:
+        tokens.insert(rng.randrange(words), rng.choice(tv_show_names))
+    return ' '.join(tokens)
+
+def bench_show_matcher(comments, shows):
+    rng = random.Random(0)
+    tv_show_names = [f'Show Title {i}' for i in range(shows)] + ['Star Trek: Discovery', 'Tulsa King']
+    vocabulary = ('the a i this that show season episode watch watched love hate really think '
+                  'great plot character actor ending finale star trek king title').split()
+    texts = [synthetic_comment(rng, vocabulary, tv_show_names) for _ in range(comments)]
+
+    start = time.perf_counter()
+    matcher = ShowMatcher.from_tv_show_list(tv_show_names)
+    build_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    mentions = sum(len(matcher.find(text)) for text in texts)
+    elapsed = time.perf_counter() - start
+    print(f"show_matcher: {shows:,} shows compiled in {build_time * 1000:.1f} ms; "
+          f"{comments / elapsed * 60:,.0f} comments/min ({mentions:,} mentions)")
+
+def report_api_run(label, rows, elapsed, apis, requests_before, metrics_dir):
+    calls = sum(apis.requests.values()) - requests_before
+    print(f"{label:<30} {rows / elapsed:>10,.0f} rows/sec   {calls:,} API calls in {elapsed:.2f} s")
+    report = registry.to_json()
+    for entry in report['histograms']:
+        if entry['name'].endswith('request_duration_seconds') and entry['count']:
+            print(f"    {entry['labels'].get('endpoint'):<40} {entry['count']:>6} calls   "
+                  f"p50 {entry['p50'] * 1000:7.1f} ms   p95 {entry['p95'] * 1000:7.1f} ms")
+    peak_rss = f"{report['peak_rss_bytes'] / 1e6:.0f} MB" if report['peak_rss_bytes'] is not None else 'n/a'
+    print(f"    rate-limit wait {registry.counter_total('rate_limit_wait_seconds_total'):.2f} s, "
+          f"retries {registry.counter_total('retries_total'):.0f}, peak RSS {peak_rss}")
+    registry.export(f"benchmark_{label.split()[0]}", metrics_dir)
+
+def fake_reddit(base_url):
+    import praw
+    return praw.Reddit(client_id='benchmark', client_secret='benchmark', user_agent='benchmark',
+                       oauth_url=base_url, reddit_url=base_url)
+
+def bench_fetch_tv_shows(apis, cache_dir, metrics_dir, keep_limits=False):
+    saved = {name: getattr(collect_tv_shows, name) for name in (
+        'TMDB_API_URL', 'OMDB_API_URL', 'http_cache', 'omdb_scheduler', 'tmdb_limiter', 'omdb_limiter'
+    )}
+    # Fresh caches so every request reaches the stand-in
+    collect_tv_shows.TMDB_API_URL = apis.base_url + '/3'
+    collect_tv_shows.OMDB_API_URL = apis.base_url + '/omdb'
+    collect_tv_shows.http_cache = HttpCache(os.path.join(cache_dir, 'http_cache.sqlite'))
+    collect_tv_shows.omdb_scheduler = OmdbScheduler(os.path.join(cache_dir, 'omdb_ledger.sqlite'),
+                                                    collect_tv_shows.OMDB_DAILY_LIMIT)
+    if not keep_limits:
+        # Measure the client code and the server, not our own pacing
+        collect_tv_shows.tmdb_limiter = AdaptiveLimiter('TMDb', TokenBucket(10 ** 6, 1, name='TMDb'))
+        collect_tv_shows.omdb_limiter = AdaptiveLimiter('OMDb', TokenBucket(10 ** 6, 1, name='OMDb'))
+    try:
+        registry.reset()
+        requests_before = sum(apis.requests.values())
+        start = time.perf_counter()
+        tv_shows = collect_tv_shows.fetch_tv_shows()
+        elapsed = time.perf_counter() - start
+        report_api_run('fetch_tv_shows', len(tv_shows), elapsed, apis, requests_before, metrics_dir)
+    finally:
+        collect_tv_shows.http_cache.close()
+        collect_tv_shows.omdb_scheduler.close()
+        for name, value in saved.items():
+            setattr(collect_tv_shows, name, value)
+
+def fake_request_tracker():
+    # The production pacing: a fallback bucket until the server's rate-limit headers arrive
+    return {'count': 0, 'limiter': AdaptiveLimiter(
+        'reddit:benchmark', TokenBucket(reddit_api.REDDIT_REQUESTS_PER_MINUTE, 60, name='reddit:benchmark')
+    )}
+
+def bench_search_reddit(apis, searches, metrics_dir):
+    # One client per search thread, all drawing on one limiter as they share one OAuth client
+    limiter = fake_request_tracker()['limiter']
+    clients = threading.local()
+
+    def client_factory():
+        if not hasattr(clients, 'client'):
+            clients.client = fake_reddit(apis.base_url), {'count': 0, 'limiter': limiter}
+        return clients.client
+
+    # Show 1 is hot enough to fill its batch, which is then split and searched again
+    tv_show_names = [f'Show {index}' for index in range(1, searches + 1)]
+    registry.reset()
+    requests_before = sum(apis.requests.values())
+    start = time.perf_counter()
+    rows = len(collect_tv_mentions.search_reddit_for_tv_shows(
+        tv_show_names, collect_tv_mentions.SUBREDDITS, client_factory=client_factory
+    ))
+    elapsed = time.perf_counter() - start
+    report_api_run('search_reddit_for_tv_shows', rows, elapsed, apis, requests_before, metrics_dir)
+
+def bench_fetch_comments(apis, submissions, metrics_dir):
+    reddit = fake_reddit(apis.base_url)
+    request_tracker = fake_request_tracker()
+    registry.reset()
+    requests_before = sum(apis.requests.values())
+    start = time.perf_counter()
+    rows = 0
+    for index in range(submissions):
+        comments = collect_tv_comments.fetch_comments_for_submission(reddit, f'b{index}', request_tracker)
+        rows += len(comments or [])
+    elapsed = time.perf_counter() - start
+    report_api_run('fetch_comments_for_submission', rows, elapsed, apis, requests_before, metrics_dir)
+
+def bench_apis(args):
+    apis = FakeApis(shows=args.api_shows, comments_per_submission=args.api_comments, latency=args.latency,
+                    jitter=args.jitter, throttle_rate=args.throttle_rate, retry_after=args.retry_after)
+    apis.start()
+    print(f"fake APIs at {apis.base_url}: {args.latency * 1000:.0f} ms latency, "
+          f"{args.throttle_rate:.0%} of requests answered with 429")
+    metrics_dir = os.path.join(args.output_dir, 'metrics')
+    try:
+        with tempfile.TemporaryDirectory(dir=args.output_dir) as cache_dir:
+            bench_fetch_tv_shows(apis, cache_dir, metrics_dir, args.keep_limits)
+        bench_search_reddit(apis, args.api_searches, metrics_dir)
+        bench_fetch_comments(apis, args.api_submissions, metrics_dir)
+    finally:
+        apis.stop()
+    print(f"fake APIs served {sum(apis.requests.values()):,} requests, {apis.throttled:,} of them 429s")
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline micro-benchmarks for the collectors.')
+    parser.add_argument('--rows', type=int, default=50000)
+    parser.add_argument('--comments', type=int, default=200000)
+    parser.add_argument('--shows', type=int, default=2000)
+    parser.add_argument('--output-dir', default=os.path.join(project_root, 'logs'))
+    parser.add_argument('--suite', choices=['local', 'apis', 'all'], default='all',
+                        help='local: CSV, cleaning and matching; apis: collectors against fake API servers')
+    parser.add_argument('--api-shows', type=int, default=200, help='Shows served by the fake TMDb')
+    parser.add_argument('--api-searches', type=int, default=50, help='Shows searched on the fake Reddit')
+    parser.add_argument('--api-submissions', type=int, default=50)
+    parser.add_argument('--api-comments', type=int, default=200, help='Comments per fake submission')
+    parser.add_argument('--latency', type=float, default=0.02, help='Seconds each fake API call takes')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Extra random latency, up to this many seconds')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='Fraction of calls answered with 429')
+    parser.add_argument('--retry-after', type=float, default=0.1, help='Retry-After sent with injected 429s')
+    parser.add_argument('--keep-limits', action='store_true',
+                        help="Keep the TMDb/OMDb client-side rate limits in fetch_tv_shows")
+    args = parser.parse_args()
+    os.makedirs(args.output_dir, exist_ok=True)
+    if args.suite in ('local', 'all'):
+        bench_save_to_csv(args.rows, args.output_dir)
+        bench_clean_tv_shows(args.rows, args.output_dir)
+        bench_show_matcher(args.comments, args.shows)
+    if args.suite in ('apis', 'all'):
+        bench_apis(args)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,219 @@
+# clean_data.py
+#
+# Turns the collectors' raw tables into typed, compact DataFrames for analysis.
+# Results are cached by a hash of the input, so notebooks only pay for cleaning
+# once per collected file. Run from the repo root:
+#     python code/clean_data.py
+
+import sys
+import os
+import glob
+import time
+import hashlib
+import logging
+import argparse
+
+import numpy as np
+import pandas as pd
+
+# Add the project root directory to sys.path
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+import storage
+
+# Bump when a cleaner changes so stale cached results are not reused
+CLEAN_VERSION = 1
+
+CACHE_DIR = os.path.join(project_root, 'data', 'cache', 'clean')
+RAW_DIR = os.path.join(project_root, 'data', 'raw')
+
+# Currency signs, thousands separators and percent signs, as in "$1,234" or "87%"
+NUMBER_NOISE = r'[$,%]'
+
+TV_SHOW_NUMERIC = {
+    'id': 'integer', 'number_of_episodes': 'integer', 'number_of_seasons': 'integer',
+    'vote_count': 'integer', 'popularity': 'float', 'vote_average': 'float',
+    'imdb_rating': 'float', 'imdb_votes': 'integer', 'rotten_tomatoes_rating': 'float',
+    'metacritic_rating': 'integer', 'box_office': 'integer'
+}
+TV_SHOW_DATES = ['first_air_date', 'last_air_date']
+TV_SHOW_CATEGORIES = ['status', 'type', 'original_language']
+
+# Comma-joined columns, split out into one (id, value) table each
+TV_SHOW_MULTI_VALUED = [
+    'genres', 'origin_country', 'languages', 'episode_run_time', 'created_by',
+    'networks', 'actors', 'writer', 'language', 'country'
+]
+
+
+def parse_numbers(values):
+    # Columns repeat a few distinct strings ("N/A", "87%"), so each is parsed once
+    codes, uniques = pd.factorize(values)
+    parsed = pd.to_numeric(pd.Series(uniques, dtype=object).str.replace(NUMBER_NOISE, '', regex=True),
+                           errors='coerce').to_numpy(dtype='float64')
+    # Code -1 (missing) picks the trailing NaN
+    return pd.Series(np.append(parsed, np.nan)[codes], index=values.index)
+
+
+def to_number(values, kind):
+    """Parse a column of numbers written as text and store it in the smallest dtype."""
+    if not pd.api.types.is_numeric_dtype(values):
+        values = parse_numbers(values)
+    if kind == 'float':
+        return pd.to_numeric(values, downcast='float')
+    if not values.isna().any():
+        return pd.to_numeric(values, downcast='integer')
+    return values.astype('Int32' if values.abs().max() < 2 ** 31 else 'Int64')
+
+
+def to_bool(values):
+    return values.map({True: True, False: False, 'True': True, 'False': False}).astype('boolean')
+
+
+def explode_column(df, id_column, column, kind=None):
+    """Split a comma-joined column into a long (id, value) table."""
+    codes, uniques = pd.factorize(df[column].astype(object))
+    # Split each distinct joined string once, then join the parts back on its code
+    parts = pd.Series(uniques, dtype=object).astype(str).str.split(', ').explode()
+    parts = parts[(parts != '') & (parts != 'N/A')]
+    parts = pd.DataFrame({'code': parts.index, column: parts.to_numpy()})
+    rows = pd.DataFrame({id_column: df[id_column].to_numpy(), 'code': codes})
+    exploded = rows.merge(parts, on='code').drop(columns='code')
+    if kind:
+        exploded[column] = to_number(exploded[column], kind)
+        return exploded.dropna()
+    exploded[column] = exploded[column].astype('category')
+    return exploded
+
+
+def clean_tv_shows(df):
+    df = df.copy()
+    for column, kind in TV_SHOW_NUMERIC.items():
+        df[column] = to_number(df[column], kind)
+    for column in TV_SHOW_DATES:
+        df[column] = pd.to_datetime(df[column], format='%Y-%m-%d', errors='coerce')
+    for column in TV_SHOW_CATEGORIES:
+        df[column] = df[column].astype('category')
+    df['in_production'] = to_bool(df['in_production'])
+
+    tables = {}
+    for column in TV_SHOW_MULTI_VALUED:
+        kind = 'integer' if column == 'episode_run_time' else None
+        tables[f'tv_show_{column}'] = explode_column(df, 'id', column, kind)
+    tables['tv_shows'] = df.drop(columns=TV_SHOW_MULTI_VALUED)
+    return tables
+
+
+def clean_mentions(df):
+    df = df.copy()
+    df['created_utc'] = pd.to_datetime(df['created_utc'], format='%Y-%m-%d %H:%M:%S', errors='coerce')
+    for column in ('score', 'num_comments'):
+        df[column] = to_number(df[column], 'integer')
+    for column in ('subreddit', 'tv_show_name'):
+        df[column] = df[column].astype(str).astype('category')
+    return {'mentions': df}
+
+
+def clean_comments(df):
+    df = df.copy()
+    df['created_utc'] = pd.to_datetime(df['created_utc'], format='%Y-%m-%d %H:%M:%S', errors='coerce')
+    df['score'] = to_number(df['score'], 'integer')
+    df['is_submitter'] = to_bool(df['is_submitter'])
+    # Thousands of comments share each submission and many share an author
+    for column in ('submission_id', 'author'):
+        df[column] = df[column].astype(str).astype('category')
+    return {'comments': df}
+
+
+CLEANERS = {
+    'tv_shows': (os.path.join(RAW_DIR, 'paramount_plus_tv_shows.csv'), clean_tv_shows),
+    'mentions': (os.path.join(RAW_DIR, 'reddit_tv_show_mentions.csv'), clean_mentions),
+    'comments': (os.path.join(RAW_DIR, 'reddit_comments.csv'), clean_comments),
+}
+
+
+def hash_input(path):
+    """SHA-256 of a table's bytes; Parquet directories hash every file in order."""
+    digest = hashlib.sha256()
+    files = [path] if os.path.isfile(path) else sorted(glob.glob(os.path.join(path, '**', '*'), recursive=True))
+    for file_path in files:
+        if not os.path.isfile(file_path):
+            continue
+        digest.update(os.path.relpath(file_path, path).encode('utf-8'))
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(2 ** 20), b''):
+                digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+def cache_path(name, digest):
+    return os.path.join(CACHE_DIR, f'{name}-v{CLEAN_VERSION}-{digest}.pkl')
+
+
+def frame_bytes(tables):
+    return sum(int(df.memory_usage(deep=True).sum()) for df in tables.values())
+
+
+def load_clean(name, path=None, force=False):
+    """Return ({table name: DataFrame}, stats) for one raw dataset, cleaning it if needed."""
+    default_path, clean = CLEANERS[name]
+    path = storage.find_dataset(path or default_path)
+    digest = hash_input(path)
+    cached = cache_path(name, digest)
+    if not force and os.path.exists(cached):
+        start = time.perf_counter()
+        tables = pd.read_pickle(cached)
+        stats = {'rows': len(tables[name]), 'clean_bytes': frame_bytes(tables),
+                 'seconds': time.perf_counter() - start, 'cached': True}
+        logging.info(f"Loaded cleaned {name} from {cached}")
+        return tables, stats
+
+    raw = storage.read_table(path)
+    start = time.perf_counter()
+    tables = clean(raw)
+    elapsed = time.perf_counter() - start
+    stats = {
+        'rows': len(raw), 'raw_bytes': frame_bytes({name: raw}), 'clean_bytes': frame_bytes(tables),
+        'seconds': elapsed, 'cached': False
+    }
+
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    for stale in glob.glob(os.path.join(CACHE_DIR, f'{name}-v*.pkl')):
+        os.remove(stale)
+    pd.to_pickle(tables, cached)
+    logging.info(f"Cleaned {name} from {path} into {cached}")
+    return tables, stats
+
+
+def format_stats(name, stats):
+    line = f"{name}: {stats['rows']:,} rows, {stats['clean_bytes'] / 1e6:.2f} MB"
+    if stats['cached']:
+        return line + f" (cached, loaded in {stats['seconds']:.2f} s)"
+    saved = 1 - stats['clean_bytes'] / stats['raw_bytes'] if stats['raw_bytes'] else 0
+    per_million = stats['seconds'] / stats['rows'] * 1e6 if stats['rows'] else 0
+    return (line + f" from {stats['raw_bytes'] / 1e6:.2f} MB raw ({saved:.0%} saved), "
+            f"{per_million:.2f} s per million rows")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Clean and type the collected datasets.')
+    parser.add_argument('datasets', nargs='*', metavar='DATASET',
+                        help=f"Any of {', '.join(CLEANERS)} (default: all)")
+    parser.add_argument('--force', action='store_true', help='Ignore cached results')
+    args = parser.parse_args()
+    unknown = set(args.datasets) - set(CLEANERS)
+    if unknown:
+        parser.error(f"unknown datasets: {', '.join(sorted(unknown))}")
+
+    for name in args.datasets or CLEANERS:
+        default_path, _ = CLEANERS[name]
+        if not os.path.exists(storage.find_dataset(default_path)):
+            print(f"{name}: no raw data at {default_path}")
+            continue
+        _, stats = load_clean(name, force=args.force)
+        print(format_stats(name, stats))
+
+
+if __name__ == '__main__':
+    main()
@@ -2,19 +2,29 @@
 
 import sys
 import os
-import praw
-import prawcore
+from praw.models import MoreComments
 import pandas as pd
 import csv
 import time
-import random
 import logging
+import argparse
+import queue
+import multiprocessing
+import heapq
+import itertools
+from itertools import islice
+from datetime import datetime, timezone
 
 # Add the project root directory to sys.path
 project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 sys.path.insert(0, project_root)
 
 import config  # Now this should work
+from comment_store import CommentStore, COMMENT_FIELDS
+from reddit_api import RedditCallError, reddit_credentials, reddit_client, call_reddit
+from rollups import ShowRollups
+from metrics import registry
+import storage
 
 # Ensure the logs directory exists
 logs_dir = os.path.join(project_root, 'logs')
@@ -28,88 +38,344 @@ logging.basicConfig(
     level=logging.INFO
 )
 
+# Per-process Reddit client and request tracker, set up by init_worker
+worker_state = {}
+
+# API calls allowed per submission for expanding MoreComments stubs (None = all)
+MORE_COMMENTS_BUDGET = None
+
+# Comments are committed to the store in chunks of this size while a thread streams in
+COMMIT_CHUNK_SIZE = 500
+
+# Submissions looked up per /api/info call when polling comment counts
+INFO_BATCH_SIZE = 100
+
+# Submissions younger than this are re-crawled on refresh even if their count looks unchanged
+ACTIVITY_WINDOW_DAYS = 7
+
+# Parquet export of the store, one directory per month of comments
+COMMENT_DATASET = storage.Dataset(
+    COMMENT_FIELDS,
+    types={'created_utc': 'timestamp', 'score': 'int', 'is_submitter': 'bool'},
+    partition_by=['month'],
+    sort_by='submission_id'
+)
+
+# Rows are read in chunks of this size when importing an existing CSV
+IMPORT_CHUNK_SIZE = 100000
+
+def store_path(comments_csv):
+    return os.path.splitext(comments_csv)[0] + '.sqlite'
+
+def format_comment_row(comment):
+    row = dict(comment)
+    # Same format pd.to_datetime(unit='s') produced for earlier rows
+    created = datetime.fromtimestamp(row['created_utc'], tz=timezone.utc)
+    row['created_utc'] = created.strftime('%Y-%m-%d %H:%M:%S')
+    row['is_submitter'] = str(row['is_submitter'])
+    return row
+
+def import_comments_csv(store, comments_csv):
+    """One-off migration of a comments CSV written before the store existed."""
+    imported = 0
+    for chunk in pd.read_csv(comments_csv, dtype=str, keep_default_na=False, chunksize=IMPORT_CHUNK_SIZE):
+        store.import_rows(chunk.to_dict('records'))
+        imported += len(chunk)
+    store.finish_import(os.path.getsize(comments_csv))
+    logging.info(f"Imported {imported} rows from {comments_csv} into {store_path(comments_csv)}")
+    if imported != store.count_comments():
+        # The CSV had duplicate comment_ids; rewrite it from the deduplicated store
+        logging.info(f"Dropped {imported - store.count_comments()} duplicate comment rows")
+        export_comments_csv(store, comments_csv)
+
+def export_comments_csv(store, comments_csv):
+    """Rewrite the CSV from the store, so rows updated in place show their latest values."""
+    tmp_csv = comments_csv + '.tmp'
+    with open(tmp_csv, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=COMMENT_FIELDS)
+        writer.writeheader()
+        writer.writerows(store.iter_comments())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_csv, comments_csv)
+    store.finish_export(os.path.getsize(comments_csv))
+    logging.info(f"Exported {store.count_comments()} comments to {comments_csv}")
+
+def export_if_requested(store, comments_csv, requested):
+    """Rewrite the CSV on request, and only if stored rows changed since the last export."""
+    updated = store.updated_since_export()
+    if not updated:
+        return
+    if requested:
+        export_comments_csv(store, comments_csv)
+    else:
+        logging.info(f"{updated} stored comments are newer than their CSV rows; --export-csv rewrites the CSV")
+
+def open_comment_store(comments_csv):
+    """Open the store and cut off CSV rows written after its last committed submission."""
+    store = CommentStore(store_path(comments_csv))
+    if not os.path.exists(comments_csv):
+        return store
+    if store.is_empty() and store.get_meta('csv_offset') is None:
+        import_comments_csv(store, comments_csv)
+    size = os.path.getsize(comments_csv)
+    offset = store.csv_offset()
+    if size > offset:
+        logging.warning(f"Truncating {size - offset} bytes of partial writes from {comments_csv}")
+        with open(comments_csv, 'r+b') as f:
+            f.truncate(offset)
+    return store
+
+def append_comments(comments_csv, rows):
+    """Append rows and fsync them; returns the new end-of-file offset."""
+    with registry.timer('write_duration_seconds', table='reddit_comments'):
+        with open(comments_csv, 'a', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=COMMENT_FIELDS)
+            if f.tell() == 0:
+                writer.writeheader()
+            writer.writerows(rows)
+            f.flush()
+            os.fsync(f.fileno())
+            offset = f.tell()
+    registry.count('rows_written_total', len(rows), table='reddit_comments')
+    return offset
+
+def dedupe_new_rows(store, comments):
+    rows = {}
+    for comment in comments:
+        row = format_comment_row(comment)
+        rows[row['comment_id']] = row  # a retried fetch may repeat comments
+    rows = list(rows.values())
+    new_ids = store.new_comment_ids(row['comment_id'] for row in rows)
+    new_rows = [row for row in rows if row['comment_id'] in new_ids]
+    return rows, new_rows
+
+def append_new_rows(comments_csv, new_rows):
+    if new_rows:
+        return append_comments(comments_csv, new_rows)
+    return os.path.getsize(comments_csv) if os.path.exists(comments_csv) else 0
+
+def record_comment_batch(store, comments_csv, comments, mark_submissions=True, rollups=None):
+    """Commit comments from any mix of submissions; returns (new_rows, updated_rows).
+
+    Only comment_ids the store has never seen are appended to the CSV. The store
+    upsert and the new CSV length are committed in one transaction, so a crash
+    anywhere in between is undone by open_comment_store on the next run. The
+    committed rows then feed the per-show rollups, if given.
+    """
+    rows, new_rows = dedupe_new_rows(store, comments)
+    if not rows:
+        return 0, 0
+    offset = append_new_rows(comments_csv, new_rows)
+    updated = store.commit_rows(rows, offset, len(new_rows), mark_submissions)
+    if rollups is not None:
+        rollups.add_comments(rows)
+    return len(new_rows), updated
+
+def record_submission(store, comments_csv, submission_id, comments, num_comments=None, rollups=None,
+                      stats=None, baseline=None):
+    """Commit a submission's comments chunk by chunk as they arrive, then mark it fetched.
+
+    If `comments` is a generator that fails part-way, the chunks already written
+    stay in the store but the submission is not marked, so it is retried later
+    and the upsert absorbs the overlap. The same goes for a thread the
+    MoreComments budget cut short, as reported in `stats` once the comments are
+    consumed; its unexpanded stubs are saved so the next crawl continues from
+    them. A refresh passes the stored `baseline` count, which only advances by
+    the new comments it actually saw, so the ones it missed are looked for again.
+    Returns (new_rows, updated_rows, comment_count).
+    """
+    total_new, total_updated, comment_count = 0, 0, 0
+    comments = iter(comments)
+    while True:
+        chunk = list(islice(comments, COMMIT_CHUNK_SIZE))
+        if not chunk:
+            break
+        new_count, updated_count = record_comment_batch(store, comments_csv, chunk, mark_submissions=False,
+                                                          rollups=rollups)
+        total_new += new_count
+        total_updated += updated_count
+        comment_count += len(chunk)
+    stats = stats or {}
+    if stats.get('truncated'):
+        store.save_unexpanded(submission_id, stats['unexpanded'])
+        logging.info(f"Left submission ID {submission_id} unmarked with {len(stats['unexpanded'])} stubs "
+                     f"({stats['skipped']} comments) past the budget for the next crawl")
+    else:
+        if baseline is not None:
+            num_comments = min(num_comments, baseline + stats.get('new_seen', 0))
+        store.mark_submission_fetched(submission_id, num_comments)
+    return total_new, total_updated, comment_count
+
+def read_submission_authors(submissions_csv):
+    df_submissions = storage.read_table(submissions_csv, columns=['id', 'author', 'subreddit'])
+    df_submissions = df_submissions.astype(str).drop_duplicates('id')
+    return dict(zip(df_submissions['id'], df_submissions['author'])), df_submissions['subreddit'].unique().tolist()
+
+def ingest_comment_dumps_into_store(store, comments_csv, submissions_csv, dump_paths, workers=None, rollups=None):
+    # Imported here so API-only runs don't need zstandard
+    from reddit_dumps import ingest_comment_dumps
+    submission_authors, subreddits = read_submission_authors(submissions_csv)
+    total_new_comments = 0
+    total_updated_comments = 0
+    for rows in ingest_comment_dumps(dump_paths, subreddits, submission_authors, workers):
+        # Monthly dumps only hold part of a thread, so the submissions are left
+        # for the live crawl to complete; its upserts absorb the overlap
+        new_count, updated_count = record_comment_batch(store, comments_csv, rows, mark_submissions=False,
+                                                        rollups=rollups)
+        total_new_comments += new_count
+        total_updated_comments += updated_count
+    return total_new_comments, total_updated_comments
+
 def read_submission_ids(submissions_csv):
-    df_submissions = pd.read_csv(submissions_csv)
+    df_submissions = storage.read_table(submissions_csv, columns=['id'])
     submission_ids = df_submissions['id'].unique().tolist()
     return submission_ids
 
-def read_existing_comments(comments_csv):
-    if os.path.exists(comments_csv):
-        df_comments = pd.read_csv(comments_csv)
-        fetched_submission_ids = df_comments['submission_id'].unique().tolist()
-    else:
-        df_comments = pd.DataFrame()
-        fetched_submission_ids = []
-    return df_comments, fetched_submission_ids
+def read_existing_comments(store):
+    # Reads the submission index rather than the comments themselves
+    fetched_submission_ids = list(store.completed_submissions())
+    return fetched_submission_ids
 
 def identify_missing_submissions(all_submission_ids, fetched_submission_ids):
     missing_submission_ids = list(set(all_submission_ids) - set(fetched_submission_ids))
     return missing_submission_ids
 
-def wait_if_needed(request_tracker):
-    current_time = time.time()
-    elapsed_time = current_time - request_tracker['start_time']
-
-    # Reset the tracker every 60 seconds
-    if elapsed_time > 60:
-        request_tracker['count'] = 0
-        request_tracker['start_time'] = current_time
-        logging.info("Request tracker reset.")
-    elif request_tracker['count'] >= request_tracker['threshold']:
-        wait_time = 60 - elapsed_time + random.uniform(5, 10)  # Adding random buffer
-        logging.info(f"Approaching rate limit. Waiting for {wait_time:.2f} seconds...")
-        time.sleep(wait_time)
-        request_tracker['count'] = 0
-        request_tracker['start_time'] = time.time()
-
-def exponential_backoff(retries):
-    max_sleep = min(600, (2 ** retries) + random.uniform(0, 1))
-    logging.warning(f"Waiting for {max_sleep:.2f} seconds before retrying...")
-    time.sleep(max_sleep)
-
-def fetch_comments_for_submission(reddit, submission_id, request_tracker):
-    comments_data = []
-    retries = 0
-    max_retries = 5
-    while retries < max_retries:
-        try:
-            # Rate limit handling
-            wait_if_needed(request_tracker)
-
-            submission = reddit.submission(id=submission_id)
-            request_tracker['count'] += 1
-
-            # Fetch all comments (including 'more comments')
-            submission.comments.replace_more(limit=None)
-            request_tracker['count'] += 1  # Account for the replace_more call
-
-            for comment in submission.comments.list():
-                comment_data = process_comment(comment, submission_id)
-                comments_data.append(comment_data)
-
-            logging.info(f"Successfully fetched comments for submission ID {submission_id}")
-            break  # Exit the retry loop if successful
-        except prawcore.exceptions.TooManyRequests as e:
-            logging.error(f"Received 429 Too Many Requests for submission ID {submission_id}: {e}")
-            retry_after = int(e.response.headers.get('retry-after', 60))
-            logging.info(f"Retrying after {retry_after} seconds...")
-            time.sleep(retry_after)
-            # Reset the request tracker
-            request_tracker['count'] = 0
-            request_tracker['start_time'] = time.time()
-            retries += 1
-        except Exception as e:
-            logging.error(f"Error fetching comments for submission ID {submission_id}: {e}")
-            retries += 1
-            exponential_backoff(retries)
+# call_reddit gave up on one of the submission's calls
+CommentFetchError = RedditCallError
+
+def log_failed_submission(submission_id):
+    failed_submissions_file = os.path.join(logs_dir, 'failed_submissions.csv')
+    with open(failed_submissions_file, 'a', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow([submission_id, "Max retries exceeded"])
+    logging.error(f"Max retries exceeded for submission ID {submission_id}")
+
+def iter_comment_tree(items, walk):
+    # Depth-first walk; MoreComments stubs are queued instead of expanded. A full
+    # crawl expands the largest stubs first; a refresh (sort=new) keeps page order.
+    stack = list(reversed(list(items)))
+    while stack:
+        item = stack.pop()
+        if isinstance(item, MoreComments):
+            item.submission = walk['submission']
+            priority = 0 if walk['refresh'] else -(item.count or 0)
+            heapq.heappush(walk['more_heap'], (priority, next(walk['order']), item))
+            continue
+        if item.id in walk['seen']:
+            continue
+        walk['seen'].add(item.id)
+        yield item
+        stack.extend(reversed(list(item.replies)))
+
+def stub_state(more):
+    # What a later run needs to expand the stub without the rest of the tree
+    return {'id': more.id, 'parent_id': more.parent_id, 'count': more.count, 'children': list(more.children)}
+
+def stub_from_state(reddit, submission, state):
+    more = MoreComments(reddit, dict(state))
+    more.submission = submission
+    return more
+
+def walk_submission_comments(reddit, submission_id, request_tracker, budget, since, expected_new, stats,
+                             resume=None):
+    label = f"submission ID {submission_id}"
+    submission = reddit.submission(id=submission_id)
+    if since is not None:
+        # Newest first, so the part of the tree added since the last crawl comes early
+        submission.comment_sort = 'new'
+    walk = {
+        'submission': submission, 'refresh': since is not None,
+        'more_heap': [], 'seen': set(), 'order': itertools.count()
+    }
+    new_seen = 0
+
+    if resume:
+        # A budget-capped crawl stored the rest of the tree up to these stubs
+        items = [stub_from_state(reddit, submission, state) for state in resume]
+        calls = 0
     else:
-        # If maximum retries reached, log the submission ID
-        failed_submissions_file = os.path.join(logs_dir, 'failed_submissions.csv')
-        with open(failed_submissions_file, 'a', newline='', encoding='utf-8') as f:
-            writer = csv.writer(f)
-            writer.writerow([submission_id, "Max retries exceeded"])
-        logging.error(f"Max retries exceeded for submission ID {submission_id}")
-    return comments_data
+        # Accessing .comments triggers the fetch of the submission and first comment page
+        items = call_reddit(reddit, request_tracker, label, lambda: list(submission.comments))
+        calls = 1
+    expansions = 0
+    truncated = False
+    while True:
+        new_in_call = 0
+        for comment in iter_comment_tree(items, walk):
+            if since is not None and comment.created_utc > since:
+                new_in_call += 1
+            yield process_comment(comment, submission_id)
+        new_seen += new_in_call
+        if not walk['more_heap']:
+            break
+        if budget is not None and expansions >= budget:
+            truncated = True
+            break
+        if since is not None and (not new_in_call or (expected_new is not None and new_seen >= expected_new)):
+            # Everything past here was already crawled
+            break
+        more = heapq.heappop(walk['more_heap'])[2]
+        items = call_reddit(reddit, request_tracker, label, lambda: more.comments(update=False),
+                            endpoint='morechildren')
+        expansions += 1
+
+    # Stubs a refresh stops short of were crawled before; only the budget leaves
+    # comments behind, including "continue this thread" stubs that count 0
+    stats['truncated'] = truncated
+    stats['unexpanded'] = [stub_state(entry[2]) for entry in walk['more_heap']] if truncated else []
+    skipped = sum(state['count'] or 0 for state in stats['unexpanded'])
+    stats['skipped'] = skipped
+    stats['new_seen'] = new_seen
+    logging.info(f"Fetched comments for {label} with {calls + expansions} API calls"
+                 + (f"; {new_seen} new since the last crawl" if since is not None else "")
+                 + (f"; {len(stats['unexpanded'])} stubs ({skipped} comments) left unexpanded" if truncated else ""))
+
+def iter_comments_for_submission(reddit, submission_id, request_tracker, budget=MORE_COMMENTS_BUDGET,
+                                 since=None, expected_new=None, stats=None, resume=None):
+    """Yield a submission's comments as they are fetched.
+
+    The initial page comes first. MoreComments stubs are then expanded largest
+    first, one counted API call each, until `budget` calls are spent; once the
+    walk ends, `stats['truncated']` says whether the budget cut it short and
+    `stats['unexpanded']` holds the stubs left behind. Given those stubs as
+    `resume`, a crawl skips the initial page and expands them instead. Given a
+    high-water mark `since` (epoch seconds), comments are fetched newest first
+    and expansion stops at the first call that turns up nothing newer, or once
+    `expected_new` new comments were seen. Raises CommentFetchError once a call
+    exhausts its retries.
+    """
+    try:
+        yield from walk_submission_comments(reddit, submission_id, request_tracker, budget, since, expected_new,
+                                            {} if stats is None else stats, resume)
+    except CommentFetchError:
+        log_failed_submission(submission_id)
+        raise
+
+def fetch_comments_for_submission(reddit, submission_id, request_tracker, budget=MORE_COMMENTS_BUDGET,
+                                  since=None, expected_new=None, stats=None, resume=None):
+    try:
+        return list(iter_comments_for_submission(
+            reddit, submission_id, request_tracker, budget, since, expected_new, stats, resume
+        ))
+    except CommentFetchError:
+        return None
+
+def poll_submissions(reddit, request_tracker, submission_ids):
+    """Return {submission_id: (num_comments, created_utc)}, 100 submissions per API call."""
+    polled = {}
+    for start in range(0, len(submission_ids), INFO_BATCH_SIZE):
+        batch = submission_ids[start:start + INFO_BATCH_SIZE]
+        fullnames = [f"t3_{submission_id}" for submission_id in batch]
+        try:
+            submissions = call_reddit(reddit, request_tracker, f"info for {len(batch)} submissions",
+                                      lambda: list(reddit.info(fullnames=fullnames)), endpoint='info')
+        except CommentFetchError:
+            # Not refreshed this run; they are polled again next time
+            continue
+        for submission in submissions:
+            polled[submission.id] = (submission.num_comments, submission.created_utc)
+    return polled
 
 def process_comment(comment, submission_id):
     return {
@@ -123,22 +389,90 @@ def process_comment(comment, submission_id):
         'is_submitter': comment.is_submitter
     }
 
-def main():
-    # Paths to your CSV files
-    submissions_csv = os.path.join(project_root, 'data', 'raw', 'reddit_tv_show_mentions.csv')
-    comments_csv = os.path.join(project_root, 'data', 'raw', 'reddit_comments.csv')
-    os.makedirs(os.path.dirname(comments_csv), exist_ok=True)
+def init_worker(credential_queue, budget=MORE_COMMENTS_BUDGET):
+    # Put the credential straight back: a worker the pool respawns after a
+    # crash takes the next one in turn instead of waiting on an empty queue
+    credential = credential_queue.get()
+    credential_queue.put(credential)
+    worker_state['reddit'], worker_state['request_tracker'] = reddit_client(credential)
+    worker_state['budget'] = budget
 
-    # Ensure logs directory exists
-    os.makedirs(logs_dir, exist_ok=True)
-    failed_submissions_file = os.path.join(logs_dir, 'failed_submissions.csv')
+def fetch_worker(task):
+    submission_id, since, expected_new, resume = task
+    stats = {}
+    comments = fetch_comments_for_submission(
+        worker_state['reddit'], submission_id, worker_state['request_tracker'], worker_state['budget'],
+        since, expected_new, stats, resume
+    )
+    # The parent merges each worker's metrics as results come back
+    return submission_id, comments, stats, registry.drain()
+
+def crawl_submissions(tasks, workers, budget=MORE_COMMENTS_BUDGET):
+    """Yield (submission_id, comments, stats) as workers finish; credentials are dealt round-robin.
+
+    `tasks` are (submission_id, since, expected_new, resume) tuples; since is
+    None for a full crawl, and resume holds the stubs a budget-capped crawl
+    left. With a single worker, comments is a generator so rows can be written
+    while the rest of the thread is still being expanded, and `stats` is filled
+    in once it is consumed; with a pool it is a list, or None if the submission
+    failed.
+    """
+    credentials = reddit_credentials()
+    if workers <= 1:
+        credential_queue = queue.Queue()
+        credential_queue.put(credentials[0])
+        init_worker(credential_queue, budget)
+        for submission_id, since, expected_new, resume in tasks:
+            stats = {}
+            yield submission_id, iter_comments_for_submission(
+                worker_state['reddit'], submission_id, worker_state['request_tracker'], budget,
+                since, expected_new, stats, resume
+            ), stats
+        return
+
+    credential_queue = multiprocessing.Queue()
+    for credential in credentials:
+        credential_queue.put(credential)
+    with multiprocessing.Pool(workers, initializer=init_worker, initargs=(credential_queue, budget)) as pool:
+        for submission_id, comments, stats, worker_metrics in pool.imap_unordered(fetch_worker, tasks):
+            registry.merge(worker_metrics)
+            yield submission_id, comments, stats
 
+def record_crawl(store, comments_csv, crawl, total, num_comments=None, rollups=None, baselines=None):
+    """Commit each crawled submission as it arrives; returns (new_rows, updated_rows)."""
+    total_new_comments = 0
+    total_updated_comments = 0
+
+    # Workers only fetch; this process is the single writer
+    for index, (submission_id, comments, stats) in enumerate(crawl):
+        logging.info(f"Processed submission ID {submission_id} ({index + 1}/{total})")
+        print(f"Fetched comments for submission ID {submission_id} ({index + 1}/{total})")
+        if comments is None:
+            # Already logged to failed_submissions.csv; left unmarked so it is retried
+            continue
+        try:
+            new_count, updated_count, comment_count = record_submission(
+                store, comments_csv, submission_id, comments, (num_comments or {}).get(submission_id), rollups,
+                stats, (baselines or {}).get(submission_id)
+            )
+        except CommentFetchError:
+            # Chunks committed so far are kept; the submission stays unmarked and is retried
+            continue
+        total_new_comments += new_count
+        total_updated_comments += updated_count
+        logging.info(f"Collected {comment_count} comments from submission ID {submission_id}")
+        print(f"Collected {comment_count} comments from submission ID {submission_id}")
+    return total_new_comments, total_updated_comments
+
+def crawl_missing_submissions(store, comments_csv, submissions_csv, workers, budget=MORE_COMMENTS_BUDGET,
+                              rollups=None):
+    """Fetch comments for every submission not in the store; returns (new_rows, updated_rows)."""
     # Read submission IDs
     all_submission_ids = read_submission_ids(submissions_csv)
     logging.info(f"Total submissions: {len(all_submission_ids)}")
 
     # Read existing comments data
-    df_comments, fetched_submission_ids = read_existing_comments(comments_csv)
+    fetched_submission_ids = read_existing_comments(store)
     logging.info(f"Submissions with comments already fetched: {len(fetched_submission_ids)}")
 
     # Identify missing submissions
@@ -148,52 +482,128 @@ def main():
     if not missing_submission_ids:
         logging.info("No missing submissions found. All comments have been fetched.")
         print("No missing submissions found. All comments have been fetched.")
-        return
+        return 0, 0
 
-    # Initialize Reddit instance
-    reddit = praw.Reddit(
-        client_id=config.CLIENT_ID,
-        client_secret=config.CLIENT_SECRET,
-        user_agent=config.USER_AGENT
-    )
+    # Threads an earlier crawl left at the budget continue from their unexpanded stubs
+    unexpanded = store.unexpanded(missing_submission_ids)
+    tasks = [(submission_id, None, None, unexpanded.get(submission_id)) for submission_id in missing_submission_ids]
+    crawl = crawl_submissions(tasks, workers, budget)
+    return record_crawl(store, comments_csv, crawl, len(tasks), rollups=rollups)
 
-    # Initialize a request tracker for rate limiting
-    request_tracker = {
-        'count': 0,
-        'start_time': time.time(),
-        'threshold': 30  # Adjust the threshold as needed
-    }
+def refresh_baseline(mark):
+    comment_count, last_num_comments, _ = mark
+    # Stores filled before refresh existed only know how many comments they hold
+    return last_num_comments if last_num_comments is not None else comment_count
+
+def plan_refresh(marks, polled, activity_days=ACTIVITY_WINDOW_DAYS, now=None):
+    """Pick submissions to re-crawl: comment count grew, or still inside the activity window.
 
-    # Initialize a list to store new comments
-    new_comments = []
-
-    # Iterate over missing submission IDs
-    for index, submission_id in enumerate(missing_submission_ids):
-        logging.info(f"Processing submission ID {submission_id} ({index + 1}/{len(missing_submission_ids)})")
-        print(f"Fetching comments for submission ID {submission_id} ({index + 1}/{len(missing_submission_ids)})")
-        comments = fetch_comments_for_submission(reddit, submission_id, request_tracker)
-        new_comments.extend(comments)
-        logging.info(f"Collected {len(comments)} comments from submission ID {submission_id}")
-        print(f"Collected {len(comments)} comments from submission ID {submission_id}")
-        # Respect Reddit's rate limits by adding a randomized delay
-        sleep_time = random.uniform(5, 10)
-        logging.info(f"Sleeping for {sleep_time:.2f} seconds...")
-        time.sleep(sleep_time)
-
-    # Save the new comments to the comments CSV file
-    if new_comments:
-        df_new_comments = pd.DataFrame(new_comments)
-        df_new_comments['created_utc'] = pd.to_datetime(df_new_comments['created_utc'], unit='s')
-        # Append new comments to existing comments CSV
-        if os.path.exists(comments_csv):
-            df_new_comments.to_csv(comments_csv, mode='a', header=False, index=False, encoding='utf-8')
+    Returns (tasks, unchanged) where unchanged maps the remaining submissions to
+    their polled num_comments.
+    """
+    now = now or time.time()
+    tasks, unchanged = [], {}
+    for submission_id, (num_comments, created_utc) in polled.items():
+        baseline = refresh_baseline(marks[submission_id])
+        latest_created_utc = marks[submission_id][2]
+        grown = num_comments > baseline
+        active = now - created_utc < activity_days * 86400
+        if grown or active:
+            expected_new = num_comments - baseline if grown else None
+            tasks.append((submission_id, latest_created_utc or 0, expected_new, None))
         else:
-            df_new_comments.to_csv(comments_csv, index=False, encoding='utf-8')
-        logging.info(f"New comments data saved to {comments_csv}")
-        print(f"New comments data saved to {comments_csv}")
+            unchanged[submission_id] = num_comments
+    return tasks, unchanged
+
+def refresh_submissions(store, comments_csv, workers, budget=MORE_COMMENTS_BUDGET,
+                        activity_days=ACTIVITY_WINDOW_DAYS, rollups=None):
+    """Re-crawl the new part of already-fetched submissions; returns (new_rows, updated_rows)."""
+    marks = store.submission_marks()
+    logging.info(f"Submissions with comments already fetched: {len(marks)}")
+    if not marks:
+        return 0, 0
+
+    reddit, request_tracker = reddit_client(reddit_credentials()[0])
+    polled = poll_submissions(reddit, request_tracker, list(marks))
+    tasks, unchanged = plan_refresh(marks, polled, activity_days)
+    # Unchanged submissions get the API's count as their baseline for next time
+    store.set_num_comments(unchanged.items())
+    logging.info(f"Polled {len(polled)} submissions with {request_tracker['count']} API calls; "
+                 f"{len(tasks)} have new activity")
+    print(f"{len(tasks)} of {len(polled)} submissions have new activity")
+    if not tasks:
+        return 0, 0
+
+    num_comments = {submission_id: polled[submission_id][0] for submission_id, _, _, _ in tasks}
+    baselines = {submission_id: refresh_baseline(marks[submission_id]) for submission_id in num_comments}
+    crawl = crawl_submissions(tasks, workers, budget)
+    return record_crawl(store, comments_csv, crawl, len(tasks), num_comments, rollups, baselines)
+
+def main():
+    parser = argparse.ArgumentParser(description='Collect Reddit comments for the TV show mentions.')
+    parser.add_argument('--workers', type=int, default=len(reddit_credentials()),
+                        help='Worker processes; they share one rate limit per OAuth client')
+    parser.add_argument('--more-budget', type=int, default=MORE_COMMENTS_BUDGET,
+                        help='Cap on API calls per submission for expanding collapsed comments '
+                             '(default and 0: no cap); capped threads are finished by a later run')
+    parser.add_argument('--dumps', nargs='+', metavar='DUMP',
+                        help='Read zstd NDJSON comment dumps instead of crawling the API')
+    parser.add_argument('--refresh', action='store_true',
+                        help='Fetch new comments on submissions that were already crawled')
+    parser.add_argument('--activity-days', type=float, default=ACTIVITY_WINDOW_DAYS,
+                        help='With --refresh, always re-crawl submissions younger than this')
+    parser.add_argument('--format', choices=storage.STORAGE_FORMATS,
+                        default=getattr(config, 'STORAGE_FORMAT', 'csv'),
+                        help='Also export the store to this format (the CSV is always kept)')
+    parser.add_argument('--export-csv', action='store_true',
+                        help='Rewrite the CSV from the store if stored scores or bodies changed; '
+                             'otherwise new comments are only appended')
+    args = parser.parse_args()
+    budget = args.more_budget or None
+
+    # Paths to your CSV files
+    submissions_csv = os.path.join(project_root, 'data', 'raw', 'reddit_tv_show_mentions.csv')
+    comments_csv = os.path.join(project_root, 'data', 'raw', 'reddit_comments.csv')
+    os.makedirs(os.path.dirname(comments_csv), exist_ok=True)
+
+    # Ensure logs directory exists
+    os.makedirs(logs_dir, exist_ok=True)
+
+    # Drop any half-written submission left by a crash, then see what is done
+    store = open_comment_store(comments_csv)
+    rollups = ShowRollups()
+
+    if args.dumps:
+        total_new_comments, total_updated_comments = ingest_comment_dumps_into_store(
+            store, comments_csv, submissions_csv, args.dumps, args.workers, rollups
+        )
+    elif args.refresh:
+        total_new_comments, total_updated_comments = refresh_submissions(
+            store, comments_csv, args.workers, budget, args.activity_days, rollups
+        )
+    else:
+        total_new_comments, total_updated_comments = crawl_missing_submissions(
+            store, comments_csv, submissions_csv, args.workers, budget, rollups
+        )
+
+    if total_updated_comments:
+        logging.info(f"{total_updated_comments} existing comments changed since they were stored")
+    export_if_requested(store, comments_csv, args.export_csv)
+    comments_parquet = storage.dataset_path(comments_csv, 'parquet')
+    if args.format == 'parquet' and (total_new_comments or total_updated_comments
+                                     or not os.path.exists(comments_parquet)):
+        storage.write_table(store.iter_comments(), comments_parquet, COMMENT_DATASET, 'parquet')
+    store.close()
+    rollups.close()
+
+    if total_new_comments:
+        logging.info(f"{total_new_comments} new comments saved to {comments_csv}")
+        print(f"{total_new_comments} new comments saved to {comments_csv}")
     else:
         logging.info("No new comments collected.")
         print("No new comments collected.")
+    registry.export('collect_tv_comments')
+    print(registry.summary())
 
 if __name__ == '__main__':
     main()
@@ -2,15 +2,23 @@
 
 import sys
 import os
-import praw
 import pandas as pd
 import logging
+import threading
+import itertools
+import argparse
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 # Add the project root directory to sys.path
 project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 sys.path.insert(0, project_root)
 
 import config  # Now this should work
+from show_matcher import ShowMatcher, read_show_aliases
+from reddit_api import RedditCallError, reddit_credentials, reddit_client, call_reddit
+from rollups import ShowRollups
+from metrics import registry
+import storage
 
 # Ensure the logs directory exists
 logs_dir = os.path.join(project_root, 'logs')
@@ -24,72 +32,271 @@ logging.basicConfig(
     level=logging.INFO
 )
 
+# Reddit rejects search queries longer than 512 characters
+MAX_QUERY_LENGTH = 512
+
+# Cap names per query so each batch's result limit still covers every show
+MAX_NAMES_PER_QUERY = 8
+
+# Concurrent search batches; each thread gets its own Reddit client
+SEARCH_WORKERS = 4
+
+# Reddit returns at most this many results per query, 100 per page
+SEARCH_LIMIT = 1000
+SEARCH_PAGE_SIZE = 100
+
+# Subreddits to search
+SUBREDDITS = ['television', 'tvshows', 'netflix', 'Hulu', 'AmazonPrimeVideo', 'ParamountPlus']
+
+thread_local = threading.local()
+
+# Search threads take the OAuth clients in turn
+client_numbers = itertools.count()
+
+MENTION_FIELDS = [
+    'id', 'title', 'selftext', 'created_utc', 'subreddit', 'author',
+    'score', 'num_comments', 'url', 'tv_show_name'
+]
+
+# Parquet layout: one directory per subreddit and month, sorted by show inside
+# each file so row-group statistics can skip other shows
+MENTION_DATASET = storage.Dataset(
+    MENTION_FIELDS,
+    types={'created_utc': 'timestamp', 'score': 'int', 'num_comments': 'int'},
+    partition_by=['subreddit', 'month'],
+    sort_by='tv_show_name'
+)
+
 def read_tv_show_list(csv_file):
-    df = pd.read_csv(csv_file)
+    df = storage.read_table(csv_file, columns=['name'])
     tv_show_names = df['name'].dropna().unique().tolist()
     return tv_show_names
 
-def search_reddit_for_tv_show(reddit, tv_show_name, subreddit_list, limit=1000):
+def build_query_batches(tv_show_names, max_query_length=MAX_QUERY_LENGTH,
+                        max_names_per_query=MAX_NAMES_PER_QUERY):
+    """Pack show names into OR'd Lucene phrase queries that fit Reddit's limit.
+
+    Returns a list of (query, names) pairs.
+    """
+    batches = []
+    names, terms, length = [], [], 0
+    for tv_show_name in tv_show_names:
+        term = '"' + tv_show_name.replace('"', '') + '"'
+        added_length = len(term) + (len(' OR ') if terms else 0)
+        if terms and (length + added_length > max_query_length or len(terms) >= max_names_per_query):
+            batches.append((' OR '.join(terms), names))
+            names, terms, length = [], [], 0
+            added_length = len(term)
+        names.append(tv_show_name)
+        terms.append(term)
+        length += added_length
+    if terms:
+        batches.append((' OR '.join(terms), names))
+    return batches
+
+def submission_to_post(submission):
+    return {
+        'id': submission.id,
+        'title': submission.title,
+        'selftext': submission.selftext,
+        'created_utc': submission.created_utc,
+        'subreddit': submission.subreddit.display_name,
+        'author': submission.author.name if submission.author else '[deleted]',
+        'score': submission.score,
+        'num_comments': submission.num_comments,
+        'url': submission.url
+    }
+
+def split_capped_batch(names, post_count, limit=SEARCH_LIMIT):
+    """Halves of a batch whose search filled `limit`, as (query, names) pairs.
+
+    Each half gets a full limit of its own, so a popular show cannot use up the
+    results of the others. Returns [] for a batch under the cap or a single show.
+    """
+    if post_count < limit or len(names) < 2:
+        return []
+    half = len(names) // 2
+    return build_query_batches(names[:half]) + build_query_batches(names[half:])
+
+def iter_search(client, query, subreddit_list, limit=SEARCH_LIMIT):
+    """Yield unique posts for one query against the combined multireddit.
+
+    `client` is a (reddit, request_tracker) pair. Each result page is one
+    call_reddit call, paced by the client's shared rate limit and retried on
+    429s and errors; RedditCallError propagates once a page runs out of
+    retries, so a failed query never passes for a complete one.
+    """
+    reddit, request_tracker = client
+    multireddit = reddit.subreddit('+'.join(subreddit_list))
+
+    def fetch_page(after, count):
+        page = multireddit.search(query, syntax='lucene', limit=count, params={'after': after} if after else {})
+        submissions = list(page)
+        # PRAW moves the cursor on only while Reddit reports more pages
+        return submissions, page.params.get('after')
+
+    seen = set()
+    after = None
+    fetched = 0
+    while fetched < limit:
+        count = min(SEARCH_PAGE_SIZE, limit - fetched)
+        submissions, next_after = call_reddit(reddit, request_tracker, f"search for {query!r}",
+                                              lambda: fetch_page(after, count), endpoint='search')
+        fetched += len(submissions)
+        for submission in submissions:
+            if submission.id not in seen:
+                seen.add(submission.id)
+                yield submission_to_post(submission)
+        if not submissions or next_after in (None, after):
+            break
+        after = next_after
+
+def tag_posts(matcher, posts, names):
+    """Pair each post a batch search returned with the shows it mentions.
+
+    The matcher looks for every show in the title and selftext. A hit in which
+    it finds none (a guarded name in an all-caps title or at the start of a
+    sentence, or a match on another field) still came back for one of the
+    batch's `names`. It is matched against those alone without the guard, and
+    failing that tagged with all of them, as the per-show searches kept every hit.
+    """
+    tagged = []
+    fallback = None
+    for post_data in posts:
+        text = post_data['title'] + '\n' + post_data['selftext']
+        found = matcher.find(text)
+        if not found:
+            if fallback is None:
+                fallback = ShowMatcher({name: [name] for name in names}, common_words=frozenset())
+            found = fallback.find(text) or list(names)
+        tagged.append((post_data, found))
+    return tagged
+
+def match_posts(matcher, posts, names):
+    """One row per (post, show), tagged as in tag_posts."""
+    return [dict(post_data, tv_show_name=tv_show_name)
+            for post_data, found in tag_posts(matcher, posts, names) for tv_show_name in found]
+
+def mentions_frame(posts):
+    df = pd.DataFrame(posts)
+    df['created_utc'] = pd.to_datetime(df['created_utc'], unit='s')
+    return df
+
+def thread_client():
+    # PRAW instances and the limiter's SQLite connection are not thread-safe,
+    # so each search thread owns a (reddit, request_tracker) pair
+    if not hasattr(thread_local, 'client'):
+        credentials = reddit_credentials()
+        thread_local.client = reddit_client(credentials[next(client_numbers) % len(credentials)])
+    return thread_local.client
+
+def search_reddit_for_tv_shows(tv_show_names, subreddit_list, limit=SEARCH_LIMIT,
+                               workers=SEARCH_WORKERS, client_factory=thread_client, matcher=None):
+    """Search all shows in batched queries; one row per (submission, matching show).
+
+    Hits are tagged locally with every show their title or selftext mentions,
+    not just the shows whose query found them (see tag_posts). A batch that
+    fills its `limit` is split and searched again (see split_capped_batch). A
+    batch whose calls run out of retries is logged and adds nothing, rather
+    than the pages it got before failing.
+    """
+    if matcher is None:
+        matcher = ShowMatcher.from_tv_show_list(tv_show_names)
+    batches = build_query_batches(tv_show_names)
+    logging.info(f"Searching {len(tv_show_names)} TV shows in {len(batches)} batched queries")
+    posts = {}
+    post_names = {}
+    failed_names = []
+    searched = 0
+
+    def search_batch(query):
+        return list(iter_search(client_factory(), query, subreddit_list, limit))
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = {executor.submit(search_batch, query): names for query, names in batches}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                names = pending.pop(future)
+                try:
+                    batch_posts = future.result()
+                except RedditCallError as e:
+                    registry.count('errors_total', endpoint='search')
+                    logging.error(f"Search batch for {len(names)} shows failed after retries: {e}")
+                    failed_names.extend(names)
+                    continue
+                searched += 1
+                for post_data, found in tag_posts(matcher, batch_posts, names):
+                    posts.setdefault(post_data['id'], post_data)
+                    post_names.setdefault(post_data['id'], set()).update(found)
+                logging.info(f"Batch {searched}: {len(batch_posts)} posts for {len(names)} shows")
+                halves = split_capped_batch(names, len(batch_posts), limit)
+                for query, part in halves:
+                    pending[executor.submit(search_batch, query)] = part
+                if halves:
+                    logging.info(f"Batch of {len(names)} shows reached {limit} results; split and searched again")
+    if failed_names:
+        logging.error(f"No results for {len(failed_names)} shows whose search failed: {failed_names}")
+        print(f"Search failed for {len(failed_names)} shows; see the log")
+
     collected_posts = []
-    query = f'"{tv_show_name}"'
-    for subreddit_name in subreddit_list:
-        subreddit = reddit.subreddit(subreddit_name)
-        try:
-            for submission in subreddit.search(query, limit=limit, syntax='lucene'):
-                post_data = {
-                    'id': submission.id,
-                    'title': submission.title,
-                    'selftext': submission.selftext,
-                    'created_utc': submission.created_utc,
-                    'subreddit': submission.subreddit.display_name,
-                    'author': submission.author.name if submission.author else '[deleted]',
-                    'score': submission.score,
-                    'num_comments': submission.num_comments,
-                    'url': submission.url,
-                    'tv_show_name': tv_show_name
-                }
-                collected_posts.append(post_data)
-        except praw.exceptions.APIException as e:
-            logging.error(f"Reddit API exception for '{tv_show_name}' in r/{subreddit_name}: {e}")
-        except Exception as e:
-            logging.error(f"Error searching for '{tv_show_name}' in r/{subreddit_name}: {e}")
+    for post_id, post_data in posts.items():
+        for tv_show_name in sorted(post_names[post_id]):
+            collected_posts.append(dict(post_data, tv_show_name=tv_show_name))
     return collected_posts
 
+def collect_from_dumps(dump_paths, show_aliases, subreddit_list, workers=None):
+    # Imported here so API-only runs don't need zstandard
+    from reddit_dumps import ingest_submission_dumps
+    collected_posts = {}
+    for rows in ingest_submission_dumps(dump_paths, subreddit_list, show_aliases, workers):
+        for post_data in rows:
+            collected_posts[(post_data['id'], post_data['tv_show_name'])] = post_data
+    return list(collected_posts.values())
+
 def main():
+    parser = argparse.ArgumentParser(description='Collect Reddit submissions mentioning the TV shows.')
+    parser.add_argument('--dumps', nargs='+', metavar='DUMP',
+                        help='Read zstd NDJSON submission dumps instead of searching the API')
+    parser.add_argument('--workers', type=int, default=None, help='Decoding processes for --dumps')
+    parser.add_argument('--format', choices=storage.STORAGE_FORMATS,
+                        default=getattr(config, 'STORAGE_FORMAT', 'csv'), help='Output table format')
+    args = parser.parse_args()
+
     # Paths
     tv_show_csv = os.path.join(project_root, 'data', 'raw', 'paramount_plus_tv_shows.csv')
-    output_csv = os.path.join(project_root, 'data', 'raw', 'reddit_tv_show_mentions.csv')
+    output_csv = storage.dataset_path(
+        os.path.join(project_root, 'data', 'raw', 'reddit_tv_show_mentions.csv'), args.format
+    )
     os.makedirs(os.path.dirname(output_csv), exist_ok=True)
     
-    # Subreddits to search
-    subreddit_list = ['television', 'tvshows', 'netflix', 'Hulu', 'AmazonPrimeVideo', 'ParamountPlus']
+    subreddit_list = SUBREDDITS
     
     # Read TV show names
     tv_show_names = read_tv_show_list(tv_show_csv)
     logging.info(f"Total TV shows to search for: {len(tv_show_names)}")
-    
-    # Initialize Reddit instance
-    reddit = praw.Reddit(
-        client_id=config.CLIENT_ID,
-        client_secret=config.CLIENT_SECRET,
-        user_agent=config.USER_AGENT
-    )
-    
-    all_collected_posts = []
-    
-    for index, tv_show_name in enumerate(tv_show_names):
-        logging.info(f"Searching for '{tv_show_name}' ({index + 1}/{len(tv_show_names)})")
-        collected_posts = search_reddit_for_tv_show(reddit, tv_show_name, subreddit_list)
-        all_collected_posts.extend(collected_posts)
-        logging.info(f"Collected {len(collected_posts)} posts for '{tv_show_name}'")
-    
+
+    # Both paths also match original_name aliases when tagging hits
+    show_aliases = read_show_aliases(tv_show_csv)
+    if args.dumps:
+        all_collected_posts = collect_from_dumps(args.dumps, show_aliases, subreddit_list, args.workers)
+    else:
+        matcher = ShowMatcher(show_aliases)
+        all_collected_posts = search_reddit_for_tv_shows(tv_show_names, subreddit_list, matcher=matcher)
+    logging.info(f"Collected {len(all_collected_posts)} (post, TV show) rows")
+
     if all_collected_posts:
-        df = pd.DataFrame(all_collected_posts)
-        df['created_utc'] = pd.to_datetime(df['created_utc'], unit='s')
-        df.to_csv(output_csv, index=False, encoding='utf-8')
+        df = mentions_frame(all_collected_posts)
+        storage.write_table(df, output_csv, MENTION_DATASET, args.format)
         logging.info(f"Data saved to {output_csv}")
+        # Only (post, show) pairs not seen before add to the rollups; the rest update scores
+        rollups = ShowRollups()
+        rollups.add_mentions(df.to_dict('records'))
+        rollups.close()
     else:
         logging.info("No posts collected.")
+    registry.export('collect_tv_mentions')
+    print(registry.summary())
 
 if __name__ == '__main__':
     main()
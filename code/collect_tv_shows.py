@@ -6,12 +6,24 @@ import requests
 import time
 import csv
 import logging
+import json
+import math
+import argparse
+from datetime import datetime, timedelta, timezone
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 
 # Add the project root directory to sys.path
 project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 sys.path.insert(0, project_root)
 
 import config  # Now this should work
+from rate_limiter import TokenBucket, AdaptiveLimiter, get_with_backoff
+from http_cache import HttpCache
+from omdb_scheduler import OmdbScheduler
+import storage
+from metrics import registry
 
 # Ensure the logs directory exists
 logs_dir = os.path.join(project_root, 'logs')
@@ -32,6 +44,10 @@ TMDB_API_KEY = config.TMDB_API_KEY
 # OMDb API key from config.py
 OMDB_API_KEY = config.OMDB_API_KEY
 
+# API base URLs; the benchmark points these at local stand-ins
+TMDB_API_URL = 'https://api.themoviedb.org/3'
+OMDB_API_URL = 'http://www.omdbapi.com/'
+
 # Provider ID for Paramount Plus
 PROVIDER_ID = '531'
 
@@ -39,53 +55,183 @@ PROVIDER_ID = '531'
 WATCH_REGION = 'US'
 LANGUAGE = 'en-US'
 
-def get_tv_show_details(tv_id):
-    url = f'https://api.themoviedb.org/3/tv/{tv_id}'
+# Number of shows enriched concurrently
+MAX_WORKERS = 16
+
+# OMDb free tier limit is 1,000 requests per day
+OMDB_DAILY_LIMIT = 990
+
+# One connection pool per host, shared by all worker threads
+tmdb_session = requests.Session()
+tmdb_session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=MAX_WORKERS))
+omdb_session = requests.Session()
+omdb_session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=MAX_WORKERS))
+
+# Rate limiting follows the servers' rate-limit headers when they send them;
+# otherwise TMDb's documented ceiling of ~40 requests per second applies
+tmdb_limiter = AdaptiveLimiter('TMDb', TokenBucket(40, 1, name='TMDb'))
+omdb_limiter = AdaptiveLimiter('OMDb', TokenBucket(10, 1, name='OMDb'))
+
+# Local response cache; TTLs are in seconds per endpoint
+http_cache = HttpCache(os.path.join(project_root, 'data', 'cache', 'http_cache.sqlite'))
+TMDB_DETAILS_TTL = 24 * 3600
+TMDB_EXTERNAL_IDS_TTL = 7 * 24 * 3600
+OMDB_TTL = 7 * 24 * 3600
+
+# Incremental refresh state: last-seen change signals per show id
+STATE_FILE = os.path.join(project_root, 'data', 'cache', 'tv_show_state.json')
+# TMDb's /tv/changes feed only covers the last 14 days
+CHANGES_WINDOW_DAYS = 14
+# Re-enrich every show at least this often, even without a change signal
+MAX_STATE_AGE_DAYS = 30
+# Drop a show after it is absent from discover this many runs in a row
+MISSING_RUNS_BEFORE_DROP = 3
+
+# Persistent daily OMDb quota ledger and backlog of shows still missing OMDb data
+omdb_scheduler = OmdbScheduler(os.path.join(project_root, 'data', 'cache', 'omdb_ledger.sqlite'), OMDB_DAILY_LIMIT)
+
+def get_tv_show_details(tv_id, ttl=TMDB_DETAILS_TTL):
+    url = f'{TMDB_API_URL}/tv/{tv_id}'
     params = {
         'api_key': TMDB_API_KEY,
         'language': LANGUAGE,
     }
-    response = requests.get(url, params=params)
-    if response.status_code == 200:
-        return response.json()
+    status_code, data = http_cache.get(tmdb_session, url, params, ttl, limiter=tmdb_limiter)
+    if status_code == 200:
+        return data
     else:
-        print(f"Error fetching details for TV show ID {tv_id}: {response.status_code}")
+        print(f"Error fetching details for TV show ID {tv_id}: {status_code}")
         return None
 
 def get_tv_show_external_ids(tv_id):
-    url = f'https://api.themoviedb.org/3/tv/{tv_id}/external_ids'
+    url = f'{TMDB_API_URL}/tv/{tv_id}/external_ids'
     params = {
         'api_key': TMDB_API_KEY,
     }
-    response = requests.get(url, params=params)
-    if response.status_code == 200:
-        return response.json()
+    status_code, data = http_cache.get(tmdb_session, url, params, TMDB_EXTERNAL_IDS_TTL, limiter=tmdb_limiter)
+    if status_code == 200:
+        return data
     else:
-        print(f"Error fetching external IDs for TV show ID {tv_id}: {response.status_code}")
+        print(f"Error fetching external IDs for TV show ID {tv_id}: {status_code}")
         return None
 
-def get_data_from_omdb(imdb_id):
-    url = 'http://www.omdbapi.com/'
+def omdb_request(imdb_id):
+    url = OMDB_API_URL
     params = {
         'apikey': OMDB_API_KEY,
         'i': imdb_id,
         'plot': 'full',
         'r': 'json'
     }
-    response = requests.get(url, params=params)
-    if response.status_code == 200:
-        data = response.json()
+    return url, params
+
+def omdb_is_cached(imdb_id):
+    url, params = omdb_request(imdb_id)
+    return http_cache.is_fresh(url, params, OMDB_TTL)
+
+def get_data_from_omdb(imdb_id, cached_only=False):
+    url, params = omdb_request(imdb_id)
+    # Cached payloads don't count against the daily OMDb quota
+    if not http_cache.is_fresh(url, params, OMDB_TTL):
+        if cached_only or not omdb_scheduler.reserve():
+            return None
+    status_code, data = http_cache.get(omdb_session, url, params, OMDB_TTL, limiter=omdb_limiter)
+    if status_code == 200:
         if data.get('Response') == 'True':
             return data
         else:
             print(f"OMDb Error: {data.get('Error')} for IMDb ID {imdb_id}")
             return None
     else:
-        print(f"Error fetching data from OMDb for IMDb ID {imdb_id}: {response.status_code}")
+        print(f"Error fetching data from OMDb for IMDb ID {imdb_id}: {status_code}")
         return None
 
-def fetch_tv_shows():
-    url = 'https://api.themoviedb.org/3/discover/tv'
+def enrich_tv_show(tv_id, refresh=False):
+    # Fetch detailed info; a refresh bypasses (and revalidates) the cached copy
+    details = get_tv_show_details(tv_id, ttl=0 if refresh else TMDB_DETAILS_TTL)
+    if not details:
+        return None
+
+    # Fetch external IDs
+    external_ids = get_tv_show_external_ids(tv_id)
+    if external_ids:
+        details['external_ids'] = external_ids
+        imdb_id = external_ids.get('imdb_id')
+        if imdb_id:
+            if omdb_is_cached(imdb_id):
+                omdb_data = get_data_from_omdb(imdb_id, cached_only=True)
+                if omdb_data:
+                    details['omdb_data'] = omdb_data
+            else:
+                # Uncached OMDb lookups wait in the backlog for backfill_omdb
+                omdb_scheduler.enqueue(imdb_id, tv_id, details.get('popularity'))
+    return details
+
+def fetch_omdb_backlog_item(imdb_id):
+    # Returns (status_code, data); status_code is None once today's quota is spent
+    if not omdb_scheduler.reserve():
+        return None, None
+    url, params = omdb_request(imdb_id)
+    try:
+        return http_cache.get(omdb_session, url, params, OMDB_TTL, limiter=omdb_limiter)
+    except requests.RequestException as e:
+        logging.error(f"Error fetching data from OMDb for IMDb ID {imdb_id}: {e}")
+        return 0, None
+
+def backfill_omdb(results=(), active_tv_ids=None, max_workers=MAX_WORKERS):
+    """Spend today's remaining OMDb quota on the most popular backlog entries.
+
+    OMDb data is attached to matching shows in `results`. Backlog shows not in
+    `results` are re-read from TMDb (normally a cache hit) and returned so they
+    can be merged; if `active_tv_ids` is given, entries outside it are dropped.
+    """
+    by_imdb_id = {}
+    for details in results:
+        imdb_id = details.get('external_ids', {}).get('imdb_id')
+        if imdb_id:
+            by_imdb_id[imdb_id] = details
+
+    batch = []
+    for imdb_id, tv_id in omdb_scheduler.pending(omdb_scheduler.remaining_today()):
+        if active_tv_ids is not None and tv_id not in active_tv_ids:
+            omdb_scheduler.complete(imdb_id)
+        else:
+            batch.append((imdb_id, tv_id))
+
+    backfilled = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        fetched = executor.map(lambda item: fetch_omdb_backlog_item(item[0]), batch)
+        for (imdb_id, tv_id), (status_code, data) in zip(batch, fetched):
+            if status_code is None:
+                # Quota spent (possibly by another process); retry on a later run
+                continue
+            if status_code != 200:
+                print(f"Error fetching data from OMDb for IMDb ID {imdb_id}: {status_code}")
+                omdb_scheduler.fail(imdb_id)
+                continue
+            omdb_scheduler.complete(imdb_id)
+            if data.get('Response') != 'True':
+                print(f"OMDb Error: {data.get('Error')} for IMDb ID {imdb_id}")
+                continue
+            details = by_imdb_id.get(imdb_id)
+            if details is None:
+                details = get_tv_show_details(tv_id)
+                if not details:
+                    continue
+                details['external_ids'] = get_tv_show_external_ids(tv_id) or {'imdb_id': imdb_id}
+                backfilled.append(details)
+            details['omdb_data'] = data
+
+    print(f"OMDb backfill: {len(batch)} scheduled, {omdb_scheduler.backlog_size()} still in backlog, "
+          f"{omdb_scheduler.remaining_today()} requests left today")
+    return backfilled
+
+class DiscoverError(Exception):
+    """A /discover/tv page failed, so the listing is incomplete."""
+
+def iter_discover_pages():
+    """Yield each page of discover results; raises DiscoverError if any page fails."""
+    url = f'{TMDB_API_URL}/discover/tv'
     params = {
         'api_key': TMDB_API_KEY,
         'language': LANGUAGE,
@@ -94,180 +240,380 @@ def fetch_tv_shows():
         'watch_region': WATCH_REGION,
         'page': 1
     }
-    all_results = []
     total_pages = 1  # Initialize total_pages
 
-    tmdb_request_count = 0
-    omdb_request_count = 0
-    start_time = time.time()
-
     while params['page'] <= total_pages:
-        # First API call in this loop
-        response = requests.get(url, params=params)
-        tmdb_request_count += 1
-
-        # Rate limiting: TMDb allows 40 requests every 10 seconds
-        if tmdb_request_count >= 40:
-            elapsed_time = time.time() - start_time
-            if elapsed_time < 10:
-                wait_time = 10 - elapsed_time
-                print(f"TMDb rate limit reached. Waiting for {wait_time:.2f} seconds...")
-                time.sleep(wait_time)
-            # Reset the counters
-            tmdb_request_count = 0
-            start_time = time.time()
+        response = get_with_backoff(tmdb_session, url, params=params, limiter=tmdb_limiter)
 
+        # A partial listing would read as shows leaving the catalog, so stop the run instead
         if response.status_code != 200:
             print(f"Error fetching data: {response.status_code}")
-            break
+            raise DiscoverError(f"discover page {params['page']} returned {response.status_code}")
 
         data = response.json()
-        if 'results' in data:
-            total_pages = data.get('total_pages', 1)
-            print(f"Fetched page {params['page']} of {total_pages}")
-            for tv_show in data['results']:
-                tv_id = tv_show['id']
-                # Fetch detailed info
-                details = get_tv_show_details(tv_id)
-                tmdb_request_count += 1
-                if tmdb_request_count >= 40:
-                    elapsed_time = time.time() - start_time
-                    if elapsed_time < 10:
-                        wait_time = 10 - elapsed_time
-                        print(f"TMDb rate limit reached. Waiting for {wait_time:.2f} seconds...")
-                        time.sleep(wait_time)
-                    # Reset the counters
-                    tmdb_request_count = 0
-                    start_time = time.time()
+        if 'results' not in data:
+            print("No results found.")
+            raise DiscoverError(f"discover page {params['page']} had no results")
+        total_pages = data.get('total_pages', 1)
+        print(f"Fetched page {params['page']} of {total_pages}")
+        yield data['results']
+        params['page'] += 1
+
+def enriched_result(future):
+    try:
+        return future.result()
+    except requests.RequestException as e:
+        logging.error(f"Error enriching TV show: {e}")
+        return None
 
+def collect_enriched(futures):
+    # Keep submission order so the output matches a serial run
+    results = []
+    for future in futures:
+        details = enriched_result(future)
+        if details:
+            results.append(details)
+    return results
+
+def iter_tv_shows(max_workers=MAX_WORKERS):
+    """Yield enriched shows in discover order as soon as each one is ready."""
+    max_pending = max_workers * 4
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # Enrichment of each page overlaps with fetching the next one
+        for results in iter_discover_pages():
+            for tv_show in results:
+                pending.append(executor.submit(enrich_tv_show, tv_show['id']))
+            # Block on the oldest show when too far ahead, so memory stays bounded
+            while pending and (pending[0].done() or len(pending) > max_pending):
+                details = enriched_result(pending.popleft())
                 if details:
-                    # Fetch external IDs
-                    external_ids = get_tv_show_external_ids(tv_id)
-                    tmdb_request_count += 1
-                    if tmdb_request_count >= 40:
-                        elapsed_time = time.time() - start_time
-                        if elapsed_time < 10:
-                            wait_time = 10 - elapsed_time
-                            print(f"TMDb rate limit reached. Waiting for {wait_time:.2f} seconds...")
-                            time.sleep(wait_time)
-                        # Reset the counters
-                        tmdb_request_count = 0
-                        start_time = time.time()
-
-                    if external_ids:
-                        details['external_ids'] = external_ids
-                        imdb_id = external_ids.get('imdb_id')
-                        if imdb_id:
-                            # Fetch OMDb data
-                            omdb_data = get_data_from_omdb(imdb_id)
-                            omdb_request_count += 1
-                            if omdb_request_count >= 990:
-                                # OMDb free tier limit is 1,000 requests per day
-                                print("OMDb request limit approaching. Stopping OMDb data fetching.")
-                                # You can choose to wait until the next day or upgrade your plan
-                                break
-                            if omdb_data:
-                                details['omdb_data'] = omdb_data
-                    all_results.append(details)
-            params['page'] += 1
-        else:
-            print("No results found.")
-            break
+                    yield details
+        while pending:
+            details = enriched_result(pending.popleft())
+            if details:
+                yield details
 
+def fetch_tv_shows(max_workers=MAX_WORKERS):
+    all_results = list(iter_tv_shows(max_workers=max_workers))
+
+    # Every listed show is in all_results; backlog entries for anything else are stale
+    active_tv_ids = {str(details['id']) for details in all_results}
+    backfill_omdb(all_results, active_tv_ids=active_tv_ids, max_workers=max_workers)
     return all_results
 
-def save_to_csv(data, filename):
-    if data:
-        fields = [
-            # TMDb fields
-            'id', 'name', 'original_name', 'overview', 'first_air_date',
-            'last_air_date', 'number_of_episodes', 'number_of_seasons',
-            'genres', 'origin_country', 'original_language', 'popularity',
-            'vote_average', 'vote_count', 'status', 'type', 'homepage',
-            'in_production', 'languages', 'episode_run_time', 'tagline',
-            'created_by', 'networks',
-            # OMDb fields
-            'imdb_rating', 'imdb_votes', 'rotten_tomatoes_rating',
-            'metacritic_rating', 'plot', 'awards', 'actors', 'writer', 'language',
-            'country', 'box_office', 'production'
-        ]
-        with open(filename, 'w', newline='', encoding='utf-8') as output_file:
-            dict_writer = csv.DictWriter(output_file, fieldnames=fields)
-            dict_writer.writeheader()
+def load_show_state(state_file=STATE_FILE):
+    if os.path.exists(state_file):
+        with open(state_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return {'last_run': None, 'shows': {}}
+
+def save_show_state(state, state_file=STATE_FILE):
+    os.makedirs(os.path.dirname(state_file), exist_ok=True)
+    tmp_file = state_file + '.tmp'
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+    os.replace(tmp_file, state_file)
+
+def popularity_band(popularity):
+    # Log-scale bands so ordinary day-to-day jitter doesn't trigger a refresh
+    return int(math.log2((popularity or 0) + 1))
+
+def show_state_entry(details, enriched_at):
+    return {
+        'popularity_band': popularity_band(details.get('popularity')),
+        'last_air_date': details.get('last_air_date'),
+        'number_of_episodes': details.get('number_of_episodes'),
+        'enriched_at': enriched_at,
+        'missed_runs': 0
+    }
+
+def get_changed_tv_ids(since):
+    url = f'{TMDB_API_URL}/tv/changes'
+    params = {
+        'api_key': TMDB_API_KEY,
+        'start_date': since.strftime('%Y-%m-%d'),
+        'page': 1
+    }
+    changed_ids = set()
+    total_pages = 1
+    while params['page'] <= total_pages:
+        response = get_with_backoff(tmdb_session, url, params=params, limiter=tmdb_limiter)
+        if response.status_code != 200:
+            print(f"Error fetching TV changes: {response.status_code}")
+            return None
+        data = response.json()
+        total_pages = data.get('total_pages', 1)
+        changed_ids.update(str(change['id']) for change in data.get('results', []))
+        params['page'] += 1
+    return changed_ids
+
+def plan_incremental_refresh(discovered, state, changed_ids, now):
+    """Return (new_ids, refresh_ids, missing_ids) for a set of discover results.
+
+    A known show is refreshed when it is in `changed_ids` (the /tv/changes
+    feed; None means the feed was unavailable and every show counts), was
+    missing from an earlier run, has moved popularity band, or is older than
+    MAX_STATE_AGE_DAYS. Popularity is the only stored field compared, since
+    discover results carry no air dates or episode counts.
+    """
+    shows = state['shows']
+    new_ids, refresh_ids = [], []
+    for tv_id, tv_show in discovered.items():
+        entry = shows.get(tv_id)
+        if entry is None:
+            new_ids.append(tv_id)
+        elif (changed_ids is None
+              or tv_id in changed_ids
+              or entry.get('missed_runs', 0) > 0
+              or entry.get('popularity_band') != popularity_band(tv_show.get('popularity'))
+              or now - entry.get('enriched_at', 0) > MAX_STATE_AGE_DAYS * 86400):
+            refresh_ids.append(tv_id)
+    missing_ids = [tv_id for tv_id in shows if tv_id not in discovered]
+    return new_ids, refresh_ids, missing_ids
+
+def fetch_tv_shows_incremental(state, max_workers=MAX_WORKERS):
+    """Enrich only new or changed shows; return (enriched, removed_ids).
+
+    Raises DiscoverError before touching `state` if the listing is incomplete.
+    """
+    now = time.time()
+    discovered = {}
+    for results in iter_discover_pages():
+        for tv_show in results:
+            discovered.setdefault(str(tv_show['id']), tv_show)
+    if not discovered and state['shows']:
+        # Like an empty full run, this says more about the API than the catalog
+        raise DiscoverError("discover listed no shows")
+
+    # Without a recent enough baseline every known show counts as changed
+    changed_ids = None
+    last_run = state.get('last_run')
+    if last_run:
+        since = datetime.fromtimestamp(last_run, tz=timezone.utc) - timedelta(days=1)
+        if datetime.now(timezone.utc) - since <= timedelta(days=CHANGES_WINDOW_DAYS):
+            changed_ids = get_changed_tv_ids(since)
+
+    new_ids, refresh_ids, missing_ids = plan_incremental_refresh(discovered, state, changed_ids, now)
+    print(f"Incremental refresh: {len(new_ids)} new, {len(refresh_ids)} changed, "
+          f"{len(missing_ids)} missing, {len(discovered) - len(new_ids) - len(refresh_ids)} unchanged")
+
+    futures = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for tv_id in new_ids:
+            futures.append(executor.submit(enrich_tv_show, tv_id))
+        for tv_id in refresh_ids:
+            futures.append(executor.submit(enrich_tv_show, tv_id, True))
+        enriched = collect_enriched(futures)
+
+    # Unchanged shows that were still waiting for OMDb data are merged too
+    enriched += backfill_omdb(enriched, max_workers=max_workers)
+
+    shows = state['shows']
+    for details in enriched:
+        shows[str(details['id'])] = show_state_entry(details, now)
+
+    removed_ids = []
+    for tv_id in missing_ids:
+        shows[tv_id]['missed_runs'] = shows[tv_id].get('missed_runs', 0) + 1
+        if shows[tv_id]['missed_runs'] >= MISSING_RUNS_BEFORE_DROP:
+            removed_ids.append(tv_id)
+            del shows[tv_id]
+    state['last_run'] = now
+    return enriched, removed_ids
+
+# Rows are flushed to disk in batches of this size
+CSV_BATCH_SIZE = 500
+
+def scalar_column(field):
+    def extract(item):
+        value = item.get(field, '')
+        if isinstance(value, bool):
+            return str(value)
+        return '' if value is None else value
+    return extract
+
+def joined_column(field, key=None):
+    if key is None:
+        return lambda item: ', '.join(map(str, item.get(field) or []))
+    return lambda item: ', '.join([entry[key] for entry in item.get(field) or []])
+
+def omdb_column(key):
+    return lambda item: item.get('omdb_data', {}).get(key, '')
+
+def rotten_tomatoes_column(item):
+    for rating in item.get('omdb_data', {}).get('Ratings', []):
+        if rating['Source'] == 'Rotten Tomatoes':
+            return rating['Value']
+    return ''
+
+# One extractor per output column, built once at import time
+CSV_COLUMNS = [
+    # TMDb fields
+    ('id', scalar_column('id')),
+    ('name', scalar_column('name')),
+    ('original_name', scalar_column('original_name')),
+    ('overview', scalar_column('overview')),
+    ('first_air_date', scalar_column('first_air_date')),
+    ('last_air_date', scalar_column('last_air_date')),
+    ('number_of_episodes', scalar_column('number_of_episodes')),
+    ('number_of_seasons', scalar_column('number_of_seasons')),
+    ('genres', joined_column('genres', 'name')),
+    ('origin_country', joined_column('origin_country')),
+    ('original_language', scalar_column('original_language')),
+    ('popularity', scalar_column('popularity')),
+    ('vote_average', scalar_column('vote_average')),
+    ('vote_count', scalar_column('vote_count')),
+    ('status', scalar_column('status')),
+    ('type', scalar_column('type')),
+    ('homepage', scalar_column('homepage')),
+    ('in_production', scalar_column('in_production')),
+    ('languages', joined_column('languages')),
+    ('episode_run_time', joined_column('episode_run_time')),
+    ('tagline', scalar_column('tagline')),
+    ('created_by', joined_column('created_by', 'name')),
+    ('networks', joined_column('networks', 'name')),
+    # OMDb fields
+    ('imdb_rating', omdb_column('imdbRating')),
+    ('imdb_votes', omdb_column('imdbVotes')),
+    ('rotten_tomatoes_rating', rotten_tomatoes_column),
+    ('metacritic_rating', omdb_column('Metascore')),
+    ('plot', omdb_column('Plot')),
+    ('awards', omdb_column('Awards')),
+    ('actors', omdb_column('Actors')),
+    ('writer', omdb_column('Writer')),
+    ('language', omdb_column('Language')),
+    ('country', omdb_column('Country')),
+    ('box_office', omdb_column('BoxOffice')),
+    ('production', omdb_column('Production')),
+]
+CSV_FIELDS = [field for field, _ in CSV_COLUMNS]
+CSV_EXTRACTORS = [extract for _, extract in CSV_COLUMNS]
+
+# Parquet dtypes for the TMDb columns; OMDb values are kept as the API's strings
+TV_SHOW_DATASET = storage.Dataset(CSV_FIELDS, types={
+    'id': 'int', 'first_air_date': 'date', 'last_air_date': 'date',
+    'number_of_episodes': 'int', 'number_of_seasons': 'int', 'popularity': 'float',
+    'vote_average': 'float', 'vote_count': 'int', 'in_production': 'bool'
+})
+
+def tv_show_to_values(item):
+    return [extract(item) for extract in CSV_EXTRACTORS]
+
+def tv_show_to_row(item):
+    return dict(zip(CSV_FIELDS, tv_show_to_values(item)))
+
+def save_to_csv(data, filename, batch_size=CSV_BATCH_SIZE, storage_format='csv'):
+    """Write shows from any iterable, flushing every `batch_size` rows."""
+    if storage_format != 'csv':
+        filename = storage.dataset_path(filename, storage_format)
+        row_count = storage.write_table((tv_show_to_row(item) for item in data), filename,
+                                        TV_SHOW_DATASET, storage_format, batch_size)
+        print(f"Data saved to {filename}" if row_count else f"No data to save for {filename}")
+        return row_count
+    # Written beside the old catalog and swapped in only if rows came back,
+    # so an empty or failed discover leaves the existing file in place
+    row_count = 0
+    tmp_filename = filename + '.tmp'
+    try:
+        with open(tmp_filename, 'w', newline='', encoding='utf-8') as output_file:
+            writer = csv.writer(output_file)
+            writer.writerow(CSV_FIELDS)
+            batch = []
             for item in data:
-                row = {}
-                # Extract TMDb fields
-                for field in fields:
-                    if field in [
-                        'id', 'name', 'original_name', 'overview', 'first_air_date',
-                        'last_air_date', 'number_of_episodes', 'number_of_seasons',
-                        'original_language', 'popularity', 'vote_average', 'vote_count',
-                        'status', 'type', 'homepage', 'in_production', 'tagline'
-                    ]:
-                        value = item.get(field, '')
-                        if isinstance(value, bool):
-                            value = str(value)
-                        elif value is None:
-                            value = ''
-                        row[field] = value
-                    elif field == 'genres':
-                        value = ', '.join([genre['name'] for genre in item.get('genres', [])])
-                        row[field] = value
-                    elif field == 'origin_country':
-                        value = ', '.join(item.get('origin_country', []))
-                        row[field] = value
-                    elif field == 'languages':
-                        value = ', '.join(item.get('languages', []))
-                        row[field] = value
-                    elif field == 'episode_run_time':
-                        value = ', '.join(map(str, item.get('episode_run_time', [])))
-                        row[field] = value
-                    elif field == 'created_by':
-                        value = ', '.join([creator['name'] for creator in item.get('created_by', [])])
-                        row[field] = value
-                    elif field == 'networks':
-                        value = ', '.join([network['name'] for network in item.get('networks', [])])
-                        row[field] = value
-                    # Extract OMDb fields
-                    elif field in ['imdb_rating', 'imdb_votes', 'rotten_tomatoes_rating',
-                                   'metacritic_rating', 'plot', 'awards', 'actors',
-                                   'writer', 'language', 'country', 'box_office', 'production']:
-                        omdb_data = item.get('omdb_data', {})
-                        if field == 'imdb_rating':
-                            row[field] = omdb_data.get('imdbRating', '')
-                        elif field == 'imdb_votes':
-                            row[field] = omdb_data.get('imdbVotes', '')
-                        elif field == 'rotten_tomatoes_rating':
-                            ratings = omdb_data.get('Ratings', [])
-                            rt_rating = next((r['Value'] for r in ratings if r['Source'] == 'Rotten Tomatoes'), '')
-                            row[field] = rt_rating
-                        elif field == 'metacritic_rating':
-                            row[field] = omdb_data.get('Metascore', '')
-                        elif field == 'plot':
-                            row[field] = omdb_data.get('Plot', '')
-                        elif field == 'awards':
-                            row[field] = omdb_data.get('Awards', '')
-                        elif field == 'actors':
-                            row[field] = omdb_data.get('Actors', '')
-                        elif field == 'writer':
-                            row[field] = omdb_data.get('Writer', '')
-                        elif field == 'language':
-                            row[field] = omdb_data.get('Language', '')
-                        elif field == 'country':
-                            row[field] = omdb_data.get('Country', '')
-                        elif field == 'box_office':
-                            row[field] = omdb_data.get('BoxOffice', '')
-                        elif field == 'production':
-                            row[field] = omdb_data.get('Production', '')
-                dict_writer.writerow(row)
+                batch.append(tv_show_to_values(item))
+                if len(batch) >= batch_size:
+                    with registry.timer('write_duration_seconds', table='tv_shows'):
+                        writer.writerows(batch)
+                        output_file.flush()
+                    row_count += len(batch)
+                    batch = []
+            if batch:
+                with registry.timer('write_duration_seconds', table='tv_shows'):
+                    writer.writerows(batch)
+                row_count += len(batch)
+    except BaseException:
+        os.remove(tmp_filename)
+        raise
+    registry.count('rows_written_total', row_count, table='tv_shows')
+    if row_count:
+        os.replace(tmp_filename, filename)
         print(f"Data saved to {filename}")
     else:
+        os.remove(tmp_filename)
         print(f"No data to save for {filename}")
+    return row_count
+
+def merge_into_csv(data, removed_ids, filename, storage_format='csv'):
+    """Update changed rows in place, append new ones and drop removed shows."""
+    if storage_format != 'csv':
+        storage.merge_table([tv_show_to_row(item) for item in data], filename, TV_SHOW_DATASET,
+                            'id', removed_ids, storage_format)
+    else:
+        merge_csv_rows(data, removed_ids, filename)
+    print(f"Merged {len(data)} updated and {len(removed_ids)} removed shows into {filename}")
+
+def merge_csv_rows(data, removed_ids, filename):
+    rows = {}
+    if os.path.exists(filename):
+        with open(filename, 'r', newline='', encoding='utf-8') as input_file:
+            for row in csv.DictReader(input_file):
+                rows[row['id']] = row
+    for tv_id in removed_ids:
+        rows.pop(str(tv_id), None)
+    for item in data:
+        rows[str(item['id'])] = tv_show_to_row(item)
+
+    tmp_filename = filename + '.tmp'
+    with open(tmp_filename, 'w', newline='', encoding='utf-8') as output_file:
+        dict_writer = csv.DictWriter(output_file, fieldnames=CSV_FIELDS)
+        dict_writer.writeheader()
+        dict_writer.writerows(rows.values())
+    os.replace(tmp_filename, filename)
+
+def collect_tv_shows(output_csv, incremental=False, storage_format='csv'):
+    """Fetch the catalog into `output_csv`, merging only changed shows when incremental."""
+    if incremental and os.path.exists(output_csv):
+        state = load_show_state()
+        tv_shows, removed_ids = fetch_tv_shows_incremental(state)
+        merge_into_csv(tv_shows, removed_ids, output_csv, storage_format)
+        save_show_state(state)
+    else:
+        # Stream rows to disk as enrichment finishes, seeding the incremental state
+        state = {'last_run': time.time(), 'shows': {}}
+
+        def tracked(tv_shows):
+            for details in tv_shows:
+                state['shows'][str(details['id'])] = show_state_entry(details, state['last_run'])
+                yield details
+
+        if save_to_csv(tracked(iter_tv_shows()), output_csv, storage_format=storage_format):
+            # OMDb backfill needs the whole catalog to prioritize, so it is merged afterwards
+            backfilled = backfill_omdb(active_tv_ids=set(state['shows']))
+            if backfilled:
+                merge_into_csv(backfilled, [], output_csv, storage_format)
+            save_show_state(state)
+    http_cache.log_stats()
 
 def main():
+    parser = argparse.ArgumentParser(description='Collect TV shows available on Paramount Plus.')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Only enrich new or changed shows and merge them into the existing CSV')
+    parser.add_argument('--format', choices=storage.STORAGE_FORMATS,
+                        default=getattr(config, 'STORAGE_FORMAT', 'csv'), help='Output table format')
+    args = parser.parse_args()
+    output_csv = storage.dataset_path('paramount_plus_tv_shows.csv', args.format)
+
     print("Starting to fetch TV shows available on Paramount Plus...")
-    tv_shows = fetch_tv_shows()
-    save_to_csv(tv_shows, 'paramount_plus_tv_shows.csv')
+    try:
+        collect_tv_shows(output_csv, args.incremental, args.format)
+    except DiscoverError as e:
+        logging.error(f"Discover failed, keeping the existing catalog and state: {e}")
+        print(f"Discover failed, keeping the existing catalog and state: {e}")
+    http_cache.close()
+    omdb_scheduler.close()
+    registry.export('collect_tv_shows')
+    print(registry.summary())
 
 if __name__ == '__main__':
     main()
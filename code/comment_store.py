@@ -0,0 +1,216 @@
+# comment_store.py
+
+import os
+import json
+import time
+import sqlite3
+
+COMMENT_FIELDS = [
+    'submission_id', 'comment_id', 'parent_id', 'body', 'author',
+    'created_utc', 'score', 'is_submitter'
+]
+
+
+# Marks a submission fetched with its stored comment count and newest comment time
+MARK_SUBMISSION = (
+    'INSERT OR REPLACE INTO submissions'
+    ' (submission_id, comment_count, fetched_at, latest_created_utc, num_comments)'
+    " SELECT ?, COUNT(*), ?, MAX(CAST(strftime('%s', created_utc) AS REAL)), ?"
+    ' FROM comments WHERE submission_id = ?'
+)
+
+
+class CommentStore:
+    """SQLite store of Reddit comments keyed on comment_id.
+
+    Writes are upserts, so re-fetching a submission never duplicates rows and
+    later score/body edits replace the stored values. The submission index and
+    the committed length of the CSV export live in the same database, so one
+    transaction commits all three together. The CSV only ever gains new rows;
+    the store holds the latest values, and `updated_since_export` counts the
+    row updates the CSV has not caught up with. Submissions a crawl left at its
+    MoreComments budget keep their unexpanded stubs until they are marked fetched.
+    """
+
+    def __init__(self, db_path):
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.conn = sqlite3.connect(db_path, timeout=30)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=FULL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS comments ('
+            ' comment_id TEXT PRIMARY KEY,'
+            ' submission_id TEXT,'
+            ' parent_id TEXT,'
+            ' body TEXT,'
+            ' author TEXT,'
+            ' created_utc TEXT,'
+            ' score INTEGER,'
+            ' is_submitter TEXT)'
+        )
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_comments_submission ON comments (submission_id)')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS submissions ('
+            ' submission_id TEXT PRIMARY KEY,'
+            ' comment_count INTEGER,'
+            ' fetched_at REAL,'
+            ' latest_created_utc REAL,'
+            ' num_comments INTEGER)'
+        )
+        # Stores created before the refresh high-water marks existed
+        columns = {row[1] for row in self.conn.execute('PRAGMA table_info(submissions)')}
+        for column, column_type in (('latest_created_utc', 'REAL'), ('num_comments', 'INTEGER')):
+            if column not in columns:
+                self.conn.execute(f'ALTER TABLE submissions ADD COLUMN {column} {column_type}')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS unexpanded ('
+            ' submission_id TEXT PRIMARY KEY,'
+            ' stubs TEXT,'
+            ' saved_at REAL)'
+        )
+        self.conn.commit()
+
+    def get_meta(self, key, default=None):
+        row = self.conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else default
+
+    def _set_meta(self, key, value):
+        self.conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, str(value)))
+
+    def csv_offset(self):
+        return int(self.get_meta('csv_offset', 0))
+
+    def updated_since_export(self):
+        return int(self.get_meta('updated_since_export', 0))
+
+    def is_empty(self):
+        return self.conn.execute('SELECT 1 FROM submissions LIMIT 1').fetchone() is None
+
+    def completed_submissions(self):
+        return dict(self.conn.execute('SELECT submission_id, comment_count FROM submissions'))
+
+    def submission_marks(self):
+        """Return {submission_id: (comment_count, num_comments, latest_created_utc)}."""
+        cursor = self.conn.execute(
+            'SELECT submission_id, comment_count, num_comments, latest_created_utc FROM submissions'
+        )
+        return {row[0]: row[1:] for row in cursor}
+
+    def set_num_comments(self, counts):
+        # counts: iterable of (submission_id, num_comments) as last reported by the API
+        with self.conn:
+            self.conn.executemany(
+                'UPDATE submissions SET num_comments = ? WHERE submission_id = ?',
+                [(num_comments, submission_id) for submission_id, num_comments in counts]
+            )
+
+    def save_unexpanded(self, submission_id, stubs):
+        # stubs: the MoreComments a budget-capped crawl left, as dicts a later crawl expands
+        with self.conn:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO unexpanded (submission_id, stubs, saved_at) VALUES (?, ?, ?)',
+                (submission_id, json.dumps(stubs), time.time())
+            )
+
+    def unexpanded(self, submission_ids):
+        """Return {submission_id: stubs} for the given submissions that have any saved."""
+        submission_ids = list(submission_ids)
+        found = {}
+        for start in range(0, len(submission_ids), 500):
+            chunk = submission_ids[start:start + 500]
+            placeholders = ','.join('?' * len(chunk))
+            found.update((row[0], json.loads(row[1])) for row in self.conn.execute(
+                f'SELECT submission_id, stubs FROM unexpanded WHERE submission_id IN ({placeholders})', chunk
+            ))
+        return found
+
+    def _clear_unexpanded(self, submission_ids):
+        self.conn.executemany('DELETE FROM unexpanded WHERE submission_id = ?',
+                              [(submission_id,) for submission_id in submission_ids])
+
+    def new_comment_ids(self, comment_ids):
+        """Return the subset of comment_ids not stored yet (primary-key lookups only)."""
+        comment_ids = list(comment_ids)
+        existing = set()
+        for start in range(0, len(comment_ids), 500):
+            chunk = comment_ids[start:start + 500]
+            placeholders = ','.join('?' * len(chunk))
+            existing.update(row[0] for row in self.conn.execute(
+                f'SELECT comment_id FROM comments WHERE comment_id IN ({placeholders})', chunk
+            ))
+        return set(comment_ids) - existing
+
+    def _upsert(self, rows):
+        before = self.conn.total_changes
+        self.conn.executemany(
+            'INSERT INTO comments (comment_id, submission_id, parent_id, body, author,'
+            ' created_utc, score, is_submitter)'
+            ' VALUES (:comment_id, :submission_id, :parent_id, :body, :author,'
+            ' :created_utc, :score, :is_submitter)'
+            ' ON CONFLICT(comment_id) DO UPDATE SET'
+            ' body = excluded.body, author = excluded.author, score = excluded.score'
+            ' WHERE body IS NOT excluded.body OR author IS NOT excluded.author'
+            ' OR score IS NOT excluded.score',
+            rows
+        )
+        return self.conn.total_changes - before
+
+    def commit_rows(self, rows, csv_offset, new_count, mark_submissions=True):
+        """Upsert rows spanning any number of submissions (e.g. from dump files).
+
+        Unless `mark_submissions` is False, touched submissions are marked fetched
+        with their stored comment count. Returns the number of changed existing rows.
+        """
+        submission_ids = {row['submission_id'] for row in rows}
+        with self.conn:
+            updated = self._upsert(rows) - new_count
+            if mark_submissions:
+                self.conn.executemany(
+                    MARK_SUBMISSION,
+                    [(submission_id, time.time(), None, submission_id) for submission_id in submission_ids]
+                )
+                self._clear_unexpanded(submission_ids)
+            self._set_meta('csv_offset', csv_offset)
+            if updated:
+                self._set_meta('updated_since_export', self.updated_since_export() + updated)
+        return updated
+
+    def mark_submission_fetched(self, submission_id, num_comments=None):
+        """Record the submission's high-water marks; num_comments is the API's count, if known."""
+        with self.conn:
+            self.conn.execute(MARK_SUBMISSION, (submission_id, time.time(), num_comments, submission_id))
+            self._clear_unexpanded([submission_id])
+
+    def import_rows(self, rows):
+        """Load previously exported rows, e.g. from a CSV written before the store existed."""
+        with self.conn:
+            self._upsert(rows)
+
+    def finish_import(self, csv_offset):
+        # Rebuild the submission index from the imported comments
+        with self.conn:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO submissions (submission_id, comment_count, fetched_at, latest_created_utc)'
+                " SELECT submission_id, COUNT(*), ?, MAX(CAST(strftime('%s', created_utc) AS REAL))"
+                ' FROM comments GROUP BY submission_id', (time.time(),)
+            )
+            self._set_meta('csv_offset', csv_offset)
+
+    def count_comments(self):
+        return self.conn.execute('SELECT COUNT(*) FROM comments').fetchone()[0]
+
+    def iter_comments(self):
+        columns = ', '.join(COMMENT_FIELDS)
+        cursor = self.conn.execute(f'SELECT {columns} FROM comments ORDER BY rowid')
+        for row in cursor:
+            yield dict(zip(COMMENT_FIELDS, row))
+
+    def finish_export(self, csv_offset):
+        # The CSV was rewritten from the store and matches it again
+        with self.conn:
+            self._set_meta('csv_offset', csv_offset)
+            self._set_meta('updated_since_export', 0)
+
+    def close(self):
+        self.conn.close()
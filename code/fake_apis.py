@@ -0,0 +1,240 @@
+# fake_apis.py
+#
+# Local stand-ins for the TMDb, OMDb and Reddit APIs, serving deterministic
+# synthetic data with configurable latency and injected 429s. Used by
+# benchmark.py so collector throughput can be measured without network access.
+
+import re
+import json
+import zlib
+import time
+import random
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+# Reddit stops listing search results after about this many
+SEARCH_RESULT_CAP = 1000
+
+
+class FakeApiHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out in separate writes; without this, delayed ACKs add ~40 ms per call
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.dispatch(parse_qs(urlsplit(self.path).query))
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length).decode('utf-8')
+        self.dispatch(parse_qs(body))
+
+    def dispatch(self, params):
+        apis = self.server.apis
+        path = urlsplit(self.path).path.rstrip('/')
+        params = {key: values[0] for key, values in params.items()}
+        if path == '/api/v1/access_token':
+            # Token requests are never throttled, so every client can start
+            return self.reply(200, {'access_token': 'fake', 'token_type': 'bearer', 'expires_in': 86400, 'scope': '*'})
+
+        apis.count_request(path)
+        time.sleep(apis.delay())
+        if apis.should_throttle():
+            return self.reply(429, {'message': 'Too Many Requests', 'error': 429},
+                              {'Retry-After': str(apis.retry_after)})
+        for pattern, route in apis.routes:
+            match = pattern.fullmatch(path)
+            if match:
+                return self.reply(200, route(params, *match.groups()), apis.reddit_headers(path))
+        self.reply(404, {'message': f'no fake route for {path}'})
+
+    def reply(self, status, payload, headers=None):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class FakeApis:
+    """One local HTTP server answering TMDb, OMDb and Reddit routes.
+
+    TMDb lives under /3, OMDb under /omdb and Reddit at the root, so one base
+    URL serves all three. Each request waits `latency` seconds (plus up to
+    `jitter`) and is answered with a 429 with probability `throttle_rate`.
+    Reddit search finds `search_results` posts per show, or `hot_search_results`
+    for the shows in `hot_shows`, paged by `after` and capped like Reddit's.
+    """
+
+    def __init__(self, shows=200, comments_per_submission=200, page_size=50, latency=0.02, jitter=0.0,
+                 throttle_rate=0.0, retry_after=0.1, seed=0, search_results=30, hot_search_results=1500,
+                 hot_shows=('Show 1',)):
+        self.shows = shows
+        self.search_results = search_results
+        self.hot_search_results = hot_search_results
+        self.hot_shows = set(hot_shows)
+        self.comments_per_submission = comments_per_submission
+        self.page_size = page_size
+        self.latency = latency
+        self.jitter = jitter
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = {}
+        self.throttled = 0
+        self.routes = [
+            (re.compile(r'/3/discover/tv'), self.discover),
+            (re.compile(r'/3/tv/(\d+)'), self.tv_details),
+            (re.compile(r'/3/tv/(\d+)/external_ids'), self.external_ids),
+            (re.compile(r'/omdb'), self.omdb),
+            (re.compile(r'/r/([^/]+)/search'), self.search),
+            (re.compile(r'/comments/(\w+)'), self.submission_comments),
+            (re.compile(r'/api/morechildren'), self.more_children),
+        ]
+        self.server = None
+
+    def start(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), FakeApiHandler)
+        self.server.daemon_threads = True
+        self.server.apis = self
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self.base_url
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    @property
+    def base_url(self):
+        return f'http://127.0.0.1:{self.server.server_address[1]}'
+
+    def count_request(self, path):
+        endpoint = re.sub(r'/\d+(?=/|$)', '/{id}', path)
+        with self.lock:
+            self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+
+    def delay(self):
+        with self.lock:
+            return self.latency + self.random.uniform(0, self.jitter)
+
+    def should_throttle(self):
+        with self.lock:
+            throttle = self.random.random() < self.throttle_rate
+            self.throttled += throttle
+            return throttle
+
+    def reddit_headers(self, path):
+        if path.startswith('/3/') or path.startswith('/omdb'):
+            return {}
+        # A generous window so the client's own pacing is not what is measured
+        return {'X-Ratelimit-Remaining': '1000', 'X-Ratelimit-Reset': '600', 'X-Ratelimit-Used': '0'}
+
+    # TMDb and OMDb
+
+    def discover(self, params):
+        page = int(params.get('page', 1))
+        total_pages = max(1, -(-self.shows // 20))
+        ids = range((page - 1) * 20 + 1, min(page * 20, self.shows) + 1)
+        return {'page': page, 'total_pages': total_pages, 'total_results': self.shows,
+                'results': [{'id': tv_id, 'name': f'Show {tv_id}'} for tv_id in ids]}
+
+    def tv_details(self, params, tv_id):
+        tv_id = int(tv_id)
+        return {
+            'id': tv_id, 'name': f'Show {tv_id}', 'original_name': f'Show {tv_id}',
+            'overview': 'A synthetic show served by the benchmark stand-in.', 'first_air_date': '2020-01-01',
+            'last_air_date': '2024-06-30', 'number_of_episodes': 40, 'number_of_seasons': 4,
+            'genres': [{'id': 18, 'name': 'Drama'}], 'origin_country': ['US'], 'original_language': 'en',
+            'popularity': 1000.0 / tv_id, 'vote_average': 7.5, 'vote_count': 100, 'status': 'Returning Series',
+            'type': 'Scripted', 'homepage': '', 'in_production': True, 'languages': ['en'],
+            'episode_run_time': [45], 'tagline': '', 'created_by': [{'name': 'Jane Doe'}],
+            'networks': [{'name': 'Paramount+'}],
+        }
+
+    def external_ids(self, params, tv_id):
+        return {'id': int(tv_id), 'imdb_id': f'tt{int(tv_id):07d}'}
+
+    def omdb(self, params):
+        return {
+            'Response': 'True', 'imdbID': params.get('i'), 'imdbRating': '8.1', 'imdbVotes': '12,345',
+            'Ratings': [{'Source': 'Rotten Tomatoes', 'Value': '87%'}], 'Metascore': '74', 'Plot': 'Things happen.',
+            'Awards': 'N/A', 'Actors': 'A, B', 'Writer': 'W', 'Language': 'English', 'Country': 'United States',
+            'BoxOffice': 'N/A', 'Production': 'N/A',
+        }
+
+    # Reddit
+
+    def submission_data(self, submission_id, subreddit='television', title='A post'):
+        return {
+            'id': submission_id, 'name': f't3_{submission_id}', 'title': title, 'selftext': '',
+            'created_utc': 1.7e9, 'subreddit': subreddit, 'author': 'poster', 'score': 10,
+            'num_comments': self.comments_per_submission, 'url': f'https://reddit.com/{submission_id}',
+            'permalink': f'/r/{subreddit}/comments/{submission_id}/',
+        }
+
+    def comment_thing(self, submission_id, index):
+        comment_id = f'{submission_id}c{index}'
+        return {'kind': 't1', 'data': {
+            'id': comment_id, 'name': f't1_{comment_id}', 'parent_id': f't3_{submission_id}',
+            'link_id': f't3_{submission_id}', 'body': f'Comment {index} about the show', 'author': f'user{index % 97}',
+            'created_utc': 1.7e9 + index, 'score': index % 50, 'is_submitter': False, 'replies': '',
+            'subreddit': 'television', 'depth': 0,
+        }}
+
+    def more_thing(self, submission_id, start):
+        children = [f'{submission_id}c{index}'
+                    for index in range(start, min(start + self.page_size, self.comments_per_submission))]
+        return {'kind': 'more', 'data': {
+            'id': children[0], 'name': f't1_{children[0]}', 'parent_id': f't3_{submission_id}',
+            'count': len(children), 'children': children, 'depth': 0,
+        }}
+
+    def search_hits(self, query):
+        # Every quoted show's posts, interleaved, up to the listing's cap
+        names = re.findall(r'"([^"]+)"', query) or ['Unknown']
+        per_show = [self.hot_search_results if name in self.hot_shows else self.search_results for name in names]
+        hits = []
+        for index in range(max(per_show)):
+            hits += [(name, f's{zlib.crc32(f"{name}/{index}".encode()):x}')
+                     for name, results in zip(names, per_show) if index < results]
+        return hits[:SEARCH_RESULT_CAP]
+
+    def search(self, params, subreddits):
+        # Each post title names the show it was found for
+        hits = self.search_hits(params.get('q', ''))
+        limit = min(int(params.get('limit', 25)), 100)
+        start = 0
+        if params.get('after'):
+            start = [f't3_{submission_id}' for _, submission_id in hits].index(params['after']) + 1
+        page = hits[start:start + limit]
+        children = [{'kind': 't3', 'data': self.submission_data(
+            submission_id, subreddits.split('+')[0], f'Talking about {name}'
+        )} for name, submission_id in page]
+        after = f't3_{page[-1][1]}' if page and start + limit < len(hits) else None
+        return {'kind': 'Listing', 'data': {'children': children, 'after': after, 'before': None}}
+
+    def submission_comments(self, params, submission_id):
+        # The first page inline, the rest behind MoreComments stubs of page_size each
+        first_page = [self.comment_thing(submission_id, index)
+                      for index in range(min(self.page_size, self.comments_per_submission))]
+        stubs = [self.more_thing(submission_id, start)
+                 for start in range(self.page_size, self.comments_per_submission, self.page_size)]
+        submission = {'kind': 'Listing', 'data': {
+            'children': [{'kind': 't3', 'data': self.submission_data(submission_id)}], 'after': None, 'before': None
+        }}
+        comments = {'kind': 'Listing', 'data': {'children': first_page + stubs, 'after': None, 'before': None}}
+        return [submission, comments]
+
+    def more_children(self, params):
+        submission_id = params['link_id'].split('_', 1)[1]
+        things = [self.comment_thing(submission_id, int(child.rsplit('c', 1)[1]))
+                  for child in params['children'].split(',')]
+        return {'json': {'errors': [], 'data': {'things': things}}}
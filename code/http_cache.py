@@ -0,0 +1,144 @@
+# http_cache.py
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import logging
+
+from rate_limiter import get_with_backoff
+
+# Query parameters that identify the caller rather than the resource
+IGNORED_PARAMS = ('api_key', 'apikey')
+
+
+class HttpCache:
+    """SQLite-backed JSON response cache with per-call TTLs, LRU eviction
+    and ETag/Last-Modified revalidation."""
+
+    def __init__(self, db_path, max_entries=100000):
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS responses ('
+            ' key TEXT PRIMARY KEY,'
+            ' url TEXT,'
+            ' body TEXT,'
+            ' etag TEXT,'
+            ' last_modified TEXT,'
+            ' fetched_at REAL,'
+            ' last_access REAL)'
+        )
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_last_access ON responses (last_access)')
+        self.conn.commit()
+        self.writes_since_evict = 0
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'revalidated': 0,
+            'stores': 0,
+            'evictions': 0
+        }
+
+    def _count(self, name):
+        with self.lock:
+            self.stats[name] += 1
+
+    def make_key(self, url, params):
+        items = sorted((k, str(v)) for k, v in (params or {}).items() if k not in IGNORED_PARAMS)
+        raw = url + '?' + '&'.join(f'{k}={v}' for k, v in items)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def _lookup(self, key):
+        with self.lock:
+            return self.conn.execute(
+                'SELECT body, etag, last_modified, fetched_at FROM responses WHERE key = ?', (key,)
+            ).fetchone()
+
+    def is_fresh(self, url, params, ttl):
+        row = self._lookup(self.make_key(url, params))
+        return row is not None and time.time() - row[3] < ttl
+
+    def _touch(self, key, fetched_at=None):
+        now = time.time()
+        with self.lock:
+            if fetched_at is None:
+                self.conn.execute('UPDATE responses SET last_access = ? WHERE key = ?', (now, key))
+            else:
+                self.conn.execute(
+                    'UPDATE responses SET last_access = ?, fetched_at = ? WHERE key = ?',
+                    (now, fetched_at, key)
+                )
+            self.conn.commit()
+
+    def _store(self, key, url, data, etag, last_modified):
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (key, url, json.dumps(data), etag, last_modified, now, now)
+            )
+            self.stats['stores'] += 1
+            self.writes_since_evict += 1
+            if self.writes_since_evict >= 1000:
+                self._evict()
+            self.conn.commit()
+
+    def _evict(self):
+        # Caller holds the lock; drop the least recently used rows over the cap
+        self.writes_since_evict = 0
+        count = self.conn.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+        excess = count - self.max_entries
+        if excess > 0:
+            self.conn.execute(
+                'DELETE FROM responses WHERE key IN '
+                '(SELECT key FROM responses ORDER BY last_access LIMIT ?)', (excess,)
+            )
+            self.stats['evictions'] += excess
+
+    def get(self, session, url, params, ttl, limiter=None):
+        """Return (status_code, json_data); network calls only on a miss or stale entry."""
+        key = self.make_key(url, params)
+        row = self._lookup(key)
+        headers = {}
+        if row is not None:
+            body, etag, last_modified, fetched_at = row
+            if time.time() - fetched_at < ttl:
+                self._count('hits')
+                self._touch(key)
+                return 200, json.loads(body)
+            if etag:
+                headers['If-None-Match'] = etag
+            if last_modified:
+                headers['If-Modified-Since'] = last_modified
+
+        response = get_with_backoff(session, url, params=params, headers=headers, limiter=limiter)
+
+        if response.status_code == 304 and row is not None:
+            self._count('revalidated')
+            self._touch(key, fetched_at=time.time())
+            return 200, json.loads(row[0])
+
+        self._count('misses')
+        if response.status_code != 200:
+            return response.status_code, None
+        data = response.json()
+        self._store(key, url, data, response.headers.get('ETag'), response.headers.get('Last-Modified'))
+        return 200, data
+
+    def log_stats(self):
+        logging.info(f"HTTP cache stats: {self.stats}")
+        print(f"HTTP cache: {self.stats['hits']} hits, {self.stats['misses']} misses, "
+              f"{self.stats['revalidated']} revalidated")
+
+    def close(self):
+        with self.lock:
+            self._evict()
+            self.conn.commit()
+            self.conn.close()
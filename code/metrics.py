@@ -0,0 +1,207 @@
+# metrics.py
+#
+# In-process metrics for the collectors: latency histograms, counters and
+# peak RSS, exported as JSON and Prometheus text so a run can be compared
+# with the last one. Every module records into the shared `registry`;
+# worker processes drain theirs and the parent merges the snapshots.
+
+import os
+import re
+import sys
+import json
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+# Upper bounds in seconds; the last bucket is +Inf
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+METRICS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'logs', 'metrics')
+
+
+def endpoint_label(url):
+    """host/path with numeric ids folded, e.g. api.themoviedb.org/3/tv/{id}/external_ids."""
+    parts = urlsplit(url)
+    # The first segment is kept, since it is an API version like /3 rather than an id
+    head, _, tail = parts.path.strip('/').partition('/')
+    tail = re.sub(r'(^|/)\d+(?=/|$)', r'\1{id}', tail)
+    return parts.netloc + '/' + head + ('/' + tail if tail else '')
+
+
+def peak_rss_bytes():
+    """Peak RSS of this process and its finished pool workers, or None where unknown."""
+    try:
+        import resource  # POSIX only
+    except ImportError:
+        return None
+    usage = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # ru_maxrss is in bytes on macOS and kilobytes on Linux
+    return usage if sys.platform == 'darwin' else usage * 1024
+
+
+def label_key(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def histogram_quantile(buckets, counts, q):
+    """Estimate a quantile from bucket counts, interpolating inside the bucket."""
+    total = sum(counts)
+    if not total:
+        return None
+    rank = q * total
+    cumulative, lower = 0, 0.0
+    for bound, count in zip(list(buckets) + [float('inf')], counts):
+        if count and cumulative + count >= rank:
+            if bound == float('inf'):
+                return lower
+            return lower + (bound - lower) * (rank - cumulative) / count
+        cumulative += count
+        lower = bound
+    return lower
+
+
+class Metrics:
+    """Thread-safe counters and histograms keyed on a name plus labels."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.started = time.time()
+            self.counters = {}
+            self.histograms = {}
+
+    def count(self, name, value=1, **labels):
+        key = (name, label_key(labels))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        key = (name, label_key(labels))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = {'counts': [0] * (len(self.buckets) + 1), 'sum': 0.0}
+            index = next((i for i, bound in enumerate(self.buckets) if seconds <= bound), len(self.buckets))
+            histogram['counts'][index] += 1
+            histogram['sum'] += seconds
+
+    @contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'counters': [{'name': name, 'labels': dict(labels), 'value': value}
+                             for (name, labels), value in sorted(self.counters.items())],
+                'histograms': [{'name': name, 'labels': dict(labels), 'buckets': list(self.buckets),
+                                'counts': list(histogram['counts']), 'sum': histogram['sum']}
+                               for (name, labels), histogram in sorted(self.histograms.items())],
+            }
+
+    def drain(self):
+        """Snapshot and clear, e.g. in a worker before handing results back."""
+        snapshot = self.snapshot()
+        with self.lock:
+            self.counters = {}
+            self.histograms = {}
+        return snapshot
+
+    def merge(self, snapshot):
+        for counter in snapshot['counters']:
+            self.count(counter['name'], counter['value'], **counter['labels'])
+        with self.lock:
+            for entry in snapshot['histograms']:
+                key = (entry['name'], label_key(entry['labels']))
+                histogram = self.histograms.setdefault(
+                    key, {'counts': [0] * (len(self.buckets) + 1), 'sum': 0.0}
+                )
+                histogram['counts'] = [a + b for a, b in zip(histogram['counts'], entry['counts'])]
+                histogram['sum'] += entry['sum']
+
+    def counter_total(self, name, **labels):
+        """Sum of a counter over every label set matching `labels`."""
+        wanted = set(label_key(labels))
+        with self.lock:
+            return sum(value for (counter, key), value in self.counters.items()
+                       if counter == name and wanted <= set(key))
+
+    def to_json(self):
+        snapshot = self.snapshot()
+        elapsed = time.time() - self.started
+        for entry in snapshot['histograms']:
+            count = sum(entry['counts'])
+            entry['count'] = count
+            entry['mean'] = entry['sum'] / count if count else None
+            for q in (0.5, 0.95, 0.99):
+                entry[f'p{int(q * 100)}'] = histogram_quantile(entry['buckets'], entry['counts'], q)
+        rates = [{'name': counter['name'].replace('_total', '_per_second'), 'labels': counter['labels'],
+                  'value': counter['value'] / elapsed if elapsed else None}
+                 for counter in snapshot['counters'] if counter['name'].startswith('rows_')]
+        return dict(snapshot, rates=rates, elapsed_seconds=elapsed, peak_rss_bytes=peak_rss_bytes())
+
+    def to_prometheus(self):
+        def render(labels, **extra):
+            labels = dict(labels, **extra)
+            if not labels:
+                return ''
+            return '{' + ','.join(f'{key}="{value}"' for key, value in sorted(labels.items())) + '}'
+
+        snapshot = self.snapshot()
+        lines = []
+        for counter in snapshot['counters']:
+            if not any(line.startswith(f"# TYPE {counter['name']} ") for line in lines):
+                lines.append(f"# TYPE {counter['name']} counter")
+            lines.append(f"{counter['name']}{render(counter['labels'])} {counter['value']}")
+        for entry in snapshot['histograms']:
+            if not any(line.startswith(f"# TYPE {entry['name']} ") for line in lines):
+                lines.append(f"# TYPE {entry['name']} histogram")
+            cumulative = 0
+            for bound, count in zip(entry['buckets'] + ['+Inf'], entry['counts']):
+                cumulative += count
+                lines.append(f"{entry['name']}_bucket{render(entry['labels'], le=bound)} {cumulative}")
+            lines.append(f"{entry['name']}_sum{render(entry['labels'])} {entry['sum']}")
+            lines.append(f"{entry['name']}_count{render(entry['labels'])} {cumulative}")
+        peak_rss = peak_rss_bytes()
+        if peak_rss is not None:
+            lines.append('# TYPE process_peak_rss_bytes gauge')
+            lines.append(f'process_peak_rss_bytes {peak_rss}')
+        return '\n'.join(lines) + '\n'
+
+    def export(self, name, metrics_dir=METRICS_DIR):
+        """Write <name>.json and <name>.prom; returns the JSON path."""
+        os.makedirs(metrics_dir, exist_ok=True)
+        json_path = os.path.join(metrics_dir, f'{name}.json')
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_json(), f, indent=2)
+        with open(os.path.join(metrics_dir, f'{name}.prom'), 'w', encoding='utf-8') as f:
+            f.write(self.to_prometheus())
+        logging.info(f"Metrics written to {json_path}: {self.summary()}")
+        return json_path
+
+    def summary(self):
+        """One line: calls and p95 per endpoint, waits, retries and peak RSS."""
+        parts = []
+        for entry in self.to_json()['histograms']:
+            if entry['name'].endswith('request_duration_seconds'):
+                label = entry['labels'].get('endpoint', entry['name'])
+                parts.append(f"{label} {entry['count']} calls p95 {entry['p95'] * 1000:.0f} ms")
+        parts.append(f"rate-limit wait {self.counter_total('rate_limit_wait_seconds_total'):.1f} s")
+        parts.append(f"retries {self.counter_total('retries_total'):.0f}")
+        peak_rss = peak_rss_bytes()
+        parts.append(f"peak RSS {peak_rss / 1e6:.0f} MB" if peak_rss is not None else "peak RSS n/a")
+        return '; '.join(parts)
+
+
+registry = Metrics()
@@ -0,0 +1,97 @@
+# omdb_scheduler.py
+
+import os
+import time
+import sqlite3
+import threading
+from datetime import datetime, timezone
+
+
+class OmdbScheduler:
+    """Daily OMDb quota ledger plus a popularity-ordered backlog of IMDb ids
+    still waiting for OMDb data. Both persist across runs (and processes)."""
+
+    def __init__(self, db_path, daily_limit, max_attempts=3):
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.daily_limit = daily_limit
+        self.max_attempts = max_attempts
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS quota (day TEXT PRIMARY KEY, used INTEGER NOT NULL)')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS backlog ('
+            ' imdb_id TEXT PRIMARY KEY,'
+            ' tv_id TEXT,'
+            ' popularity REAL,'
+            ' attempts INTEGER NOT NULL DEFAULT 0,'
+            ' added_at REAL)'
+        )
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_popularity ON backlog (popularity DESC)')
+
+    def today(self):
+        # OMDb quotas reset daily; use UTC so every process agrees on the day
+        return datetime.now(timezone.utc).strftime('%Y-%m-%d')
+
+    def used_today(self):
+        with self.lock:
+            row = self.conn.execute('SELECT used FROM quota WHERE day = ?', (self.today(),)).fetchone()
+        return row[0] if row else 0
+
+    def remaining_today(self):
+        return max(0, self.daily_limit - self.used_today())
+
+    def reserve(self):
+        """Atomically take one request from today's quota; False once it is spent."""
+        day = self.today()
+        with self.lock:
+            self.conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = self.conn.execute('SELECT used FROM quota WHERE day = ?', (day,)).fetchone()
+                used = row[0] if row else 0
+                if used >= self.daily_limit:
+                    self.conn.execute('COMMIT')
+                    return False
+                self.conn.execute(
+                    'INSERT INTO quota (day, used) VALUES (?, 1) '
+                    'ON CONFLICT(day) DO UPDATE SET used = used + 1', (day,)
+                )
+                self.conn.execute('COMMIT')
+                return True
+            except sqlite3.Error:
+                self.conn.execute('ROLLBACK')
+                raise
+
+    def enqueue(self, imdb_id, tv_id, popularity):
+        with self.lock:
+            self.conn.execute(
+                'INSERT INTO backlog (imdb_id, tv_id, popularity, added_at) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT(imdb_id) DO UPDATE SET tv_id = excluded.tv_id, popularity = excluded.popularity',
+                (imdb_id, str(tv_id), popularity or 0, time.time())
+            )
+
+    def pending(self, limit):
+        """Most popular backlog entries first, as (imdb_id, tv_id) pairs."""
+        with self.lock:
+            return self.conn.execute(
+                'SELECT imdb_id, tv_id FROM backlog ORDER BY popularity DESC LIMIT ?', (limit,)
+            ).fetchall()
+
+    def backlog_size(self):
+        with self.lock:
+            return self.conn.execute('SELECT COUNT(*) FROM backlog').fetchone()[0]
+
+    def complete(self, imdb_id):
+        with self.lock:
+            self.conn.execute('DELETE FROM backlog WHERE imdb_id = ?', (imdb_id,))
+
+    def fail(self, imdb_id):
+        # Give up on ids that keep failing so they don't hog the daily quota
+        with self.lock:
+            self.conn.execute('UPDATE backlog SET attempts = attempts + 1 WHERE imdb_id = ?', (imdb_id,))
+            self.conn.execute('DELETE FROM backlog WHERE imdb_id = ? AND attempts >= ?',
+                              (imdb_id, self.max_attempts))
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
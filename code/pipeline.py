@@ -0,0 +1,341 @@
+# pipeline.py
+#
+# Runs the collectors as one resumable DAG on a SQLite work queue:
+#     tv_shows -> mentions -> comments -> sentiment
+# Comment fetching starts as soon as a mention search batch lands rather than
+# after the whole mentions file is written. Failed items are retried with
+# backoff and a crashed run picks up where it stopped. Run from the repo root:
+#     python code/pipeline.py
+#     python code/pipeline.py --status
+#     python code/pipeline.py --retry-failed
+
+import sys
+import os
+import time
+import logging
+import argparse
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+
+# Add the project root directory to sys.path
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+# Ensure the logs directory exists
+logs_dir = os.path.join(project_root, 'logs')
+os.makedirs(logs_dir, exist_ok=True)
+
+# Configure logging before the collectors are imported, so their messages land here too
+logging.basicConfig(
+    filename=os.path.join(logs_dir, 'pipeline.log'),
+    filemode='a',
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+
+import config
+import storage
+import collect_tv_shows
+import collect_tv_mentions
+import collect_tv_comments
+import score_sentiment
+from show_matcher import ShowMatcher
+from rollups import ShowRollups
+from work_queue import WorkQueue
+from metrics import registry
+
+QUEUE_DB = os.path.join(project_root, 'data', 'cache', 'pipeline.sqlite')
+
+RAW_DIR = os.path.join(project_root, 'data', 'raw')
+TV_SHOW_CSV = os.path.join(RAW_DIR, 'paramount_plus_tv_shows.csv')
+MENTIONS_CSV = os.path.join(RAW_DIR, 'reddit_tv_show_mentions.csv')
+COMMENTS_CSV = os.path.join(RAW_DIR, 'reddit_comments.csv')
+SENTIMENT_CSV = os.path.join(RAW_DIR, 'reddit_comment_sentiment.csv')
+
+# `after`: stages that must finish before this one is seeded and can finish.
+# A streamed stage gets its items from upstream handlers and runs them at once.
+STAGES = {
+    'tv_shows': {'after': [], 'streamed': False},
+    'mentions': {'after': ['tv_shows'], 'streamed': False},
+    'comments': {'after': ['mentions'], 'streamed': True},
+    'sentiment': {'after': ['comments'], 'streamed': False},
+}
+
+# Longest sleep while waiting for a backed-off item to become ready
+POLL_INTERVAL = 5
+
+
+def downstream_of(names):
+    """`names` plus every stage that depends on them, in DAG order."""
+    found = set(names)
+    for name, stage in STAGES.items():
+        if found & set(stage['after']):
+            found.add(name)
+    return [name for name in STAGES if name in found]
+
+
+def search_batch(query):
+    # Runs on a search thread; errors propagate so the queue can retry the batch
+    client = collect_tv_mentions.thread_client()
+    return list(collect_tv_mentions.iter_search(client, query, collect_tv_mentions.SUBREDDITS))
+
+
+def run_sentiment(workers):
+    if not os.path.exists(COMMENTS_CSV):
+        return 0, 0, {}
+    rollups = ShowRollups()
+    try:
+        return score_sentiment.score_comments(COMMENTS_CSV, SENTIMENT_CSV, workers, rollups=rollups)
+    finally:
+        rollups.close()
+
+
+class Pipeline:
+    """Schedules queue items onto thread and process pools; this process is the single writer.
+
+    Workers only fetch or compute. Results are written to the comment store,
+    the rollups and the queue here, store first, so an item interrupted
+    before it is marked done is simply run again and the upserts absorb it.
+    """
+
+    def __init__(self, work_queue, workers, budget, storage_format, export_csv=False):
+        self.queue = work_queue
+        self.workers = workers
+        self.budget = budget
+        self.storage_format = storage_format
+        self.export_csv = export_csv
+        self.store = collect_tv_comments.open_comment_store(COMMENTS_CSV)
+        self.rollups = ShowRollups()
+        self.matcher = None
+        self.fetched = set(self.store.completed_submissions())
+        self.concurrency = {
+            'tv_shows': 1, 'mentions': collect_tv_mentions.SEARCH_WORKERS, 'comments': workers, 'sentiment': 1
+        }
+        self.in_flight = {}
+
+    def tv_show_path(self):
+        return storage.find_dataset(TV_SHOW_CSV)
+
+    def mention_matcher(self):
+        if self.matcher is None:
+            self.matcher = ShowMatcher.from_tv_show_csv(self.tv_show_path())
+        return self.matcher
+
+    # Seeders run once a stage's upstream stages are finished
+
+    def seed_items(self, name):
+        if name == 'tv_shows':
+            return [('catalog', {})]
+        if name == 'mentions':
+            tv_show_names = collect_tv_mentions.read_tv_show_list(self.tv_show_path())
+            batches = collect_tv_mentions.build_query_batches(tv_show_names)
+            logging.info(f"Seeding {len(batches)} search batches for {len(tv_show_names)} TV shows")
+            return [(query, {'query': query, 'names': names}) for query, names in batches]
+        if name == 'sentiment':
+            return [('all', {})]
+        return []
+
+    def submit(self, name, key, payload):
+        if name == 'tv_shows':
+            # Incremental once the catalog exists, so a new run only enriches changed shows
+            output_csv = storage.dataset_path(TV_SHOW_CSV, self.storage_format)
+            return self.threads.submit(collect_tv_shows.collect_tv_shows, output_csv, True, self.storage_format)
+        if name == 'mentions':
+            return self.threads.submit(search_batch, payload['query'])
+        if name == 'comments':
+            resume = self.store.unexpanded([key]).get(key)
+            return self.processes.submit(collect_tv_comments.fetch_worker, (key, None, None, resume))
+        return self.threads.submit(run_sentiment, None)
+
+    # Handlers run here, in the writer process, with the worker's result
+
+    def handle(self, name, key, payload, result):
+        if name == 'mentions':
+            names = payload['names']
+            rows = collect_tv_mentions.match_posts(self.mention_matcher(), result, names)
+            self.rollups.add_mentions(rows)
+            outputs = [(f"{row['id']}/{row['tv_show_name']}", row) for row in rows]
+            follow_ups = [('comments', submission_id, {})
+                          for submission_id in {row['id'] for row in rows} - self.fetched]
+            # A batch that hit the result cap is searched again in halves, as new mention items
+            halves = collect_tv_mentions.split_capped_batch(names, len(result))
+            follow_ups += [('mentions', query, {'query': query, 'names': part}) for query, part in halves]
+            self.queue.complete(name, key, outputs, follow_ups)
+            logging.info(f"Search batch {key!r}: {len(result)} posts, {len(rows)} show mentions, "
+                         f"{len(follow_ups) - len(halves)} submissions queued for comments"
+                         + (f", split in {len(halves)} after reaching the result cap" if halves else ""))
+        elif name == 'comments':
+            submission_id, comments, stats, worker_metrics = result
+            registry.merge(worker_metrics)
+            if comments is None:
+                raise collect_tv_comments.CommentFetchError(f"fetching comments for {submission_id} failed")
+            new_count, updated_count, comment_count = collect_tv_comments.record_submission(
+                self.store, COMMENTS_CSV, submission_id, comments, rollups=self.rollups, stats=stats
+            )
+            if not stats.get('truncated'):
+                self.fetched.add(submission_id)
+            self.queue.complete(name, key)
+            logging.info(f"Collected {comment_count} comments from submission ID {submission_id} "
+                         f"({new_count} new, {updated_count} updated)")
+        elif name == 'sentiment':
+            rows, scored, _ = result
+            self.queue.complete(name, key)
+            logging.info(f"Scored {scored} new or edited of {rows} comments")
+        else:
+            self.queue.complete(name, key)
+
+    # Finishers write a stage's output once all its items are done
+
+    def finish(self, name):
+        if name == 'mentions':
+            posts = list(self.queue.outputs('mentions'))
+            if posts:
+                output_csv = storage.dataset_path(MENTIONS_CSV, self.storage_format)
+                storage.write_table(collect_tv_mentions.mentions_frame(posts), output_csv,
+                                    collect_tv_mentions.MENTION_DATASET, self.storage_format)
+        elif name == 'comments':
+            collect_tv_comments.export_if_requested(self.store, COMMENTS_CSV, self.export_csv)
+            if self.storage_format == 'parquet':
+                storage.write_table(self.store.iter_comments(), storage.dataset_path(COMMENTS_CSV, 'parquet'),
+                                    collect_tv_comments.COMMENT_DATASET, 'parquet')
+        failed = self.queue.counts().get(name, {}).get('failed')
+        if failed:
+            logging.error(f"Stage {name} finished with {failed} failed items; see --status")
+        self.queue.finish_stage(name)
+        logging.info(f"Stage {name} finished")
+        print(f"Stage {name} finished")
+
+    def schedule(self):
+        """Seed, submit and finish whatever the DAG allows; returns True once every stage is done."""
+        for name, stage in STAGES.items():
+            if self.queue.is_done(name):
+                continue
+            ready = all(self.queue.is_done(upstream) for upstream in stage['after'])
+            if ready and not self.queue.is_seeded(name):
+                self.queue.seed(name, self.seed_items(name))
+            if ready or stage['streamed']:
+                running = sum(1 for stage_name, _, _ in self.in_flight.values() if stage_name == name)
+                for key, payload, _ in self.queue.claim(name, self.concurrency[name] - running):
+                    try:
+                        future = self.submit(name, key, payload)
+                    except BrokenProcessPool:
+                        # A worker died; the items it had in flight fail and are retried
+                        logging.error("Comment worker pool broke; starting a new one")
+                        self.processes.shutdown(wait=False)
+                        self.processes = self.start_processes()
+                        future = self.submit(name, key, payload)
+                    self.in_flight[future] = (name, key, payload)
+            if ready and not self.queue.open_count(name):
+                self.finish(name)
+        return all(self.queue.is_done(name) for name in STAGES)
+
+    def collect(self, future):
+        name, key, payload = self.in_flight.pop(future)
+        try:
+            self.handle(name, key, payload, future.result())
+        except Exception as e:
+            delay = self.queue.fail(name, key, e)
+            if delay is None:
+                logging.error(f"Giving up on {name} item {key!r}: {e}")
+            else:
+                logging.warning(f"{name} item {key!r} failed ({e}); retrying in {delay:.0f} seconds")
+
+    def wait_time(self):
+        # Items that are ready but unclaimed wait for a slot, which only a finished
+        # item frees, so only backed-off items bound the wait
+        next_ready_at = self.queue.next_ready_at(after=time.time())
+        if next_ready_at is None:
+            return None if self.in_flight else POLL_INTERVAL
+        return min(POLL_INTERVAL, max(0.1, next_ready_at - time.time()))
+
+    def start_processes(self):
+        credential_queue = multiprocessing.Queue()
+        for credential in collect_tv_comments.reddit_credentials():
+            credential_queue.put(credential)
+        return ProcessPoolExecutor(max_workers=self.workers, initializer=collect_tv_comments.init_worker,
+                                   initargs=(credential_queue, self.budget))
+
+    def run(self):
+        recovered = self.queue.recover()
+        if recovered:
+            logging.info(f"Resuming: {recovered} items interrupted by the last run are queued again")
+        thread_workers = sum(count for name, count in self.concurrency.items() if name != 'comments')
+        self.threads = ThreadPoolExecutor(max_workers=thread_workers)
+        # Replaced by schedule() if a worker dies and breaks the pool
+        self.processes = self.start_processes()
+        try:
+            with self.threads:
+                while not self.schedule():
+                    if self.in_flight:
+                        done, _ = wait(self.in_flight, timeout=self.wait_time(), return_when=FIRST_COMPLETED)
+                        for future in done:
+                            self.collect(future)
+                    else:
+                        time.sleep(self.wait_time())
+        finally:
+            self.processes.shutdown()
+
+    def close(self):
+        self.store.close()
+        self.rollups.close()
+
+
+def print_status(work_queue):
+    counts = work_queue.counts()
+    for name in STAGES:
+        state = 'done' if work_queue.is_done(name) else 'seeded' if work_queue.is_seeded(name) else 'waiting'
+        statuses = ', '.join(f"{status} {count}" for status, count in sorted(counts.get(name, {}).items()))
+        print(f"{name}: {state}" + (f" ({statuses})" if statuses else ''))
+        for key, attempts, error in work_queue.failures(name)[:10]:
+            print(f"    failed after {attempts} attempts: {key} - {error}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the collectors as one resumable pipeline.')
+    parser.add_argument('--workers', type=int, default=len(collect_tv_comments.reddit_credentials()),
+                        help='Comment-fetching processes; they share one rate limit per OAuth client')
+    parser.add_argument('--more-budget', type=int, default=collect_tv_comments.MORE_COMMENTS_BUDGET,
+                        help='Cap on API calls per submission for expanding collapsed comments (default and 0: no cap)')
+    parser.add_argument('--format', choices=storage.STORAGE_FORMATS,
+                        default=getattr(config, 'STORAGE_FORMAT', 'csv'), help='Output table format')
+    parser.add_argument('--export-csv', action='store_true',
+                        help='Rewrite the comments CSV from the store if stored scores or bodies changed')
+    parser.add_argument('--status', action='store_true', help='Show queue progress and failures, then exit')
+    parser.add_argument('--retry-failed', action='store_true',
+                        help='Queue items that ran out of attempts again, with their downstream stages')
+    parser.add_argument('--restart', action='store_true', help='Discard the current run and start over')
+    args = parser.parse_args()
+
+    work_queue = WorkQueue(QUEUE_DB)
+    if args.status:
+        print_status(work_queue)
+        work_queue.close()
+        return
+
+    if args.retry_failed and not args.restart:
+        stages = work_queue.retry_failed()
+        reopened = downstream_of(stages)
+        work_queue.reopen(reopened, [name for name in reopened
+                                     if name not in stages and not STAGES[name]['streamed']])
+        logging.info(f"Retrying failed items of {', '.join(stages) or 'no stages'}")
+    elif args.restart or all(work_queue.is_done(name) for name in STAGES):
+        # A finished run leaves nothing to resume; the collectors skip work already stored
+        work_queue.reset()
+        logging.info("Starting a new pipeline run")
+
+    pipeline = Pipeline(work_queue, args.workers, args.more_budget or None, args.format, args.export_csv)
+    start = time.perf_counter()
+    try:
+        pipeline.run()
+    finally:
+        pipeline.close()
+    print_status(work_queue)
+    print(f"Pipeline finished in {time.perf_counter() - start:.1f} s")
+    registry.export('pipeline')
+    print(registry.summary())
+    work_queue.close()
+
+
+if __name__ == '__main__':
+    main()
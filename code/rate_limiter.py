@@ -0,0 +1,231 @@
+# rate_limiter.py
+
+import os
+import random
+import threading
+import time
+import sqlite3
+import logging
+
+from metrics import registry, endpoint_label
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `capacity` requests per `period` seconds."""
+
+    def __init__(self, capacity, period, name='api'):
+        self.capacity = capacity
+        self.period = period
+        self.name = name
+        self.tokens = float(capacity)
+        self.fill_rate = capacity / period
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self.last_refill
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.fill_rate)
+        self.last_refill = now
+
+    def acquire(self, tokens=1):
+        # Block until enough tokens are available, then consume them
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait_time = (tokens - self.tokens) / self.fill_rate
+            logging.debug(f"{self.name} rate limit reached. Waiting for {wait_time:.2f} seconds...")
+            registry.count('rate_limit_wait_seconds_total', wait_time, limiter=self.name)
+            time.sleep(wait_time)
+
+
+class SharedTokenBucket:
+    """Token bucket whose state lives in SQLite, so every process that opens the
+    same `db_path` and `name` draws from one budget."""
+
+    def __init__(self, db_path, name, capacity, period):
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.db_path = db_path
+        self.name = name
+        self.capacity = capacity
+        self.period = period
+        self.fill_rate = capacity / period
+        self.conn = None
+        self.pid = None
+
+    def _connect(self):
+        # SQLite connections must not cross a fork, so each process opens its own
+        if self.conn is None or self.pid != os.getpid():
+            self.conn = sqlite3.connect(self.db_path, timeout=60, isolation_level=None)
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute(
+                'CREATE TABLE IF NOT EXISTS buckets (name TEXT PRIMARY KEY, tokens REAL, updated REAL)'
+            )
+            # The server's current rate-limit window, as reported in its headers
+            self.conn.execute(
+                'CREATE TABLE IF NOT EXISTS windows (name TEXT PRIMARY KEY, remaining REAL, reset_at REAL)'
+            )
+            self.pid = os.getpid()
+        return self.conn
+
+    def _try_take(self, tokens):
+        # Returns 0 once the tokens are taken, otherwise the seconds to wait
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            now = time.time()
+            row = conn.execute('SELECT tokens, updated FROM buckets WHERE name = ?', (self.name,)).fetchone()
+            available = self.capacity if row is None else min(
+                self.capacity, row[0] + (now - row[1]) * self.fill_rate
+            )
+            wait_time = 0
+            if available >= tokens:
+                available -= tokens
+            else:
+                wait_time = (tokens - available) / self.fill_rate
+            conn.execute('INSERT OR REPLACE INTO buckets (name, tokens, updated) VALUES (?, ?, ?)',
+                         (self.name, available, now))
+            conn.execute('COMMIT')
+            return wait_time
+        except sqlite3.Error:
+            conn.execute('ROLLBACK')
+            raise
+
+    def set_window(self, remaining, reset_at):
+        """Record the server's remaining budget and reset time for every process."""
+        self._connect().execute('INSERT OR REPLACE INTO windows (name, remaining, reset_at) VALUES (?, ?, ?)',
+                                (self.name, remaining, reset_at))
+
+    def take_from_window(self, tokens):
+        """0 once taken from the server's window, else the seconds to wait; None without a window."""
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            now = time.time()
+            row = conn.execute('SELECT remaining, reset_at FROM windows WHERE name = ?', (self.name,)).fetchone()
+            if row is None or now >= row[1]:
+                wait_time = None
+            elif row[0] >= tokens:
+                conn.execute('UPDATE windows SET remaining = ? WHERE name = ?', (row[0] - tokens, self.name))
+                wait_time = 0
+            else:
+                wait_time = row[1] - now
+            conn.execute('COMMIT')
+            return wait_time
+        except sqlite3.Error:
+            conn.execute('ROLLBACK')
+            raise
+
+    def acquire(self, tokens=1):
+        while True:
+            wait_time = self._try_take(tokens)
+            if not wait_time:
+                return
+            logging.debug(f"{self.name} rate limit reached. Waiting for {wait_time:.2f} seconds...")
+            registry.count('rate_limit_wait_seconds_total', wait_time, limiter=self.name)
+            time.sleep(wait_time)
+
+
+class AdaptiveLimiter:
+    """Paces requests from the server's own rate-limit headers.
+
+    While the server has told us how many requests remain in the current window,
+    requests go out immediately until that budget is spent and then wait for the
+    window to reset. Until headers arrive (or if the API sends none) the
+    `fallback` bucket paces instead. Jittered backoff is used only when the
+    server actually pushes back with a 429.
+
+    With a SharedTokenBucket as the fallback the window is kept in its SQLite
+    file too, so processes sharing one client split the remaining budget
+    instead of each spending all of it.
+    """
+
+    def __init__(self, name, fallback):
+        self.name = name
+        self.fallback = fallback
+        self.shared = fallback if isinstance(fallback, SharedTokenBucket) else None
+        self.remaining = None
+        self.reset_at = None
+        self.lock = threading.Lock()
+
+    def update(self, remaining, reset_at):
+        if self.shared is not None:
+            self.shared.set_window(float(remaining), float(reset_at))
+            return
+        with self.lock:
+            self.remaining = float(remaining)
+            self.reset_at = float(reset_at)
+
+    def update_from_headers(self, headers):
+        headers = {key.lower(): value for key, value in (headers or {}).items()}
+        remaining = headers.get('x-ratelimit-remaining')
+        reset = headers.get('x-ratelimit-reset')
+        if remaining is None or reset is None:
+            return
+        try:
+            remaining, reset = float(remaining), float(reset)
+        except ValueError:
+            return
+        # Reddit sends seconds until reset, others send an epoch timestamp
+        reset_at = reset if reset > 1e9 else time.time() + reset
+        self.update(remaining, reset_at)
+
+    def _take(self, tokens):
+        # 0 once taken, the seconds until the window resets, or None without a window
+        if self.shared is not None:
+            return self.shared.take_from_window(tokens)
+        with self.lock:
+            now = time.time()
+            if self.reset_at is None or now >= self.reset_at:
+                self.remaining = None
+                return None
+            if self.remaining >= tokens:
+                self.remaining -= tokens
+                return 0
+            return self.reset_at - now
+
+    def acquire(self, tokens=1):
+        while True:
+            wait_time = self._take(tokens)
+            if wait_time is None:
+                # No current server window; fall back to our own estimate
+                break
+            if not wait_time:
+                return
+            logging.info(f"{self.name} rate limit window spent. Waiting {wait_time:.2f} seconds for reset...")
+            registry.count('rate_limit_wait_seconds_total', wait_time, limiter=self.name)
+            time.sleep(wait_time)
+        self.fallback.acquire(tokens)
+
+    def backoff(self, attempt, retry_after=None):
+        """Sleep after a 429; honours Retry-After, else jittered exponential backoff."""
+        try:
+            wait_time = float(retry_after)
+        except (TypeError, ValueError):
+            wait_time = min(600, (2 ** attempt) * random.uniform(0.5, 1.5))
+        # Hold every other caller of this limiter until the server is ready again
+        self.update(0, time.time() + wait_time)
+        logging.warning(f"{self.name} pushed back. Waiting {wait_time:.2f} seconds before retrying...")
+        registry.count('retries_total', limiter=self.name, reason='429')
+        registry.count('rate_limit_wait_seconds_total', wait_time, limiter=self.name)
+        time.sleep(wait_time)
+
+
+def get_with_backoff(session, url, params=None, headers=None, limiter=None, max_retries=5):
+    """GET through `limiter`, feeding it response headers and retrying on 429/503."""
+    for attempt in range(max_retries + 1):
+        if limiter is not None:
+            limiter.acquire()
+        with registry.timer('http_request_duration_seconds', endpoint=endpoint_label(url)):
+            response = session.get(url, params=params, headers=headers)
+        registry.count('http_responses_total', endpoint=endpoint_label(url), status=response.status_code)
+        if limiter is None:
+            return response
+        limiter.update_from_headers(response.headers)
+        if response.status_code not in (429, 503) or attempt == max_retries:
+            return response
+        limiter.backoff(attempt + 1, response.headers.get('Retry-After'))
+    return response
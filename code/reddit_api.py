@@ -0,0 +1,112 @@
+# reddit_api.py
+#
+# Reddit clients for the collectors. Every client draws on one rate limit per
+# OAuth client, shared through SQLite by the search threads and the comment
+# workers alike, and every call goes through call_reddit's retries.
+
+import sys
+import os
+import time
+import random
+import logging
+
+import praw
+import prawcore
+
+# Add the project root directory to sys.path
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+import config
+from rate_limiter import SharedTokenBucket, AdaptiveLimiter
+from metrics import registry
+
+# Reddit allows 100 requests per minute per OAuth client
+REDDIT_REQUESTS_PER_MINUTE = 100
+
+# Token buckets shared by every thread and process, one per OAuth client
+LIMITER_DB = os.path.join(project_root, 'data', 'cache', 'reddit_rate_limit.sqlite')
+
+# Attempts per API call before giving up
+MAX_RETRIES = 5
+
+
+class RedditCallError(Exception):
+    pass
+
+
+def reddit_credentials():
+    """OAuth credentials from config.REDDIT_CREDENTIALS, falling back to the single client."""
+    credentials = getattr(config, 'REDDIT_CREDENTIALS', None)
+    if credentials:
+        return credentials
+    return [{
+        'client_id': config.CLIENT_ID,
+        'client_secret': config.CLIENT_SECRET,
+        'user_agent': config.USER_AGENT
+    }]
+
+
+def reddit_client(credential):
+    """A Reddit client and a request tracker drawing on the client's shared rate limit.
+
+    Neither is thread-safe, so each thread or process needs its own pair.
+    """
+    reddit = praw.Reddit(
+        client_id=credential['client_id'],
+        client_secret=credential['client_secret'],
+        user_agent=credential['user_agent']
+    )
+    name = f"reddit:{credential['client_id']}"
+    request_tracker = {
+        'count': 0,
+        'limiter': AdaptiveLimiter(name, SharedTokenBucket(LIMITER_DB, name, REDDIT_REQUESTS_PER_MINUTE, 60))
+    }
+    return reddit, request_tracker
+
+
+def wait_if_needed(request_tracker, requests_needed=1):
+    # The limiter follows Reddit's X-Ratelimit headers and only falls back to the
+    # shared token bucket while no rate-limit window is known
+    request_tracker['limiter'].acquire(requests_needed)
+
+
+def sync_rate_limits(reddit, request_tracker):
+    # prawcore keeps the latest X-Ratelimit-Remaining/Reset values in auth.limits
+    limits = reddit.auth.limits
+    if limits.get('remaining') is not None and limits.get('reset_timestamp') is not None:
+        request_tracker['limiter'].update(limits['remaining'], limits['reset_timestamp'])
+
+
+def exponential_backoff(retries):
+    max_sleep = min(600, (2 ** retries) + random.uniform(0, 1))
+    logging.warning(f"Waiting for {max_sleep:.2f} seconds before retrying...")
+    registry.count('backoff_wait_seconds_total', max_sleep)
+    time.sleep(max_sleep)
+
+
+def call_reddit(reddit, request_tracker, label, call, endpoint='comments'):
+    """Make one rate-limited, counted API call, retrying with backoff.
+
+    `endpoint` names the call in the latency metrics (comments, morechildren,
+    info, search). Raises RedditCallError once MAX_RETRIES attempts failed.
+    """
+    retries = 0
+    while retries < MAX_RETRIES:
+        try:
+            wait_if_needed(request_tracker)
+            request_tracker['count'] += 1
+            with registry.timer('reddit_request_duration_seconds', endpoint=endpoint):
+                result = call()
+            sync_rate_limits(reddit, request_tracker)
+            return result
+        except prawcore.exceptions.TooManyRequests as e:
+            logging.error(f"Received 429 Too Many Requests for {label}: {e}")
+            retries += 1
+            request_tracker['limiter'].backoff(retries, e.response.headers.get('retry-after'))
+        except Exception as e:
+            logging.error(f"Error fetching {label}: {e}")
+            registry.count('retries_total', endpoint=endpoint, reason='error')
+            retries += 1
+            exponential_backoff(retries)
+    raise RedditCallError(label)
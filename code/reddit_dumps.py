@@ -0,0 +1,144 @@
+# reddit_dumps.py
+#
+# Offline ingestion of monthly Reddit dump files (zstd-compressed NDJSON, one
+# submission or comment object per line) as an alternative to the API.
+
+import os
+import json
+import logging
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import zstandard
+
+from show_matcher import ShowMatcher
+
+# Monthly dumps are compressed with a long window
+MAX_WINDOW_SIZE = 2 ** 31
+
+# Decompressed bytes read per step, and lines handed to a worker at a time
+READ_SIZE = 2 ** 22
+BATCH_LINES = 20000
+
+# Per-process filters, set up by init_worker
+worker_filters = {}
+
+
+def iter_dump_lines(path):
+    """Yield raw NDJSON lines from one .zst dump, decompressing in bounded chunks."""
+    with open(path, 'rb') as fh:
+        reader = zstandard.ZstdDecompressor(max_window_size=MAX_WINDOW_SIZE).stream_reader(fh)
+        pending = b''
+        while True:
+            chunk = reader.read(READ_SIZE)
+            if not chunk:
+                break
+            lines = (pending + chunk).split(b'\n')
+            pending = lines.pop()
+            for line in lines:
+                if line:
+                    yield line
+        if pending:
+            yield pending
+
+
+def iter_line_batches(paths, batch_lines=BATCH_LINES):
+    for path in paths:
+        logging.info(f"Reading dump {path}")
+        batch = []
+        for line in iter_dump_lines(path):
+            batch.append(line)
+            if len(batch) >= batch_lines:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+
+def init_worker(subreddits, show_aliases=None, submission_authors=None):
+    worker_filters['subreddits'] = {name.lower() for name in subreddits}
+    worker_filters['matcher'] = ShowMatcher(show_aliases) if show_aliases else None
+    worker_filters['submission_authors'] = submission_authors
+
+
+def decode_submissions(lines):
+    """Decode a batch of submission lines into mention rows, one per matched show."""
+    subreddits = worker_filters['subreddits']
+    matcher = worker_filters['matcher']
+    rows = []
+    for line in lines:
+        try:
+            submission = json.loads(line)
+        except ValueError:
+            continue
+        if (submission.get('subreddit') or '').lower() not in subreddits:
+            continue
+        title = submission.get('title') or ''
+        selftext = submission.get('selftext') or ''
+        for tv_show_name in matcher.find(title + '\n' + selftext):
+            rows.append({
+                'id': submission['id'],
+                'title': title,
+                'selftext': selftext,
+                'created_utc': float(submission['created_utc']),
+                'subreddit': submission['subreddit'],
+                'author': submission.get('author') or '[deleted]',
+                'score': submission.get('score'),
+                'num_comments': submission.get('num_comments'),
+                'url': submission.get('url'),
+                'tv_show_name': tv_show_name
+            })
+    return rows
+
+
+def decode_comments(lines):
+    """Decode a batch of comment lines, keeping comments on known submissions."""
+    subreddits = worker_filters['subreddits']
+    submission_authors = worker_filters['submission_authors']
+    rows = []
+    for line in lines:
+        try:
+            comment = json.loads(line)
+        except ValueError:
+            continue
+        if (comment.get('subreddit') or '').lower() not in subreddits:
+            continue
+        submission_id = (comment.get('link_id') or '')[3:]
+        if submission_id not in submission_authors:
+            continue
+        author = comment.get('author') or '[deleted]'
+        rows.append({
+            'submission_id': submission_id,
+            'comment_id': comment['id'],
+            'parent_id': comment.get('parent_id'),
+            'body': comment.get('body'),
+            'author': author,
+            'created_utc': float(comment['created_utc']),
+            'score': comment.get('score'),
+            # Dumps don't carry is_submitter; derive it from the submission's author
+            'is_submitter': author != '[deleted]' and author == submission_authors[submission_id]
+        })
+    return rows
+
+
+def ingest_dumps(paths, decode, initargs, workers=None):
+    """Fan batches out to a process pool; yields lists of rows in file order."""
+    workers = workers or os.cpu_count()
+    in_flight = deque()
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=initargs) as executor:
+        for batch in iter_line_batches(paths):
+            in_flight.append(executor.submit(decode, batch))
+            # Bound the decompressed lines held in memory
+            if len(in_flight) >= workers * 2:
+                yield in_flight.popleft().result()
+        while in_flight:
+            yield in_flight.popleft().result()
+
+
+def ingest_submission_dumps(paths, subreddits, show_aliases, workers=None):
+    """`show_aliases` maps show names to their aliases, as read by read_show_aliases."""
+    return ingest_dumps(paths, decode_submissions, (subreddits, show_aliases, None), workers)
+
+
+def ingest_comment_dumps(paths, subreddits, submission_authors, workers=None):
+    return ingest_dumps(paths, decode_comments, (subreddits, None, submission_authors), workers)
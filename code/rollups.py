@@ -0,0 +1,298 @@
+# rollups.py
+#
+# Per-show, per-subreddit, per-day aggregates kept up to date from the
+# collectors' batches, so "which shows are trending" is a small indexed query
+# instead of a rescan. Run from the repo root:
+#     python code/rollups.py trending --days 7
+#     python code/rollups.py sync        # replay everything already collected
+
+import sys
+import os
+import sqlite3
+import logging
+import argparse
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+
+# Add the project root directory to sys.path
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+import storage
+
+ROLLUP_DB = os.path.join(project_root, 'data', 'cache', 'show_rollups.sqlite')
+
+# Measures summed per (tv_show_name, subreddit, day)
+ROLLUP_MEASURES = ['mentions', 'mention_score', 'comments', 'comment_score', 'sentiment_sum', 'sentiment_count']
+
+TRENDING_ORDER = ['mentions', 'mention_score', 'comments', 'comment_score', 'avg_sentiment']
+
+
+def to_day(value):
+    """UTC day ('YYYY-MM-DD') of an epoch, a formatted timestamp or a datetime."""
+    if isinstance(value, str):
+        return value[:10]
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d')
+    return datetime.fromtimestamp(float(value), tz=timezone.utc).strftime('%Y-%m-%d')
+
+
+def to_score(value):
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return 0
+
+
+class ShowRollups:
+    """Daily aggregates plus the facts that fed them.
+
+    Each mention, comment and sentiment score remembers what it last
+    contributed, so feeding the same rows again adds nothing and edited scores
+    apply only their difference. A comment counts for every show its
+    submission mentions, including shows matched after the comment arrived.
+    """
+
+    def __init__(self, db_path=ROLLUP_DB):
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.conn = sqlite3.connect(db_path, timeout=30)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS mention_facts ('
+            ' submission_id TEXT,'
+            ' tv_show_name TEXT,'
+            ' subreddit TEXT,'
+            ' day TEXT,'
+            ' score INTEGER,'
+            ' PRIMARY KEY (submission_id, tv_show_name))'
+        )
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS comment_facts ('
+            ' comment_id TEXT PRIMARY KEY,'
+            ' submission_id TEXT,'
+            ' day TEXT,'
+            ' score INTEGER,'
+            ' sentiment REAL)'
+        )
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_comment_facts_submission ON comment_facts (submission_id)')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS daily ('
+            ' tv_show_name TEXT,'
+            ' subreddit TEXT,'
+            ' day TEXT,'
+            ' mentions INTEGER DEFAULT 0,'
+            ' mention_score INTEGER DEFAULT 0,'
+            ' comments INTEGER DEFAULT 0,'
+            ' comment_score INTEGER DEFAULT 0,'
+            ' sentiment_sum REAL DEFAULT 0,'
+            ' sentiment_count INTEGER DEFAULT 0,'
+            ' PRIMARY KEY (tv_show_name, subreddit, day))'
+        )
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_daily_day ON daily (day)')
+        self.conn.commit()
+
+    def _lookup(self, table, key, values, columns):
+        values = list(values)
+        found = {}
+        for start in range(0, len(values), 500):
+            chunk = values[start:start + 500]
+            placeholders = ','.join('?' * len(chunk))
+            for row in self.conn.execute(
+                f'SELECT {key}, {columns} FROM {table} WHERE {key} IN ({placeholders})', chunk
+            ):
+                found.setdefault(row[0], []).append(row[1:])
+        return found
+
+    def _add_daily(self, deltas):
+        # deltas: {(tv_show_name, subreddit, day): [one value per ROLLUP_MEASURES]}
+        columns = ', '.join(ROLLUP_MEASURES)
+        updates = ', '.join(f'{measure} = {measure} + excluded.{measure}' for measure in ROLLUP_MEASURES)
+        self.conn.executemany(
+            f'INSERT INTO daily (tv_show_name, subreddit, day, {columns})'
+            f' VALUES (?, ?, ?, {", ".join("?" * len(ROLLUP_MEASURES))})'
+            f' ON CONFLICT(tv_show_name, subreddit, day) DO UPDATE SET {updates}',
+            [key + tuple(values) for key, values in deltas.items() if any(values)]
+        )
+
+    def _spread_to_shows(self, submission_deltas):
+        # Comment measures are keyed by (submission_id, day); credit every show the submission mentions
+        shows = self._lookup('mention_facts', 'submission_id', {key[0] for key in submission_deltas},
+                             'tv_show_name, subreddit')
+        deltas = {}
+        for (submission_id, day), values in submission_deltas.items():
+            for tv_show_name, subreddit in shows.get(submission_id, []):
+                totals = deltas.setdefault((tv_show_name, subreddit, day), [0] * len(ROLLUP_MEASURES))
+                for position, value in enumerate(values):
+                    totals[position] += value
+        return deltas
+
+    def add_mentions(self, posts):
+        """Feed (post, show) rows as written by collect_tv_mentions."""
+        posts = {(post['id'], post['tv_show_name']): post for post in posts}
+        existing = self._lookup('mention_facts', 'submission_id', {key[0] for key in posts}, 'tv_show_name, score')
+        existing = {(submission_id, tv_show_name): score
+                    for submission_id, rows in existing.items() for tv_show_name, score in rows}
+        new_submissions = {key[0] for key in posts if key not in existing}
+        comment_totals = {}
+        for submission_id in new_submissions:
+            comment_totals[submission_id] = self.conn.execute(
+                'SELECT day, COUNT(*), SUM(score), SUM(COALESCE(sentiment, 0)), COUNT(sentiment)'
+                ' FROM comment_facts WHERE submission_id = ? GROUP BY day', (submission_id,)
+            ).fetchall()
+
+        deltas = {}
+        facts = []
+        for (submission_id, tv_show_name), post in posts.items():
+            day = to_day(post['created_utc'])
+            subreddit = str(post['subreddit'])
+            score = to_score(post['score'])
+            old_score = existing.get((submission_id, tv_show_name))
+            totals = deltas.setdefault((tv_show_name, subreddit, day), [0] * len(ROLLUP_MEASURES))
+            if old_score is None:
+                totals[0] += 1
+                totals[1] += score
+                # Comments that arrived before this show was matched count now
+                for comment_day, count, score_sum, sentiment_sum, sentiment_count in comment_totals[submission_id]:
+                    comment_deltas = deltas.setdefault((tv_show_name, subreddit, comment_day),
+                                                       [0] * len(ROLLUP_MEASURES))
+                    comment_deltas[2] += count
+                    comment_deltas[3] += score_sum or 0
+                    comment_deltas[4] += sentiment_sum or 0
+                    comment_deltas[5] += sentiment_count
+            else:
+                totals[1] += score - old_score
+            facts.append((submission_id, tv_show_name, subreddit, day, score))
+        with self.conn:
+            self.conn.executemany(
+                'INSERT INTO mention_facts (submission_id, tv_show_name, subreddit, day, score)'
+                ' VALUES (?, ?, ?, ?, ?) ON CONFLICT(submission_id, tv_show_name) DO UPDATE SET score = excluded.score',
+                facts
+            )
+            self._add_daily(deltas)
+
+    def add_comments(self, comments):
+        """Feed comment rows (raw or as formatted for the CSV)."""
+        comments = {comment['comment_id']: comment for comment in comments}
+        existing = self._lookup('comment_facts', 'comment_id', comments, 'day, score')
+        submission_deltas = {}
+        facts = []
+        for comment_id, comment in comments.items():
+            score = to_score(comment['score'])
+            old = existing.get(comment_id)
+            # A comment keeps the day it was first counted under
+            day = old[0][0] if old else to_day(comment['created_utc'])
+            totals = submission_deltas.setdefault((comment['submission_id'], day), [0] * len(ROLLUP_MEASURES))
+            if old is None:
+                totals[2] += 1
+                totals[3] += score
+            else:
+                totals[3] += score - old[0][1]
+            facts.append((comment_id, comment['submission_id'], day, score))
+        with self.conn:
+            self.conn.executemany(
+                'INSERT INTO comment_facts (comment_id, submission_id, day, score) VALUES (?, ?, ?, ?)'
+                ' ON CONFLICT(comment_id) DO UPDATE SET score = excluded.score',
+                facts
+            )
+            self._add_daily(self._spread_to_shows(submission_deltas))
+
+    def add_sentiment(self, scores):
+        """Feed (comment_id, polarity) pairs; comments not fed yet are skipped."""
+        scores = dict(scores)
+        existing = self._lookup('comment_facts', 'comment_id', scores, 'submission_id, day, sentiment')
+        submission_deltas = {}
+        updates = []
+        for comment_id, polarity in scores.items():
+            if comment_id not in existing:
+                continue
+            submission_id, day, old = existing[comment_id][0]
+            totals = submission_deltas.setdefault((submission_id, day), [0] * len(ROLLUP_MEASURES))
+            totals[4] += polarity - (old or 0)
+            totals[5] += 0 if old is not None else 1
+            updates.append((polarity, comment_id))
+        with self.conn:
+            self.conn.executemany('UPDATE comment_facts SET sentiment = ? WHERE comment_id = ?', updates)
+            self._add_daily(self._spread_to_shows(submission_deltas))
+
+    def trending(self, start_day=None, end_day=None, limit=20, order_by='mentions', subreddit=None):
+        """Shows ranked over a day range, straight from the daily aggregates."""
+        if order_by not in TRENDING_ORDER:
+            raise ValueError(f"order_by must be one of {', '.join(TRENDING_ORDER)}")
+        where, params = ['1 = 1'], []
+        if start_day:
+            where.append('day >= ?')
+            params.append(start_day)
+        if end_day:
+            where.append('day <= ?')
+            params.append(end_day)
+        if subreddit:
+            where.append('subreddit = ?')
+            params.append(subreddit)
+        query = (
+            'SELECT tv_show_name, SUM(mentions) AS mentions, SUM(mention_score) AS mention_score,'
+            ' SUM(comments) AS comments, SUM(comment_score) AS comment_score,'
+            ' SUM(sentiment_sum) / NULLIF(SUM(sentiment_count), 0) AS avg_sentiment'
+            f' FROM daily WHERE {" AND ".join(where)} GROUP BY tv_show_name'
+            f' ORDER BY {order_by} DESC LIMIT ?'
+        )
+        return pd.read_sql_query(query, self.conn, params=params + [limit])
+
+    def show_daily(self, tv_show_name):
+        """One show's per-day totals across subreddits."""
+        return pd.read_sql_query(
+            'SELECT day, SUM(mentions) AS mentions, SUM(comments) AS comments,'
+            ' SUM(comment_score) AS comment_score,'
+            ' SUM(sentiment_sum) / NULLIF(SUM(sentiment_count), 0) AS avg_sentiment'
+            ' FROM daily WHERE tv_show_name = ? GROUP BY day ORDER BY day',
+            self.conn, params=(tv_show_name,)
+        )
+
+    def close(self):
+        self.conn.close()
+
+
+def sync_all(rollups, mentions_path, comments_path, sentiment_csv, chunk_size=100000):
+    """Replay everything collected so far; safe to repeat since feeding is idempotent."""
+    if os.path.exists(storage.find_dataset(mentions_path)):
+        mentions = storage.read_table(mentions_path, columns=['id', 'tv_show_name', 'subreddit', 'created_utc', 'score'])
+        mentions['created_utc'] = mentions['created_utc'].astype(str)
+        rollups.add_mentions(mentions.to_dict('records'))
+        logging.info(f"Synced {len(mentions)} mentions into the rollups")
+    if os.path.exists(comments_path):
+        for chunk in pd.read_csv(comments_path, usecols=['comment_id', 'submission_id', 'created_utc', 'score'],
+                                 dtype=str, keep_default_na=False, chunksize=chunk_size):
+            rollups.add_comments(chunk.to_dict('records'))
+        logging.info(f"Synced comments from {comments_path} into the rollups")
+    if os.path.exists(sentiment_csv):
+        for chunk in pd.read_csv(sentiment_csv, usecols=['comment_id', 'polarity'], dtype={'comment_id': str},
+                                 chunksize=chunk_size):
+            rollups.add_sentiment(zip(chunk['comment_id'], chunk['polarity']))
+        logging.info(f"Synced sentiment from {sentiment_csv} into the rollups")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Per-show rollups of mentions, comments and sentiment.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    sync_parser = subparsers.add_parser('sync', help='Replay all collected data into the rollups')
+    sync_parser.add_argument('--mentions', default=os.path.join(project_root, 'data', 'raw', 'reddit_tv_show_mentions.csv'))
+    sync_parser.add_argument('--comments', default=os.path.join(project_root, 'data', 'raw', 'reddit_comments.csv'))
+    sync_parser.add_argument('--sentiment', default=os.path.join(project_root, 'data', 'raw', 'reddit_comment_sentiment.csv'))
+    trending_parser = subparsers.add_parser('trending', help='Rank shows over recent days')
+    trending_parser.add_argument('--days', type=int, default=7)
+    trending_parser.add_argument('--limit', type=int, default=20)
+    trending_parser.add_argument('--order-by', choices=TRENDING_ORDER, default='mentions')
+    args = parser.parse_args()
+
+    rollups = ShowRollups()
+    if args.command == 'sync':
+        sync_all(rollups, args.mentions, args.comments, args.sentiment)
+        print(f"Rollups synced into {ROLLUP_DB}")
+    else:
+        start_day = (datetime.now(timezone.utc) - timedelta(days=args.days)).strftime('%Y-%m-%d')
+        print(rollups.trending(start_day, limit=args.limit, order_by=args.order_by).to_string(index=False))
+    rollups.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,195 @@
+# score_sentiment.py
+#
+# TextBlob sentiment for every comment in reddit_comments.csv, written as a
+# sidecar CSV (comment_id, polarity, subjectivity) that joins back on
+# comment_id. Run from the repo root:
+#     python code/score_sentiment.py
+
+import sys
+import os
+import csv
+import time
+import sqlite3
+import hashlib
+import logging
+import argparse
+from collections import deque, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+# Add the project root directory to sys.path
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+from rollups import ShowRollups
+
+# Ensure the logs directory exists
+logs_dir = os.path.join(project_root, 'logs')
+os.makedirs(logs_dir, exist_ok=True)
+
+# Configure logging
+logging.basicConfig(
+    filename=os.path.join(logs_dir, 'sentiment.log'),
+    filemode='a',
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+
+SENTIMENT_FIELDS = ['comment_id', 'polarity', 'subjectivity']
+
+CACHE_DB = os.path.join(project_root, 'data', 'cache', 'sentiment.sqlite')
+
+# Comments read from the CSV at a time, and handed to a worker at a time
+CHUNK_SIZE = 50000
+BATCH_SIZE = 2000
+
+# Chunks being scored at once; bounds memory while keeping every worker busy
+MAX_PENDING_CHUNKS = 2
+
+
+def body_hash(body):
+    return hashlib.blake2b(body.encode('utf-8'), digest_size=8).hexdigest()
+
+
+class SentimentCache:
+    """Scores keyed on comment_id, valid while the body hash still matches."""
+
+    def __init__(self, db_path):
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.conn = sqlite3.connect(db_path, timeout=30)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS scores ('
+            ' comment_id TEXT PRIMARY KEY,'
+            ' body_hash TEXT,'
+            ' polarity REAL,'
+            ' subjectivity REAL)'
+        )
+        self.conn.commit()
+
+    def lookup(self, comment_ids):
+        """Return {comment_id: (body_hash, polarity, subjectivity)} for the stored ids."""
+        comment_ids = list(comment_ids)
+        found = {}
+        for start in range(0, len(comment_ids), 500):
+            chunk = comment_ids[start:start + 500]
+            placeholders = ','.join('?' * len(chunk))
+            for row in self.conn.execute(
+                f'SELECT comment_id, body_hash, polarity, subjectivity FROM scores'
+                f' WHERE comment_id IN ({placeholders})', chunk
+            ):
+                found[row[0]] = row[1:]
+        return found
+
+    def store(self, rows):
+        # rows: (comment_id, body_hash, polarity, subjectivity)
+        with self.conn:
+            self.conn.executemany('INSERT OR REPLACE INTO scores VALUES (?, ?, ?, ?)', rows)
+
+    def close(self):
+        self.conn.close()
+
+
+def score_batch(batch):
+    """Score (comment_id, body_hash, body) tuples; runs in a worker process."""
+    from textblob import TextBlob
+    start = time.perf_counter()
+    rows = []
+    for comment_id, digest, body in batch:
+        sentiment = TextBlob(body).sentiment
+        rows.append((comment_id, digest, sentiment.polarity, sentiment.subjectivity))
+    return os.getpid(), time.perf_counter() - start, rows
+
+
+def plan_chunk(cache, chunk):
+    """Split a chunk into cached scores and (comment_id, body_hash, body) tuples to score."""
+    chunk = chunk.drop_duplicates('comment_id', keep='last')
+    digests = [body_hash(body) for body in chunk['body']]
+    cached = cache.lookup(chunk['comment_id'])
+    scores = {}
+    todo = []
+    for comment_id, digest, body in zip(chunk['comment_id'], digests, chunk['body']):
+        hit = cached.get(comment_id)
+        if hit is not None and hit[0] == digest:
+            scores[comment_id] = hit[1:]
+        else:
+            todo.append((comment_id, digest, body))
+    return list(chunk['comment_id']), scores, todo
+
+
+def score_comments(comments_csv, output_csv, workers=None, cache_db=CACHE_DB, chunk_size=CHUNK_SIZE,
+                   rollups=None):
+    """Score every comment, reusing cached scores; returns (rows, newly_scored, worker stats).
+
+    Polarities also feed `rollups` chunk by chunk; unchanged scores add nothing there.
+    """
+    workers = workers or os.cpu_count()
+    cache = SentimentCache(cache_db)
+    worker_stats = defaultdict(lambda: {'rows': 0, 'seconds': 0.0})
+    total_rows = 0
+    total_scored = 0
+    pending = deque()
+
+    tmp_csv = output_csv + '.tmp'
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        with open(tmp_csv, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(SENTIMENT_FIELDS)
+
+            def finish_oldest():
+                nonlocal total_rows, total_scored
+                comment_ids, scores, futures = pending.popleft()
+                for future in futures:
+                    pid, elapsed, rows = future.result()
+                    worker_stats[pid]['rows'] += len(rows)
+                    worker_stats[pid]['seconds'] += elapsed
+                    # Single writer: workers only score, this process updates the cache
+                    cache.store(rows)
+                    for comment_id, _, polarity, subjectivity in rows:
+                        scores[comment_id] = (polarity, subjectivity)
+                    total_scored += len(rows)
+                # Written in input order so the sidecar lines up with the comments CSV
+                writer.writerows((comment_id,) + tuple(scores[comment_id]) for comment_id in comment_ids)
+                if rollups is not None:
+                    rollups.add_sentiment((comment_id, scores[comment_id][0]) for comment_id in comment_ids)
+                total_rows += len(comment_ids)
+                logging.info(f"Scored {total_rows} comments ({total_scored} new or edited)")
+
+            for chunk in pd.read_csv(comments_csv, usecols=['comment_id', 'body'], dtype=str,
+                                     keep_default_na=False, chunksize=chunk_size):
+                comment_ids, scores, todo = plan_chunk(cache, chunk)
+                futures = [executor.submit(score_batch, todo[start:start + BATCH_SIZE])
+                           for start in range(0, len(todo), BATCH_SIZE)]
+                pending.append((comment_ids, scores, futures))
+                if len(pending) > MAX_PENDING_CHUNKS:
+                    finish_oldest()
+            while pending:
+                finish_oldest()
+    os.replace(tmp_csv, output_csv)
+    cache.close()
+    return total_rows, total_scored, dict(worker_stats)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Score Reddit comment sentiment with TextBlob.')
+    parser.add_argument('--input', default=os.path.join(project_root, 'data', 'raw', 'reddit_comments.csv'))
+    parser.add_argument('--output', default=os.path.join(project_root, 'data', 'raw', 'reddit_comment_sentiment.csv'))
+    parser.add_argument('--workers', type=int, default=None, help='Scoring processes (default: one per CPU)')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    rollups = ShowRollups()
+    rows, scored, worker_stats = score_comments(args.input, args.output, args.workers, rollups=rollups)
+    rollups.close()
+    elapsed = time.perf_counter() - start
+
+    for pid, stats in sorted(worker_stats.items()):
+        rate = stats['rows'] / stats['seconds'] if stats['seconds'] else 0
+        logging.info(f"Worker {pid}: {stats['rows']} comments in {stats['seconds']:.1f} s ({rate:,.0f}/s)")
+        print(f"worker {pid}: {stats['rows']:,} comments, {rate:,.0f} comments/sec")
+    print(f"Scored {scored:,} new or edited of {rows:,} comments in {elapsed:.1f} s; saved to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
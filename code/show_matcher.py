@@ -0,0 +1,274 @@
+# show_matcher.py
+
+import sys
+import os
+import re
+import unicodedata
+import logging
+import argparse
+from collections import deque
+
+import pandas as pd
+
+import storage
+
+# Add the project root directory to sys.path
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+# Aliases shorter than this many characters once normalized are never matched
+MIN_ALIAS_LENGTH = 3
+
+# Aliases made only of these everyday words ("You", "Evil", "The Office") are
+# guarded: they count only when written capitalized outside a sentence start,
+# or followed by a TV cue, or in double quotes, so "thank you" or "at the
+# office" are not mentions. Catalog titles such as Ghosts, Tracker and
+# Survivor are left off: posts about them usually open with the bare name.
+COMMON_WORDS = frozenset("""
+    a about after again against all also always am an and another any are around as at away back bad be
+    because been before being best better between big black blue both boy boys brother but by call came can
+    case city come coming could country day days did do does doing done down each end even ever every evil
+    family far feel fight find fire first for friend friends from game get girl girls give go going good
+    got great had has have he heart her here high him his home house how i if in into is it its just keep
+    kid kids kind king know last late life like line little live long look lost love made make man many
+    may me men mind minds more most mother much must my never new next night no not nothing now of off office
+    old on once one only or other our out over own people place play power real right run said same say
+    school see she show side so some something still stop story such sure take team tell than that the
+    their them then there these they thing things think this those though three through time to today
+    together too true try two under until up us very wait want war was watch way we well were what
+    when where which while who why will wife with without woman women work world would year years yes yet
+    you young your
+""".split())
+
+# Lowercase words allowed inside a capitalized title ("Mayor of Kingstown")
+TITLE_SMALL_WORDS = frozenset('a an and at by for from in of on or the to'.split())
+
+QUOTE_CHARS = '"\u201c\u201d'
+
+# Words that mark the name before them as a show ("Evil season 4", "EVIL S04E02")
+TV_CUES = frozenset(
+    'season seasons episode episodes ep finale premiere premieres trailer spoiler spoilers cast '
+    'renewed cancelled canceled reboot revival'.split()
+)
+SEASON_CODE = re.compile(r"s\d+(e\d+)?")
+
+# Rows per chunk when tagging a CSV
+TAG_CHUNK_SIZE = 100000
+
+NON_WORD = re.compile(r"[^0-9a-z]+")
+WORD = re.compile(r"[0-9A-Za-z]+")
+
+
+def fold_text(text):
+    """Fold accents, spell out '&' and drop apostrophes, keeping case and punctuation."""
+    if not text.isascii():
+        text = unicodedata.normalize('NFKD', text)
+        text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    return text.replace('&', ' and ').replace("'", '').replace('’', '')
+
+
+def normalize_text(text):
+    """Lowercase, fold accents, drop apostrophes and turn punctuation into spaces."""
+    return NON_WORD.sub(' ', fold_text(text).lower()).strip()
+
+
+def is_capitalized(word):
+    # All-caps words are shouting more often than titles
+    return word[:1].isupper() and not (len(word) > 1 and word.isupper())
+
+
+def is_tv_cue(word):
+    word = word.lower()
+    return word in TV_CUES or SEASON_CODE.fullmatch(word) is not None
+
+
+def written_as_title(folded, spans, following=None):
+    """Whether the words at `spans` of `folded` are quoted, or capitalized as a title.
+
+    `following` is the word after them, if any; a TV cue there lets capitalized
+    or all-caps words count even at the start of a sentence.
+    """
+    start, end = spans[0][0], spans[-1][1]
+    opening = folded[start - 1] if start else ''
+    closing = folded[end] if end < len(folded) else ''
+    if opening and closing and opening in QUOTE_CHARS and closing in QUOTE_CHARS:
+        return True
+    words = [folded[word_start:word_end] for word_start, word_end in spans]
+    if following is not None and is_tv_cue(following) and all(word[:1].isupper() for word in words):
+        return True
+    if not all(is_capitalized(word) or (index and word.lower() in TITLE_SMALL_WORDS)
+               for index, word in enumerate(words)):
+        return False
+    before = folded[:start]
+    stripped = before.rstrip()
+    sentence_start = not stripped or stripped[-1] in '.!?' or '\n' in before[len(stripped):]
+    # A capital at the start of a sentence says nothing; a later word has to carry it
+    return not sentence_start or any(is_capitalized(word) for word in words[1:])
+
+
+def alias_variants(name):
+    normalized = normalize_text(name)
+    variants = {normalized}
+    if normalized.startswith('the '):
+        variants.add(normalized[4:])
+    return {variant for variant in variants if len(variant) >= MIN_ALIAS_LENGTH}
+
+
+def read_show_aliases(csv_file):
+    """Map each show name to its aliases: the name itself and its original_name."""
+    df = storage.read_table(csv_file, columns=['name', 'original_name'])
+    aliases = {}
+    for name, original_name in df.dropna(subset=['name']).itertuples(index=False):
+        aliases.setdefault(name, set()).add(name)
+        if isinstance(original_name, str):
+            aliases[name].add(original_name)
+    return aliases
+
+
+class ShowMatcher:
+    """Word-level Aho-Corasick automaton over normalized show names and aliases.
+
+    Matching on whole tokens gives word boundaries for free, and tokens that
+    appear in no show name reset the automaton without touching it, so one
+    linear pass tags a text with every show it mentions. Aliases made only of
+    COMMON_WORDS are kept apart in `guarded` and checked against the original
+    casing and quotes only when they match.
+    """
+
+    def __init__(self, aliases, common_words=COMMON_WORDS):
+        # aliases: {show name: iterable of alias strings}
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [()]
+        # (show name, alias length in tokens) for guarded aliases ending at each state
+        self.guarded = [()]
+        self.vocabulary = set()
+        for tv_show_name, names in aliases.items():
+            for alias in names:
+                for variant in alias_variants(alias):
+                    guarded = all(token in common_words for token in variant.split())
+                    self._add(variant.split(), tv_show_name, guarded)
+        self._build_failure_links()
+
+    @classmethod
+    def from_tv_show_list(cls, tv_show_names):
+        return cls({name: [name] for name in tv_show_names})
+
+    @classmethod
+    def from_tv_show_csv(cls, csv_file):
+        return cls(read_show_aliases(csv_file))
+
+    def _add(self, tokens, tv_show_name, guarded=False):
+        state = 0
+        for token in tokens:
+            self.vocabulary.add(token)
+            next_state = self.goto[state].get(token)
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append(())
+                self.guarded.append(())
+                self.goto[state][token] = next_state
+            state = next_state
+        if guarded:
+            if (tv_show_name, len(tokens)) not in self.guarded[state]:
+                self.guarded[state] = self.guarded[state] + ((tv_show_name, len(tokens)),)
+        elif tv_show_name not in self.output[state]:
+            self.output[state] = self.output[state] + (tv_show_name,)
+
+    def _build_failure_links(self):
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for token, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and token not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                target = self.goto[fallback].get(token, 0)
+                self.fail[next_state] = target if target != next_state else 0
+                # Shorter aliases ending here ("Star Trek" inside "Star Trek Discovery") match too
+                self.output[next_state] = self.output[next_state] + tuple(
+                    name for name in self.output[self.fail[next_state]] if name not in self.output[next_state]
+                )
+                self.guarded[next_state] = self.guarded[next_state] + tuple(
+                    entry for entry in self.guarded[self.fail[next_state]] if entry not in self.guarded[next_state]
+                )
+
+    def find(self, text):
+        """Return the sorted show names mentioned in `text`."""
+        if not isinstance(text, str) or not text:
+            return []
+        goto, fail, output, guarded, vocabulary = self.goto, self.fail, self.output, self.guarded, self.vocabulary
+        folded = fold_text(text)
+        found = set()
+        candidates = []
+        state = 0
+        for index, token in enumerate(NON_WORD.sub(' ', folded.lower()).split()):
+            if token not in vocabulary:
+                state = 0
+                continue
+            while state and token not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(token, 0)
+            if output[state]:
+                found.update(output[state])
+            if guarded[state]:
+                candidates.append((index, guarded[state]))
+        if candidates:
+            # Token i of the lowercased text is word i of the folded one
+            spans = [match.span() for match in WORD.finditer(folded)]
+            for end, entries in candidates:
+                following = folded[slice(*spans[end + 1])] if end + 1 < len(spans) else None
+                for tv_show_name, length in entries:
+                    if tv_show_name not in found and written_as_title(folded, spans[end - length + 1:end + 1],
+                                                                      following):
+                        found.add(tv_show_name)
+        return sorted(found)
+
+    def tag_series(self, series):
+        """Map a text column to lists of mentioned show names."""
+        return series.map(self.find)
+
+    def tag_dataframe(self, df, text_columns, output_column='tv_show_names'):
+        text = df[text_columns[0]].fillna('').astype(str)
+        for column in text_columns[1:]:
+            text = text + '\n' + df[column].fillna('').astype(str)
+        df[output_column] = self.tag_series(text)
+        return df
+
+
+def tag_csv(matcher, input_csv, output_csv, id_column, text_columns, chunksize=TAG_CHUNK_SIZE):
+    """Stream `input_csv` in chunks and write one (id, tv_show_name) row per mention."""
+    total_rows = 0
+    total_mentions = 0
+    header = True
+    for chunk in pd.read_csv(input_csv, usecols=[id_column] + text_columns, dtype=str, chunksize=chunksize):
+        chunk = matcher.tag_dataframe(chunk, text_columns)
+        mentions = chunk[[id_column, 'tv_show_names']].explode('tv_show_names').dropna()
+        mentions = mentions.rename(columns={'tv_show_names': 'tv_show_name'})
+        mentions.to_csv(output_csv, mode='w' if header else 'a', header=header, index=False, encoding='utf-8')
+        header = False
+        total_rows += len(chunk)
+        total_mentions += len(mentions)
+    logging.info(f"Tagged {total_rows} rows from {input_csv}: {total_mentions} show mentions")
+    return total_rows, total_mentions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Tag Reddit comments with the TV shows they mention.')
+    parser.add_argument('--shows', default=os.path.join(project_root, 'data', 'raw', 'paramount_plus_tv_shows.csv'))
+    parser.add_argument('--input', default=os.path.join(project_root, 'data', 'raw', 'reddit_comments.csv'))
+    parser.add_argument('--output', default=os.path.join(project_root, 'data', 'raw', 'reddit_comment_shows.csv'))
+    parser.add_argument('--id-column', default='comment_id')
+    parser.add_argument('--text-columns', nargs='+', default=['body'])
+    args = parser.parse_args()
+
+    matcher = ShowMatcher.from_tv_show_csv(args.shows)
+    rows, mentions = tag_csv(matcher, args.input, args.output, args.id_column, args.text_columns)
+    print(f"Tagged {rows} rows with {mentions} show mentions; saved to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
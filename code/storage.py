@@ -0,0 +1,293 @@
+# storage.py
+#
+# Table storage shared by the collectors. CSV is the original format and stays
+# available as an export; Parquet keeps real dtypes, can be hive-partitioned and
+# lets readers load only the columns and partitions they need.
+
+import os
+import csv
+import shutil
+import logging
+import argparse
+
+import pandas as pd
+
+from metrics import registry
+
+STORAGE_FORMATS = ('csv', 'parquet')
+
+# Rows converted to one Arrow record batch / Parquet row group at a time
+WRITE_BATCH_SIZE = 50000
+
+# Rows per chunk when reading or filtering a CSV
+READ_CHUNK_SIZE = 100000
+
+
+class Dataset:
+    """Column layout of one table and how it is laid out as Parquet.
+
+    `types` maps columns to 'int', 'float', 'bool', 'date' or 'timestamp'; the
+    rest are strings. A 'month' partition column is derived from created_utc.
+    Rows are sorted by `sort_by` within each written batch so row-group
+    statistics can skip data for filters on that column.
+    """
+
+    def __init__(self, fields, types=None, partition_by=(), sort_by=None):
+        self.fields = list(fields)
+        self.types = types or {}
+        self.partition_by = list(partition_by)
+        self.sort_by = sort_by
+
+    @property
+    def columns(self):
+        return self.fields + [column for column in self.partition_by if column not in self.fields]
+
+    def schema(self):
+        import pyarrow as pa
+        arrow_types = {
+            'int': pa.int64(), 'float': pa.float64(), 'bool': pa.bool_(),
+            'date': pa.date32(), 'timestamp': pa.timestamp('s')
+        }
+        return pa.schema([(column, arrow_types.get(self.types.get(column), pa.string()))
+                          for column in self.columns])
+
+    def to_frame(self, rows):
+        """Build a typed DataFrame from dicts, CSV strings or an already typed frame."""
+        df = rows if isinstance(rows, pd.DataFrame) else pd.DataFrame(list(rows), columns=self.fields)
+        df = df.reindex(columns=self.fields)
+        for column in self.fields:
+            kind = self.types.get(column)
+            values = df[column]
+            if kind in ('int', 'float'):
+                values = pd.to_numeric(values.where(values != ''), errors='coerce')
+                df[column] = values.astype('Int64') if kind == 'int' else values.astype('float64')
+            elif kind == 'bool':
+                df[column] = values.map({True: True, False: False, 'True': True, 'False': False}).astype('boolean')
+            elif kind in ('date', 'timestamp'):
+                if pd.api.types.is_numeric_dtype(values):
+                    values = pd.to_datetime(values, unit='s', errors='coerce')
+                else:
+                    values = pd.to_datetime(values.where(values != ''), errors='coerce')
+                df[column] = values.dt.date if kind == 'date' else values
+            else:
+                df[column] = values.astype(object).where(values.notna(), None)
+        if 'month' in self.partition_by:
+            df['month'] = pd.to_datetime(df['created_utc']).dt.strftime('%Y-%m')
+        if self.sort_by:
+            df = df.sort_values(self.sort_by, kind='stable')
+        return df
+
+
+def dataset_path(path, storage_format):
+    """Path of the table `path` (with any extension) in the given format."""
+    return os.path.splitext(path)[0] + ('.parquet' if storage_format == 'parquet' else '.csv')
+
+
+def find_dataset(path):
+    # Readers take whichever copy of the table was written last
+    candidates = [dataset_path(path, storage_format) for storage_format in STORAGE_FORMATS]
+    existing = [candidate for candidate in candidates if os.path.exists(candidate)]
+    if not existing:
+        return dataset_path(path, 'csv')
+    return max(existing, key=os.path.getmtime)
+
+
+def iter_frames(rows, batch_size):
+    if isinstance(rows, pd.DataFrame):
+        for start in range(0, len(rows), batch_size):
+            yield rows.iloc[start:start + batch_size]
+        return
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def replace_path(tmp_path, path):
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    os.replace(tmp_path, path)
+
+
+def write_csv(rows, path, dataset):
+    row_count = 0
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', newline='', encoding='utf-8') as f:
+        if isinstance(rows, pd.DataFrame):
+            rows.to_csv(f, columns=dataset.fields, index=False)
+            row_count = len(rows)
+        else:
+            writer = csv.DictWriter(f, fieldnames=dataset.fields, extrasaction='ignore')
+            writer.writeheader()
+            for batch in iter_frames(rows, WRITE_BATCH_SIZE):
+                writer.writerows(batch)
+                row_count += len(batch)
+    replace_path(tmp_path, path)
+    return row_count
+
+
+def write_parquet(rows, path, dataset, batch_size):
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+
+    schema = dataset.schema()
+    row_count = 0
+
+    def record_batches():
+        nonlocal row_count
+        for batch in iter_frames(rows, batch_size):
+            df = dataset.to_frame(batch)
+            row_count += len(df)
+            yield pa.RecordBatch.from_pandas(df[dataset.columns], schema=schema, preserve_index=False)
+
+    tmp_path = path + '.tmp'
+    if os.path.isdir(tmp_path):
+        shutil.rmtree(tmp_path)
+    if dataset.partition_by:
+        partitioning = ds.partitioning(
+            pa.schema([schema.field(column) for column in dataset.partition_by]), flavor='hive'
+        )
+        # One call per batch: write_dataset pulls iterators from its own threads,
+        # which sources like SQLite cursors do not allow
+        for index, record_batch in enumerate(record_batches()):
+            ds.write_dataset(record_batch, tmp_path, schema=schema, format='parquet',
+                             partitioning=partitioning, basename_template=f'part-{index}-{{i}}.parquet',
+                             existing_data_behavior='overwrite_or_ignore')
+    else:
+        with pq.ParquetWriter(tmp_path, schema) as writer:
+            for record_batch in record_batches():
+                writer.write_table(pa.Table.from_batches([record_batch]))
+    if not row_count:
+        if os.path.isdir(tmp_path):
+            shutil.rmtree(tmp_path)
+        elif os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return 0
+    replace_path(tmp_path, path)
+    return row_count
+
+
+def write_table(rows, path, dataset, storage_format='csv', batch_size=WRITE_BATCH_SIZE):
+    """Replace the table at `path` with `rows` (dicts or a DataFrame); returns the row count.
+
+    The table is written next to `path` and swapped in once complete, so
+    readers never see a half-written file.
+    """
+    if storage_format not in STORAGE_FORMATS:
+        raise ValueError(f"Unknown storage format {storage_format!r}")
+    path = dataset_path(path, storage_format)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    table = os.path.splitext(os.path.basename(path))[0]
+    with registry.timer('write_duration_seconds', table=table):
+        if storage_format == 'parquet':
+            row_count = write_parquet(rows, path, dataset, batch_size)
+        else:
+            row_count = write_csv(rows, path, dataset)
+    registry.count('rows_written_total', row_count, table=table)
+    logging.info(f"Wrote {row_count} rows to {path}")
+    return row_count
+
+
+def merge_table(rows, path, dataset, key, removed_keys=(), storage_format='csv'):
+    """Replace rows sharing `key` with `rows`, drop `removed_keys` and rewrite the table."""
+    updated = dataset.to_frame(rows)
+    removed = dataset.to_frame([{key: value} for value in removed_keys])[key]
+    if os.path.exists(find_dataset(path)):
+        existing = dataset.to_frame(read_table(path, dataset=dataset))
+    else:
+        existing = updated.iloc[:0]
+    existing = existing[~existing[key].isin(set(updated[key]) | set(removed))]
+    return write_table(pd.concat([existing, updated], ignore_index=True), path, dataset, storage_format)
+
+
+def csv_mask(df, filters):
+    mask = pd.Series(True, index=df.index)
+    for column, op, value in filters:
+        values = df[column]
+        if op in ('=', '=='):
+            mask &= values == value
+        elif op == '!=':
+            mask &= values != value
+        elif op == '<':
+            mask &= values < value
+        elif op == '<=':
+            mask &= values <= value
+        elif op == '>':
+            mask &= values > value
+        elif op == '>=':
+            mask &= values >= value
+        elif op == 'in':
+            mask &= values.isin(value)
+        elif op == 'not in':
+            mask &= ~values.isin(value)
+        else:
+            raise ValueError(f"Unsupported filter operator {op!r}")
+    return mask
+
+
+def read_table(path, columns=None, filters=None, dataset=None):
+    """Load a table as a DataFrame, reading only `columns`.
+
+    `filters` is a list of (column, op, value) tuples that must all hold. On
+    Parquet they are pushed down to skip partitions and row groups; on CSV
+    they are applied chunk by chunk. CSV columns are strings unless `dataset`
+    says how to type them.
+    """
+    path = find_dataset(path)
+    if path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        table = pq.read_table(path, columns=columns, filters=filters or None)
+        return table.to_pandas()
+
+    filters = filters or []
+    wanted = None if columns is None else list(dict.fromkeys(list(columns) + [f[0] for f in filters]))
+    if dataset is not None and wanted is not None:
+        # The derived month column needs created_utc
+        wanted = [column for column in wanted if column in dataset.fields] + (
+            ['created_utc'] if 'month' in wanted and 'created_utc' not in wanted else []
+        )
+    chunks = []
+    for chunk in pd.read_csv(path, usecols=wanted, dtype=str, chunksize=READ_CHUNK_SIZE):
+        if dataset is not None:
+            chunk = Dataset(chunk.columns, dataset.types, dataset.partition_by).to_frame(chunk)
+        if filters:
+            chunk = chunk[csv_mask(chunk, filters)]
+        chunks.append(chunk if columns is None else chunk[list(columns)])
+    if not chunks:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(chunks, ignore_index=True)
+
+
+def export_csv(path, csv_path=None, columns=None):
+    """Write a Parquet table out as CSV, one record batch at a time; returns the row count."""
+    import pyarrow.dataset as ds
+    source = ds.dataset(dataset_path(path, 'parquet'), format='parquet', partitioning='hive')
+    csv_path = csv_path or dataset_path(path, 'csv')
+    tmp_path = csv_path + '.tmp'
+    row_count = 0
+    with open(tmp_path, 'w', newline='', encoding='utf-8') as f:
+        for record_batch in source.to_batches(columns=columns):
+            df = record_batch.to_pandas()
+            df.to_csv(f, header=row_count == 0, index=False)
+            row_count += len(df)
+    os.replace(tmp_path, csv_path)
+    logging.info(f"Exported {row_count} rows from {path} to {csv_path}")
+    return row_count
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export a Parquet table as CSV.')
+    parser.add_argument('table', help='Path to the table (.parquet file or partitioned directory)')
+    parser.add_argument('--output', help='CSV to write; defaults to the table path with .csv')
+    args = parser.parse_args()
+    rows = export_csv(args.table, args.output)
+    print(f"Exported {rows} rows to {args.output or dataset_path(args.table, 'csv')}")
+
+
+if __name__ == '__main__':
+    main()
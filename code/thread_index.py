@@ -0,0 +1,224 @@
+# thread_index.py
+#
+# Array-backed index of the comment forest in reddit_comments.csv. Every
+# comment and submission gets an integer slot; the tree lives in flat numpy
+# arrays saved as .npy files and memory-mapped on load. Run from the repo root:
+#     python code/thread_index.py
+
+import sys
+import os
+import json
+import logging
+import argparse
+
+import numpy as np
+import pandas as pd
+
+# Add the project root directory to sys.path
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+import storage
+
+INDEX_DIR = os.path.join(project_root, 'data', 'cache', 'thread_index')
+
+# Arrays written by ThreadIndex.save, one .npy file each
+INDEX_ARRAYS = ['ids', 'sorted_ids', 'sorted_slots', 'parent', 'offsets', 'children',
+                'depth', 'tin', 'size', 'order', 'score_prefix']
+
+
+def strip_kind(fullnames):
+    # "t1_abc" -> "abc"
+    return fullnames.str.slice(3)
+
+
+def group_prefix(values, offsets):
+    """Exclusive running sum of `values` within each CSR group."""
+    totals = np.concatenate(([0], np.cumsum(values)))
+    group_starts = np.repeat(offsets[:-1], np.diff(offsets))
+    return totals[:-1] - totals[group_starts]
+
+
+def children_of(nodes, offsets, children):
+    # All children of `nodes`, gathered in one vectorized step
+    starts = offsets[nodes]
+    counts = offsets[nodes + 1] - starts
+    positions = np.repeat(starts - np.concatenate(([0], np.cumsum(counts)[:-1])), counts)
+    return children[positions + np.arange(counts.sum())]
+
+
+class ThreadIndex:
+    """Comment forest as parent, CSR children, depth and pre-order (Euler tour) arrays.
+
+    Slots 0..n_comments-1 are comments in input order; the submissions follow
+    as roots, so every comment has a parent and depth 1 means top level. The
+    subtree of slot v is order[tin[v]:tin[v] + size[v]], which makes ancestor
+    tests and prefix-sum aggregates O(1) and subtree listings O(subtree).
+    """
+
+    def __init__(self, arrays, meta):
+        self.arrays = arrays
+        self.meta = meta
+        for name, array in arrays.items():
+            setattr(self, name, array)
+        self.n_comments = meta['n_comments']
+
+    @classmethod
+    def build(cls, comments):
+        """Build from a DataFrame with comment_id, parent_id, submission_id and score."""
+        comment_ids = comments['comment_id'].astype(str).to_numpy()
+        submission_ids = pd.unique(comments['submission_id'].astype(str))
+        n_comments, n_nodes = len(comment_ids), len(comment_ids) + len(submission_ids)
+        ids = np.concatenate((comment_ids, submission_ids))
+        if len(pd.unique(comment_ids)) != n_comments:
+            raise ValueError("comment_id values must be unique")
+
+        # Parent slots: a t1_ parent is another comment, anything else (or a
+        # comment missing from the crawl) falls back to the submission root
+        parent_ids = comments['parent_id'].astype(str)
+        parent = pd.Index(comment_ids).get_indexer(
+            strip_kind(parent_ids).where(parent_ids.str.startswith('t1_'), '')
+        )
+        submission_slots = n_comments + pd.Index(submission_ids).get_indexer(comments['submission_id'].astype(str))
+        parent = np.where(parent >= 0, parent, submission_slots)
+        parent = np.concatenate((parent, np.full(len(submission_ids), -1))).astype(np.int32)
+
+        # CSR children, siblings kept in input order
+        has_parent = np.flatnonzero(parent >= 0)
+        children = has_parent[np.argsort(parent[has_parent], kind='stable')].astype(np.int32)
+        offsets = np.concatenate(([0], np.cumsum(np.bincount(parent[has_parent], minlength=n_nodes))))
+
+        # Depth, one vectorized step per level from the roots down
+        depth = np.zeros(n_nodes, dtype=np.int32)
+        levels = [np.arange(n_comments, n_nodes)]
+        while True:
+            level = children_of(levels[-1], offsets, children)
+            if not len(level):
+                break
+            depth[level] = len(levels)
+            levels.append(level)
+        if sum(len(level) for level in levels) != n_nodes:
+            # Comments on a cycle are never reached from a submission
+            raise ValueError("parent_id links form a cycle")
+
+        # Subtree sizes bottom-up, then pre-order entry times top-down
+        size = np.ones(n_nodes, dtype=np.int64)
+        for level in reversed(levels[1:]):
+            np.add.at(size, parent[level], size[level])
+        sibling_prefix = np.empty(n_nodes, dtype=np.int64)
+        sibling_prefix[children] = group_prefix(size[children], offsets)
+        tin = np.zeros(n_nodes, dtype=np.int64)
+        roots = levels[0]
+        tin[roots] = np.concatenate(([0], np.cumsum(size[roots])[:-1]))
+        for level in levels[1:]:
+            tin[level] = tin[parent[level]] + 1 + sibling_prefix[level]
+        order = np.empty(n_nodes, dtype=np.int32)
+        order[tin] = np.arange(n_nodes, dtype=np.int32)
+
+        scores = pd.to_numeric(comments['score'], errors='coerce').fillna(0).to_numpy(dtype=np.int64)
+        scores = np.concatenate((scores, np.zeros(len(submission_ids), dtype=np.int64)))
+        score_prefix = np.concatenate(([0], np.cumsum(scores[order])))
+
+        ids = ids.astype('S')
+        sorted_slots = np.argsort(ids, kind='stable').astype(np.int32)
+        arrays = {
+            'ids': ids, 'sorted_ids': ids[sorted_slots], 'sorted_slots': sorted_slots,
+            'parent': parent, 'offsets': offsets.astype(np.int64), 'children': children,
+            'depth': depth.astype(np.int16 if len(levels) < 2 ** 15 else np.int32),
+            'tin': tin.astype(np.int32), 'size': size.astype(np.int32), 'order': order,
+            'score_prefix': score_prefix
+        }
+        meta = {'n_comments': n_comments, 'n_submissions': len(submission_ids), 'max_depth': len(levels) - 1}
+        return cls(arrays, meta)
+
+    def save(self, index_dir=INDEX_DIR):
+        os.makedirs(index_dir, exist_ok=True)
+        for name in INDEX_ARRAYS:
+            np.save(os.path.join(index_dir, f'{name}.npy'), self.arrays[name])
+        with open(os.path.join(index_dir, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump(self.meta, f)
+
+    @classmethod
+    def load(cls, index_dir=INDEX_DIR):
+        """Memory-map a saved index; arrays are paged in only as queries touch them."""
+        with open(os.path.join(index_dir, 'meta.json'), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        arrays = {name: np.load(os.path.join(index_dir, f'{name}.npy'), mmap_mode='r')
+                  for name in INDEX_ARRAYS}
+        return cls(arrays, meta)
+
+    def slots(self, ids):
+        """Slots for comment or submission ids (without t1_/t3_), -1 where unknown."""
+        keys = np.asarray(ids, dtype='S')
+        positions = np.searchsorted(self.sorted_ids, keys)
+        positions = np.minimum(positions, len(self.sorted_ids) - 1)
+        found = self.sorted_ids[positions] == keys
+        return np.where(found, self.sorted_slots[positions], -1)
+
+    def slot(self, id_):
+        return int(self.slots([id_])[0])
+
+    def is_comment(self, slot):
+        return slot < self.n_comments
+
+    def replies(self, slot):
+        """Direct replies, in input order."""
+        return self.children[self.offsets[slot]:self.offsets[slot + 1]]
+
+    def reply_count(self, slot):
+        return int(self.offsets[slot + 1] - self.offsets[slot])
+
+    def subtree(self, slot):
+        """The slot and all its descendants, in pre-order."""
+        return self.order[self.tin[slot]:self.tin[slot] + self.size[slot]]
+
+    def is_ancestor(self, ancestor, slot):
+        return self.tin[ancestor] <= self.tin[slot] < self.tin[ancestor] + self.size[ancestor]
+
+    def subtree_score(self, slot):
+        return int(self.score_prefix[self.tin[slot] + self.size[slot]] - self.score_prefix[self.tin[slot]])
+
+    def subtree_sums(self, values):
+        """Per-slot sums of `values` (indexed by slot) over each subtree, for every slot at once."""
+        prefix = np.concatenate(([0], np.cumsum(np.asarray(values)[self.order])))
+        tin = np.asarray(self.tin, dtype=np.int64)
+        return prefix[tin + self.size] - prefix[tin]
+
+    def top_level(self):
+        return np.flatnonzero(self.depth[:self.n_comments] == 1)
+
+    def comment_frame(self):
+        """One row per comment: depth, direct replies, descendants and subtree score."""
+        n = self.n_comments
+        tin = np.asarray(self.tin[:n], dtype=np.int64)
+        size = np.asarray(self.size[:n], dtype=np.int64)
+        return pd.DataFrame({
+            'comment_id': self.ids[:n].astype(str),
+            'depth': self.depth[:n],
+            'reply_count': np.diff(self.offsets)[:n],
+            'descendant_count': size - 1,
+            'subtree_score': self.score_prefix[tin + size] - self.score_prefix[tin],
+        })
+
+
+def build_index(comments_path, index_dir=INDEX_DIR):
+    comments = storage.read_table(comments_path, columns=['comment_id', 'parent_id', 'submission_id', 'score'])
+    index = ThreadIndex.build(comments.drop_duplicates('comment_id', keep='last'))
+    index.save(index_dir)
+    logging.info(f"Indexed {index.meta['n_comments']} comments in {index.meta['n_submissions']} "
+                 f"submissions into {index_dir}")
+    return index
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the comment-thread index.')
+    parser.add_argument('--input', default=os.path.join(project_root, 'data', 'raw', 'reddit_comments.csv'))
+    parser.add_argument('--output', default=INDEX_DIR)
+    args = parser.parse_args()
+    index = build_index(args.input, args.output)
+    print(f"Indexed {index.meta['n_comments']:,} comments in {index.meta['n_submissions']:,} submissions "
+          f"(max depth {index.meta['max_depth']}); saved to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
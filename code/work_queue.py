@@ -0,0 +1,208 @@
+# work_queue.py
+
+import os
+import time
+import json
+import random
+import sqlite3
+
+
+class WorkQueue:
+    """Durable per-stage work items for the pipeline, in SQLite.
+
+    Items are keyed on (stage, key) and enqueued with INSERT OR IGNORE, so
+    re-seeding after a crash never redoes finished work. An item moves
+    pending -> running -> done, or back to pending with a backoff delay when
+    it fails, until max_attempts leaves it failed. Items still running when a
+    process died are put back to pending by recover().
+    """
+
+    def __init__(self, db_path, max_attempts=5, base_delay=30, max_delay=900):
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.conn = sqlite3.connect(db_path, timeout=30)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=FULL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS stages ('
+            ' name TEXT PRIMARY KEY,'
+            ' seeded INTEGER NOT NULL DEFAULT 0,'
+            ' done INTEGER NOT NULL DEFAULT 0,'
+            ' updated_at REAL)'
+        )
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS items ('
+            ' stage TEXT,'
+            ' key TEXT,'
+            ' payload TEXT,'
+            " status TEXT NOT NULL DEFAULT 'pending',"
+            ' attempts INTEGER NOT NULL DEFAULT 0,'
+            ' not_before REAL NOT NULL DEFAULT 0,'
+            ' error TEXT,'
+            ' updated_at REAL,'
+            ' PRIMARY KEY (stage, key))'
+        )
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_items_ready ON items (stage, status, not_before)')
+        # Rows a stage produced, kept until the stage writes its output table
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS outputs ('
+            ' stage TEXT,'
+            ' key TEXT,'
+            ' value TEXT,'
+            ' PRIMARY KEY (stage, key))'
+        )
+        self.conn.commit()
+
+    def reset(self):
+        """Forget every stage, item and output to start a fresh run."""
+        with self.conn:
+            for table in ('stages', 'items', 'outputs'):
+                self.conn.execute(f'DELETE FROM {table}')
+
+    def recover(self):
+        """Put items left running by a crashed process back in the queue; returns how many."""
+        with self.conn:
+            cursor = self.conn.execute(
+                "UPDATE items SET status = 'pending', updated_at = ? WHERE status = 'running'", (time.time(),)
+            )
+        return cursor.rowcount
+
+    def _stage_flag(self, name, flag):
+        row = self.conn.execute(f'SELECT {flag} FROM stages WHERE name = ?', (name,)).fetchone()
+        return bool(row and row[0])
+
+    def is_seeded(self, name):
+        return self._stage_flag(name, 'seeded')
+
+    def is_done(self, name):
+        return self._stage_flag(name, 'done')
+
+    def _set_stage(self, name, **flags):
+        self.conn.execute('INSERT OR IGNORE INTO stages (name) VALUES (?)', (name,))
+        for flag, value in flags.items():
+            self.conn.execute(f'UPDATE stages SET {flag} = ?, updated_at = ? WHERE name = ?',
+                              (int(value), time.time(), name))
+
+    def seed(self, name, items):
+        """Enqueue a stage's initial (key, payload) items and mark it seeded, atomically."""
+        with self.conn:
+            self._enqueue(name, items)
+            self._set_stage(name, seeded=True)
+
+    def finish_stage(self, name):
+        with self.conn:
+            self._set_stage(name, done=True)
+
+    def reopen(self, names, reset_items=()):
+        """Mark stages unfinished again; items of the stages in `reset_items` run again."""
+        with self.conn:
+            for name in names:
+                self._set_stage(name, done=False)
+            for name in reset_items:
+                self.conn.execute(
+                    "UPDATE items SET status = 'pending', attempts = 0, not_before = 0 WHERE stage = ?", (name,)
+                )
+
+    def _enqueue(self, stage, items):
+        self.conn.executemany(
+            'INSERT OR IGNORE INTO items (stage, key, payload, updated_at) VALUES (?, ?, ?, ?)',
+            [(stage, key, json.dumps(payload), time.time()) for key, payload in items]
+        )
+
+    def enqueue(self, stage, items):
+        with self.conn:
+            self._enqueue(stage, items)
+
+    def claim(self, stage, limit):
+        """Mark up to `limit` ready items running; returns [(key, payload, attempts)]."""
+        if limit <= 0:
+            return []
+        now = time.time()
+        with self.conn:
+            rows = self.conn.execute(
+                "SELECT key, payload, attempts FROM items WHERE stage = ? AND status = 'pending'"
+                ' AND not_before <= ? ORDER BY not_before, rowid LIMIT ?', (stage, now, limit)
+            ).fetchall()
+            self.conn.executemany(
+                "UPDATE items SET status = 'running', updated_at = ? WHERE stage = ? AND key = ?",
+                [(now, stage, key) for key, _, _ in rows]
+            )
+        return [(key, json.loads(payload), attempts) for key, payload, attempts in rows]
+
+    def complete(self, stage, key, outputs=(), follow_ups=()):
+        """Mark an item done, saving its (key, value) outputs and enqueuing (stage, key, payload) follow-ups."""
+        with self.conn:
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO outputs (stage, key, value) VALUES (?, ?, ?)',
+                [(stage, output_key, json.dumps(value)) for output_key, value in outputs]
+            )
+            for follow_stage, follow_key, payload in follow_ups:
+                self._enqueue(follow_stage, [(follow_key, payload)])
+            self.conn.execute(
+                "UPDATE items SET status = 'done', error = NULL, updated_at = ? WHERE stage = ? AND key = ?",
+                (time.time(), stage, key)
+            )
+
+    def backoff_delay(self, attempts):
+        # Exponential with jitter so retried items spread out
+        return min(self.max_delay, self.base_delay * 2 ** (attempts - 1)) * random.uniform(0.5, 1)
+
+    def fail(self, stage, key, error):
+        """Count a failed attempt; returns the retry delay, or None once the item is given up."""
+        attempts = self.conn.execute(
+            'SELECT attempts FROM items WHERE stage = ? AND key = ?', (stage, key)
+        ).fetchone()[0] + 1
+        delay = self.backoff_delay(attempts) if attempts < self.max_attempts else None
+        with self.conn:
+            self.conn.execute(
+                'UPDATE items SET status = ?, attempts = ?, not_before = ?, error = ?, updated_at = ?'
+                ' WHERE stage = ? AND key = ?',
+                ('failed' if delay is None else 'pending', attempts, time.time() + (delay or 0),
+                 str(error), time.time(), stage, key)
+            )
+        return delay
+
+    def retry_failed(self):
+        """Give every failed item a fresh set of attempts; returns the stages that had any."""
+        stages = [row[0] for row in self.conn.execute("SELECT DISTINCT stage FROM items WHERE status = 'failed'")]
+        with self.conn:
+            self.conn.execute(
+                "UPDATE items SET status = 'pending', attempts = 0, not_before = 0 WHERE status = 'failed'"
+            )
+        return stages
+
+    def open_count(self, stage):
+        """Items of a stage that are pending or running."""
+        return self.conn.execute(
+            "SELECT COUNT(*) FROM items WHERE stage = ? AND status IN ('pending', 'running')", (stage,)
+        ).fetchone()[0]
+
+    def next_ready_at(self, after=0):
+        """Earliest time a pending item backed off past `after` becomes ready, or None."""
+        row = self.conn.execute(
+            "SELECT MIN(not_before) FROM items WHERE status = 'pending' AND not_before > ?", (after,)
+        ).fetchone()
+        return row[0]
+
+    def counts(self):
+        """Return {stage: {status: count}}."""
+        counts = {}
+        for stage, status, count in self.conn.execute(
+            'SELECT stage, status, COUNT(*) FROM items GROUP BY stage, status'
+        ):
+            counts.setdefault(stage, {})[status] = count
+        return counts
+
+    def failures(self, stage):
+        return self.conn.execute(
+            "SELECT key, attempts, error FROM items WHERE stage = ? AND status = 'failed' ORDER BY key", (stage,)
+        ).fetchall()
+
+    def outputs(self, stage):
+        for (value,) in self.conn.execute('SELECT value FROM outputs WHERE stage = ? ORDER BY rowid', (stage,)):
+            yield json.loads(value)
+
+    def close(self):
+        self.conn.close()
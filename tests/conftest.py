@@ -0,0 +1,20 @@
+# conftest.py
+#
+# The collectors are flat scripts in code/ that import each other by name.
+
+import os
+import sys
+import types
+
+code_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'code')
+sys.path.insert(0, code_dir)
+
+try:
+    import config  # noqa: F401
+except ImportError:
+    # config.py holds API keys and is not checked in; the tests make no API calls
+    config = types.ModuleType('config')
+    config.TMDB_API_KEY = config.OMDB_API_KEY = ''
+    config.CLIENT_ID = config.CLIENT_SECRET = ''
+    config.USER_AGENT = 'tests'
+    sys.modules['config'] = config
@@ -0,0 +1,94 @@
+import pytest
+
+import collect_tv_comments
+from benchmark import fake_reddit
+from fake_apis import FakeApis
+from rate_limiter import AdaptiveLimiter, TokenBucket
+
+
+@pytest.fixture
+def apis():
+    # 50 comments inline, then four MoreComments stubs of 50, 50, 50 and 20
+    fake = FakeApis(comments_per_submission=220, page_size=50, latency=0)
+    fake.start()
+    yield fake
+    fake.stop()
+
+
+@pytest.fixture
+def comments_csv(tmp_path):
+    return str(tmp_path / 'reddit_comments.csv')
+
+
+@pytest.fixture
+def store(comments_csv):
+    comment_store = collect_tv_comments.open_comment_store(comments_csv)
+    yield comment_store
+    comment_store.close()
+
+
+def request_tracker():
+    return {'count': 0, 'limiter': AdaptiveLimiter('test', TokenBucket(10 ** 6, 1, name='test'))}
+
+
+def crawl(apis, store, comments_csv, submission_id, budget):
+    tracker, stats = request_tracker(), {}
+    resume = store.unexpanded([submission_id]).get(submission_id)
+    comments = collect_tv_comments.iter_comments_for_submission(
+        fake_reddit(apis.base_url), submission_id, tracker, budget, stats=stats, resume=resume
+    )
+    collect_tv_comments.record_submission(store, comments_csv, submission_id, comments, stats=stats)
+    return tracker['count'], stats
+
+
+def test_budget_capped_thread_continues_where_the_last_crawl_stopped(apis, store, comments_csv):
+    calls, stats = crawl(apis, store, comments_csv, 'abc', budget=1)
+    assert calls == 2 and stats['truncated'] and len(stats['unexpanded']) == 3
+    assert store.count_comments() == 100
+    assert 'abc' not in store.completed_submissions()
+
+    # Each later run expands the saved stubs instead of starting from the first page
+    calls, stats = crawl(apis, store, comments_csv, 'abc', budget=2)
+    assert calls == 2 and len(stats['unexpanded']) == 1
+    assert store.count_comments() == 200
+
+    calls, stats = crawl(apis, store, comments_csv, 'abc', budget=2)
+    assert calls == 1 and not stats['truncated']
+    assert store.count_comments() == 220
+    assert store.completed_submissions() == {'abc': 220}
+    assert store.unexpanded(['abc']) == {}
+
+
+def test_thread_left_with_only_continue_stubs_stays_unmarked(store, comments_csv):
+    # "Continue this thread" stubs count 0 but still hide comments
+    stub = {'id': '_', 'parent_id': 't1_deep', 'count': 0, 'children': []}
+    stats = {'truncated': True, 'unexpanded': [stub], 'skipped': 0}
+    collect_tv_comments.record_submission(store, comments_csv, 'abc', [], stats=stats)
+    assert store.completed_submissions() == {}
+    assert store.unexpanded(['abc']) == {'abc': [stub]}
+
+
+def test_refresh_that_misses_new_comments_keeps_the_old_baseline(apis, store, comments_csv, monkeypatch):
+    apis.comments_per_submission = 120
+    comments = collect_tv_comments.iter_comments_for_submission(fake_reddit(apis.base_url), 'abc', request_tracker())
+    collect_tv_comments.record_submission(store, comments_csv, 'abc', comments, num_comments=120)
+
+    # 80 comments arrive, but the stand-in serves the oldest page first, so the
+    # newest-first refresh stops before reaching any of them
+    apis.comments_per_submission = 200
+    monkeypatch.setattr(collect_tv_comments, 'reddit_credentials', lambda: [{}])
+    monkeypatch.setattr(collect_tv_comments, 'reddit_client',
+                        lambda credential: (fake_reddit(apis.base_url), request_tracker()))
+    monkeypatch.setattr(collect_tv_comments, 'poll_submissions',
+                        lambda reddit, tracker, submission_ids: {'abc': (200, 0)})
+    assert collect_tv_comments.refresh_submissions(store, comments_csv, workers=1) == (0, 0)
+    assert store.submission_marks()['abc'][:2] == (120, 120)
+
+
+def test_refresh_advances_the_baseline_by_the_new_comments_seen(store, comments_csv):
+    collect_tv_comments.record_submission(store, comments_csv, 'abc', [], num_comments=200,
+                                          stats={'new_seen': 30}, baseline=120)
+    assert store.submission_marks()['abc'][1] == 150
+    collect_tv_comments.record_submission(store, comments_csv, 'abc', [], num_comments=200,
+                                          stats={'new_seen': 90}, baseline=150)
+    assert store.submission_marks()['abc'][1] == 200
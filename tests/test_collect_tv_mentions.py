@@ -0,0 +1,126 @@
+import types
+
+import prawcore
+import pytest
+
+import collect_tv_mentions
+import reddit_api
+from rate_limiter import AdaptiveLimiter, TokenBucket
+from show_matcher import ShowMatcher
+
+
+def post(post_id, title, selftext=''):
+    return {'id': post_id, 'title': title, 'selftext': selftext}
+
+
+class FakeListing:
+    """Stands in for PRAW's ListingGenerator over one page of search results."""
+
+    def __init__(self, reddit, params, count):
+        self.reddit = reddit
+        self.params = dict(params)
+        self.count = count
+
+    def __iter__(self):
+        self.reddit.calls += 1
+        # failures: what each call in turn raises; None lets that call through
+        failure = self.reddit.failures.pop(0) if self.reddit.failures else None
+        if failure is not None:
+            raise failure
+        start = int(self.params.get('after', 't3_0').split('_')[1])
+        stop = min(start + self.count, self.reddit.results)
+        if stop < self.reddit.results:
+            self.params['after'] = f't3_{stop}'
+        return iter([types.SimpleNamespace(**post(str(index), f'Post {index}'), created_utc=0,
+                                           subreddit=types.SimpleNamespace(display_name='tv'), author=None,
+                                           score=1, num_comments=0, url='')
+                     for index in range(start, stop)])
+
+
+class FakeReddit:
+    def __init__(self, results, failures=()):
+        self.results = results
+        self.failures = list(failures)
+        self.calls = 0
+        self.auth = types.SimpleNamespace(limits={})
+
+    def subreddit(self, name):
+        return types.SimpleNamespace(
+            search=lambda query, syntax, limit, params: FakeListing(self, params, limit)
+        )
+
+
+def client(reddit):
+    return reddit, {'count': 0, 'limiter': AdaptiveLimiter('test', TokenBucket(10 ** 6, 1, name='test'))}
+
+
+def too_many_requests():
+    return prawcore.exceptions.TooManyRequests(
+        types.SimpleNamespace(status_code=429, headers={'retry-after': '0'}, text='')
+    )
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(reddit_api, 'exponential_backoff', lambda retries: None)
+    monkeypatch.setattr(reddit_api, 'MAX_RETRIES', 3)
+
+
+def test_split_capped_batch_halves_full_batches_only():
+    names = ['A', 'B', 'C', 'D', 'E']
+    assert collect_tv_mentions.split_capped_batch(names, 999, limit=1000) == []
+    assert collect_tv_mentions.split_capped_batch(['A'], 1000, limit=1000) == []
+    assert collect_tv_mentions.split_capped_batch(names, 1000, limit=1000) == [
+        ('"A" OR "B"', ['A', 'B']), ('"C" OR "D" OR "E"', ['C', 'D', 'E'])
+    ]
+
+
+def test_tag_posts_falls_back_to_the_batch_names():
+    names = ['Evil', 'Tulsa King']
+    matcher = ShowMatcher.from_tv_show_list(names + ['Star Trek'])
+    tagged = collect_tv_mentions.tag_posts(matcher, [
+        post('1', 'Tulsa King and Star Trek tonight'),
+        post('2', 'EVIL IS BACK'),
+        post('3', 'Season 4 trailer', 'https://youtu.be/x'),
+    ], names)
+    assert [found for _, found in tagged] == [['Star Trek', 'Tulsa King'], ['Evil'], names]
+
+
+def test_iter_search_follows_pages_and_stops_at_the_limit():
+    reddit = FakeReddit(results=250)
+    assert len(list(collect_tv_mentions.iter_search(client(reddit), '"A"', ['tv']))) == 250
+    assert reddit.calls == 3
+
+    reddit = FakeReddit(results=250)
+    assert len(list(collect_tv_mentions.iter_search(client(reddit), '"A"', ['tv'], limit=150))) == 150
+    assert reddit.calls == 2
+
+
+def test_iter_search_retries_a_page_after_429():
+    reddit = FakeReddit(results=150, failures=[too_many_requests()])
+    posts = list(collect_tv_mentions.iter_search(client(reddit), '"A"', ['tv']))
+    assert [p['id'] for p in posts] == [str(index) for index in range(150)]
+    assert reddit.calls == 3
+
+
+def test_batch_failing_mid_pagination_adds_nothing():
+    # The first page comes back, the second runs out of retries
+    reddit = FakeReddit(results=150, failures=[None] + [RuntimeError('boom')] * 3)
+    rows = collect_tv_mentions.search_reddit_for_tv_shows(['A', 'B'], ['tv'], workers=1,
+                                                          client_factory=lambda: client(reddit))
+    assert rows == []
+
+
+def test_capped_batch_is_searched_again_in_halves(monkeypatch):
+    queries = []
+
+    def fake_iter_search(client, query, subreddit_list, limit):
+        queries.append(query)
+        count = limit if query.count(' OR ') else 3
+        return [post(f'{query}/{index}', query.replace('"', '')) for index in range(count)]
+
+    monkeypatch.setattr(collect_tv_mentions, 'iter_search', fake_iter_search)
+    rows = collect_tv_mentions.search_reddit_for_tv_shows(['Alpha', 'Beta'], ['tv'], limit=10, workers=1,
+                                                          client_factory=lambda: None)
+    assert queries == ['"Alpha" OR "Beta"', '"Alpha"', '"Beta"']
+    assert len(rows) == 10 * 2 + 3 + 3
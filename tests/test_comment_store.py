@@ -0,0 +1,69 @@
+import os
+
+import pytest
+
+import collect_tv_comments
+from comment_store import CommentStore
+
+
+def comment(comment_id, score=1, body='first'):
+    return {
+        'submission_id': 's1', 'comment_id': comment_id, 'parent_id': 't3_s1', 'body': body,
+        'author': 'someone', 'created_utc': 1.7e9, 'score': score, 'is_submitter': False,
+    }
+
+
+@pytest.fixture
+def comments_csv(tmp_path):
+    return str(tmp_path / 'reddit_comments.csv')
+
+
+@pytest.fixture
+def store(comments_csv):
+    comment_store = collect_tv_comments.open_comment_store(comments_csv)
+    yield comment_store
+    comment_store.close()
+
+
+def read_lines(path):
+    with open(path, encoding='utf-8') as f:
+        return f.read().splitlines()
+
+
+def test_updates_stay_in_the_store_until_exported(store, comments_csv):
+    assert collect_tv_comments.record_comment_batch(store, comments_csv, [comment('c1'), comment('c2')]) == (2, 0)
+    size = os.path.getsize(comments_csv)
+
+    # A score change is an upsert; the CSV is neither appended to nor rewritten
+    assert collect_tv_comments.record_comment_batch(store, comments_csv, [comment('c1', score=9)]) == (0, 1)
+    assert os.path.getsize(comments_csv) == size
+    assert store.updated_since_export() == 1
+
+    collect_tv_comments.export_if_requested(store, comments_csv, requested=False)
+    assert os.path.getsize(comments_csv) == size
+
+    collect_tv_comments.export_if_requested(store, comments_csv, requested=True)
+    assert store.updated_since_export() == 0
+    assert store.csv_offset() == os.path.getsize(comments_csv)
+    assert len(read_lines(comments_csv)) == 3
+    assert ',9,' in read_lines(comments_csv)[1]
+
+
+def test_export_is_skipped_when_nothing_changed(store, comments_csv):
+    collect_tv_comments.record_comment_batch(store, comments_csv, [comment('c1')])
+    collect_tv_comments.record_comment_batch(store, comments_csv, [comment('c1')])
+    mtime = os.stat(comments_csv).st_mtime_ns
+    collect_tv_comments.export_if_requested(store, comments_csv, requested=True)
+    assert os.stat(comments_csv).st_mtime_ns == mtime
+    assert store.updated_since_export() == 0
+
+
+def test_counter_survives_reopening(tmp_path):
+    db_path = str(tmp_path / 'comments.sqlite')
+    store = CommentStore(db_path)
+    store.commit_rows([collect_tv_comments.format_comment_row(comment('c1'))], 0, 1)
+    store.commit_rows([collect_tv_comments.format_comment_row(comment('c1', body='edited'))], 0, 0)
+    store.close()
+    store = CommentStore(db_path)
+    assert store.updated_since_export() == 1
+    store.close()
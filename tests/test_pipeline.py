@@ -0,0 +1,177 @@
+import os
+import threading
+
+import pytest
+
+import collect_tv_comments
+import collect_tv_shows
+import pipeline
+import storage
+from pipeline import POLL_INTERVAL, STAGES, Pipeline, downstream_of
+from rollups import ShowRollups
+from work_queue import WorkQueue
+
+# Ten shows make two search batches, of eight and two
+SHOWS = [f'Show {index}' for index in range(10)]
+
+# Set once the first comments item is handled; the second batch waits for it
+comments_handled = threading.Event()
+
+
+def post(name):
+    return {'id': name.replace(' ', '').lower(), 'title': f'Talking about {name}', 'selftext': '',
+            'created_utc': 1.7e9, 'subreddit': 'television', 'author': 'poster', 'score': 1,
+            'num_comments': 3, 'url': ''}
+
+
+def fake_collect_tv_shows(output_csv, incremental, storage_format):
+    storage.write_table([{'name': name, 'original_name': name} for name in SHOWS], output_csv,
+                        collect_tv_shows.TV_SHOW_DATASET, storage_format)
+
+
+def fake_search_batch(query):
+    names = [term.strip('"') for term in query.split(' OR ')]
+    if SHOWS[-1] in names:
+        # Comments for the first batch's hits are fetched while this one is still searching
+        comments_handled.wait(10)
+    return [post(name) for name in names]
+
+
+def flag_once(name):
+    # True the first time a flag is raised; the file outlives the worker process
+    path = os.path.join(os.environ['PIPELINE_TEST_FLAGS'], name)
+    if os.path.exists(path):
+        return False
+    open(path, 'w').close()
+    return True
+
+
+def fake_fetch_worker(task):
+    submission_id = task[0]
+    if submission_id == 'show3' and flag_once('crashed'):
+        os._exit(1)
+    if submission_id == 'show1' and flag_once('failed'):
+        return submission_id, None, {}, {'counters': [], 'histograms': []}
+    comments = [{'submission_id': submission_id, 'comment_id': f'{submission_id}c{index}',
+                 'parent_id': f't3_{submission_id}', 'body': 'great show', 'author': 'viewer',
+                 'created_utc': 1.7e9 + index, 'score': index, 'is_submitter': False} for index in range(3)]
+    return submission_id, comments, {}, {'counters': [], 'histograms': []}
+
+
+def fake_init_worker(credential_queue, budget):
+    pass
+
+
+def fake_run_sentiment(workers):
+    return 0, 0, {}
+
+
+class RecordingPipeline(Pipeline):
+    """Logs what the scheduler submits, handles and finishes, in order."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.events = []
+
+    def submit(self, name, key, payload):
+        self.events.append(('submit', name, key))
+        return super().submit(name, key, payload)
+
+    def handle(self, name, key, payload, result):
+        super().handle(name, key, payload, result)
+        self.events.append(('handle', name, key))
+        if name == 'comments':
+            comments_handled.set()
+
+    def finish(self, name):
+        self.events.append(('finish', name, self.queue.open_count(name)))
+        super().finish(name)
+
+
+@pytest.fixture
+def work_queue(tmp_path, monkeypatch):
+    raw_dir = tmp_path / 'raw'
+    monkeypatch.setattr(pipeline, 'TV_SHOW_CSV', str(raw_dir / 'tv_shows.csv'))
+    monkeypatch.setattr(pipeline, 'MENTIONS_CSV', str(raw_dir / 'mentions.csv'))
+    monkeypatch.setattr(pipeline, 'COMMENTS_CSV', str(raw_dir / 'comments.csv'))
+    monkeypatch.setattr(pipeline, 'ShowRollups', lambda: ShowRollups(str(tmp_path / 'rollups.sqlite')))
+    monkeypatch.setattr(pipeline, 'search_batch', fake_search_batch)
+    monkeypatch.setattr(pipeline, 'run_sentiment', fake_run_sentiment)
+    monkeypatch.setattr(collect_tv_shows, 'collect_tv_shows', fake_collect_tv_shows)
+    monkeypatch.setattr(collect_tv_comments, 'fetch_worker', fake_fetch_worker)
+    monkeypatch.setattr(collect_tv_comments, 'init_worker', fake_init_worker)
+    monkeypatch.setenv('PIPELINE_TEST_FLAGS', str(tmp_path))
+    os.makedirs(raw_dir)
+    comments_handled.clear()
+    queue = WorkQueue(str(tmp_path / 'queue.sqlite'), base_delay=0.05, max_delay=0.1)
+    yield queue
+    queue.close()
+
+
+@pytest.fixture
+def run(work_queue):
+    runner = RecordingPipeline(work_queue, 2, None, 'csv')
+    try:
+        runner.run()
+    finally:
+        runner.close()
+    return runner
+
+
+def test_downstream_of_follows_the_dag():
+    assert downstream_of(['tv_shows']) == list(STAGES)
+    assert downstream_of(['mentions']) == ['mentions', 'comments', 'sentiment']
+    assert downstream_of(['comments']) == ['comments', 'sentiment']
+    assert downstream_of(['sentiment']) == ['sentiment']
+    assert downstream_of([]) == []
+
+
+def test_downstream_of_returns_dag_order():
+    assert downstream_of(['sentiment', 'mentions']) == ['mentions', 'comments', 'sentiment']
+    assert downstream_of(['comments', 'comments']) == ['comments', 'sentiment']
+
+
+def test_comments_stream_while_mentions_are_searched(run):
+    handled = [(name, key) for event, name, key in run.events if event == 'handle']
+    first_comments = handled.index(next(item for item in handled if item[0] == 'comments'))
+    last_mentions = max(index for index, item in enumerate(handled) if item[0] == 'mentions')
+    assert first_comments < last_mentions
+
+
+def test_stages_finish_in_dag_order_once_their_items_are_done(run):
+    finished = [(name, open_items) for event, name, open_items in run.events if event == 'finish']
+    assert finished == [(name, 0) for name in STAGES]
+    # Sentiment is only seeded once every comment is in
+    assert run.events.index(('submit', 'sentiment', 'all')) > run.events.index(('finish', 'comments', 0))
+    assert os.path.exists(pipeline.MENTIONS_CSV)
+
+
+def test_failed_and_crashed_fetches_are_retried(run, work_queue, tmp_path):
+    # show3 killed its worker and broke the pool; show1 came back empty once
+    assert (tmp_path / 'crashed').exists() and (tmp_path / 'failed').exists()
+    assert work_queue.counts()['comments'] == {'done': len(SHOWS)}
+    assert run.events.count(('handle', 'comments', 'show1')) == 1
+    store = collect_tv_comments.open_comment_store(pipeline.COMMENTS_CSV)
+    try:
+        assert store.count_comments() == 3 * len(SHOWS)
+        assert len(store.completed_submissions()) == len(SHOWS)
+    finally:
+        store.close()
+
+
+def test_wait_time_blocks_on_running_items(work_queue):
+    runner = Pipeline(work_queue, 2, None, 'csv')
+    try:
+        # Nothing running and nothing backed off: check again after the poll interval
+        assert runner.wait_time() == POLL_INTERVAL
+        # Running items end the wait when they finish, so there is no timeout
+        runner.in_flight[object()] = ('comments', 'show0', {})
+        assert runner.wait_time() is None
+
+        # A backed-off item bounds the wait to when it becomes ready
+        work_queue.seed('comments', [('show1', {})])
+        work_queue.claim('comments', 1)
+        delay = work_queue.fail('comments', 'show1', RuntimeError('429'))
+        assert 0.1 <= runner.wait_time() <= max(delay, 0.1)
+    finally:
+        runner.close()
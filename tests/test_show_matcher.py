@@ -0,0 +1,35 @@
+import pytest
+
+from show_matcher import ShowMatcher
+
+
+@pytest.fixture
+def matcher():
+    return ShowMatcher.from_tv_show_list(['Ghosts', 'Evil', 'Tracker', 'Survivor', 'You', 'The Office',
+                                          'Mayor of Kingstown', 'Star Trek: Discovery'])
+
+
+@pytest.mark.parametrize('text, shows', [
+    ('Ghosts season 3 is out', ['Ghosts']),
+    ('Tracker is great', ['Tracker']),
+    ('SURVIVOR 47 finale tonight', ['Survivor']),
+    ('Mayor of Kingstown and Star Trek Discovery', ['Mayor of Kingstown', 'Star Trek: Discovery']),
+])
+def test_catalog_titles_match_anywhere(matcher, text, shows):
+    assert matcher.find(text) == shows
+
+
+@pytest.mark.parametrize('text, shows', [
+    ('thank you so much', []),
+    ('that is pure evil', []),
+    ('You are evil', []),
+    ('back at the office', []),
+    ('I just started Evil and The Office', ['Evil', 'The Office']),
+    ('Just watched "evil" last night', ['Evil']),
+    ('Evil season 4 trailer', ['Evil']),
+    ('EVIL S04E02 discussion', ['Evil']),
+    ('You season 5 is the last', ['You']),
+    ('evil season of politics', []),
+])
+def test_common_word_titles_need_title_case_quotes_or_a_tv_cue(matcher, text, shows):
+    assert matcher.find(text) == shows
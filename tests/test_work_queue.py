@@ -0,0 +1,125 @@
+import time
+
+import pytest
+
+from work_queue import WorkQueue
+
+
+@pytest.fixture
+def queue(tmp_path):
+    work_queue = WorkQueue(str(tmp_path / 'queue.sqlite'), max_attempts=3, base_delay=10, max_delay=15)
+    yield work_queue
+    work_queue.close()
+
+
+def test_seed_is_idempotent(queue):
+    queue.seed('mentions', [('a', {'query': 'a'}), ('b', {'query': 'b'})])
+    [(key, payload, attempts)] = queue.claim('mentions', 1)
+    queue.complete('mentions', key)
+
+    # Re-seeding after a crash neither duplicates items nor redoes finished ones
+    queue.seed('mentions', [('a', {'query': 'a'}), ('b', {'query': 'b'})])
+    assert queue.is_seeded('mentions')
+    assert queue.counts() == {'mentions': {'done': 1, 'pending': 1}}
+    assert [key for key, _, _ in queue.claim('mentions', 5)] == ['b']
+
+
+def test_claim_marks_items_running(queue):
+    queue.seed('comments', [('s1', {}), ('s2', {}), ('s3', {})])
+    assert [key for key, _, _ in queue.claim('comments', 2)] == ['s1', 's2']
+    assert [key for key, _, _ in queue.claim('comments', 2)] == ['s3']
+    assert queue.claim('comments', 2) == []
+    assert queue.claim('comments', 0) == []
+    assert queue.open_count('comments') == 3
+
+
+def test_fail_backs_off_then_gives_up(queue):
+    queue.seed('comments', [('s1', {})])
+    queue.claim('comments', 1)
+
+    before = time.time()
+    delay = queue.fail('comments', 's1', RuntimeError('429'))
+    assert 5 <= delay <= 10
+    # Backed off: not claimable yet, and it bounds the scheduler's wait
+    assert queue.claim('comments', 1) == []
+    assert queue.next_ready_at(after=before) == pytest.approx(before + delay, abs=1)
+    assert queue.counts() == {'comments': {'pending': 1}}
+
+    # The delay doubles per attempt and is capped at max_delay
+    assert 7.5 <= queue.fail('comments', 's1', RuntimeError('429')) <= 15
+    assert queue.fail('comments', 's1', RuntimeError('still 429')) is None
+    assert queue.counts() == {'comments': {'failed': 1}}
+    assert queue.failures('comments') == [('s1', 3, 'still 429')]
+    assert queue.open_count('comments') == 0
+    assert queue.next_ready_at() is None
+
+
+def test_next_ready_at_ignores_items_ready_now(queue):
+    queue.seed('comments', [('s1', {})])
+    assert queue.next_ready_at() is None
+    assert queue.next_ready_at(after=time.time()) is None
+
+
+def test_recover_requeues_running_items(queue):
+    queue.seed('comments', [('s1', {}), ('s2', {})])
+    queue.claim('comments', 2)
+    queue.complete('comments', 's1')
+
+    # A process that died left s2 running
+    assert queue.recover() == 1
+    assert queue.counts() == {'comments': {'done': 1, 'pending': 1}}
+    assert [key for key, _, _ in queue.claim('comments', 2)] == ['s2']
+    assert queue.recover() == 1
+    assert queue.recover() == 0
+
+
+def test_retry_failed_gives_fresh_attempts(queue):
+    queue.seed('mentions', [('a', {})])
+    queue.seed('comments', [('s1', {}), ('s2', {})])
+    queue.claim('comments', 2)
+    queue.complete('comments', 's2')
+    for _ in range(3):
+        queue.fail('comments', 's1', RuntimeError('boom'))
+    assert queue.counts()['comments'] == {'done': 1, 'failed': 1}
+
+    assert queue.retry_failed() == ['comments']
+    assert [(key, attempts) for key, _, attempts in queue.claim('comments', 5)] == [('s1', 0)]
+    assert queue.retry_failed() == []
+
+
+def test_reopen_marks_stages_unfinished_and_resets_items(queue):
+    queue.seed('comments', [('s1', {})])
+    queue.seed('sentiment', [('all', {})])
+    for name, key in (('comments', 's1'), ('sentiment', 'all')):
+        queue.claim(name, 1)
+        queue.complete(name, key)
+        queue.finish_stage(name)
+
+    queue.reopen(['comments', 'sentiment'], reset_items=['sentiment'])
+    assert not queue.is_done('comments')
+    assert not queue.is_done('sentiment')
+    # Only the reset stage's items run again
+    assert queue.claim('comments', 1) == []
+    assert [key for key, _, _ in queue.claim('sentiment', 1)] == ['all']
+
+
+def test_complete_saves_outputs_and_enqueues_follow_ups(queue):
+    queue.seed('mentions', [('a', {}), ('b', {})])
+    queue.claim('mentions', 2)
+    queue.complete('mentions', 'a', outputs=[('p1/Show', {'id': 'p1'})], follow_ups=[('comments', 'p1', {})])
+    queue.claim('comments', 1)
+    queue.complete('comments', 'p1')
+    # A follow-up that already ran is not queued again
+    queue.complete('mentions', 'b', outputs=[('p1/Other', {'id': 'p1'})], follow_ups=[('comments', 'p1', {})])
+
+    assert list(queue.outputs('mentions')) == [{'id': 'p1'}, {'id': 'p1'}]
+    assert queue.counts() == {'mentions': {'done': 2}, 'comments': {'done': 1}}
+
+
+def test_reset_forgets_everything(queue):
+    queue.seed('tv_shows', [('catalog', {})])
+    queue.finish_stage('tv_shows')
+    queue.reset()
+    assert not queue.is_seeded('tv_shows')
+    assert not queue.is_done('tv_shows')
+    assert queue.counts() == {}